@@ -1,31 +1,39 @@
 import streamlit as st
-import subprocess
-import openai
-import os
-import pyperclip
+import sys
 from datetime import datetime
+from pathlib import Path
 import re
-import json
+
+# The app folder is not a package; make the repo-level helpers importable
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from shared.code_analysis import analyze_code
+from shared.llm_backends import LLMError, as_messages, stream
+from shared.session_store import get_session_store
+from shared.streamlit_helpers import (
+    render_cache_stats, render_metrics, render_queue_status, render_session_picker, render_stream,
+    use_session_client
+)
 
 # === CONFIGURATION ===
 st.set_page_config(page_title="🧠 Mini Copilot", layout="centered")
+# Fair queuing between users of a shared Ollama; interactive requests go first
+use_session_client()
 
 st.title("💻 Your Mini AI Code Copilot")
 st.markdown("Type code and let your selected model autocomplete it ✨")
 
 # --- Session Load/Save ---
-saved_sessions_path = "saved_sessions"
-os.makedirs(saved_sessions_path, exist_ok=True)
-
-load_session = st.sidebar.selectbox("📂 Load previous session:", ["None"] + os.listdir(saved_sessions_path))
-if load_session != "None":
-    with open(os.path.join(saved_sessions_path, load_session), "r", encoding="utf-8") as f:
-        saved_data = json.load(f)
-        st.session_state["completion"] = saved_data["completion"]
-        user_code = saved_data["user_code"]
-        st.session_state["language"] = saved_data.get("language", "python")
-        st.session_state["model_mode"] = saved_data.get("model_mode", "Ollama (local)")
-        st.session_state["ollama_model"] = saved_data.get("ollama_model", "codellama")
+# Indexed SQLite store in saved_sessions/; older per-session JSON files there are imported once
+sessions = get_session_store("saved_sessions", text_fields=("user_code", "completion"))
+
+load_session = render_session_picker(st.sidebar, sessions)
+saved_data = sessions.load(load_session) if load_session is not None else None
+if saved_data:
+    st.session_state["completion"] = saved_data["completion"]
+    user_code = saved_data["user_code"]
+    st.session_state["language"] = saved_data.get("language", "python")
+    st.session_state["model_mode"] = saved_data.get("model_mode", "Ollama (local)")
+    st.session_state["ollama_model"] = saved_data.get("ollama_model", "codellama")
 else:
     user_code = ""
 
@@ -39,66 +47,66 @@ if model_mode == "Ollama (local)":
 temperature = st.slider("Model creativity (temperature):", 0.0, 1.0, 0.3, 0.1)
 language = st.selectbox("Code language:", ["python", "javascript", "java", "sql"])
 
-def get_ollama_completion(prompt, model="codellama"):
-    try:
-        full_prompt = f"""Complete the following {language} code:
+backend = "openai" if model_mode == "OpenAI GPT-4" else "ollama"
+model = ollama_model or "gpt-4"
+
+def completion_messages(prompt):
+    if backend == "openai":
+        return [
+            {"role": "system", "content": f"You are an expert {language} developer that autocompletes code."},
+            {"role": "user", "content": f"Complete this code:\n{prompt}"}
+        ]
+    return as_messages(f"""Complete the following {language} code:
 
 {prompt}
 
 ### Completion:
-"""
-        result = subprocess.run(
-            ["ollama", "run", model],
-            input=full_prompt.encode(),
-            capture_output=True,
-            timeout=180
-        )
-        output = result.stdout.decode().strip()
-        if not output:
-            output = result.stderr.decode().strip()
-        return output or "[No output returned by model]"
-    except subprocess.TimeoutExpired:
-        return "[Error: Ollama model timed out. Try again or use a shorter prompt.]"
-    except Exception as e:
-        return f"[Error running Ollama model: {e}]"
-
-def get_openai_completion(prompt):
+""")
+
+def stream_completion(prompt):
+    # Tokens are yielded as they arrive, from either backend; failures raise LLMError
+    produced = False
+    for token in stream(backend, completion_messages(prompt), model, temperature):
+        produced = True
+        yield token
+    if not produced:
+        yield "[No output returned by model]"
+
+def show_completion(prompt, placeholder):
+    """Stream a completion into ``placeholder``; returns the text, or None after showing the error."""
     try:
-        openai.api_key = os.getenv("OPENAI_API_KEY")
-        if not openai.api_key:
-            return "[OPENAI_API_KEY not set in environment variables.]"
-
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": f"You are an expert {language} developer that autocompletes code."},
-                {"role": "user", "content": f"Complete this code:\n{prompt}"}
-            ],
-            temperature=temperature
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        return f"[Error calling OpenAI API: {e}]"
-
-def generate_autotest(code_snippet):
+        return render_stream(stream_completion(prompt), placeholder, language=language)
+    except LLMError as e:
+        placeholder.error(f"⚠️ The model request failed – {e}")
+        return None
+
+def generate_autotest(code_snippet, placeholder):
     test_prompt = f"""Write unit tests for the following {language} function:
 
 {code_snippet}
 
 Include only the test code."""
-    if model_mode == "OpenAI GPT-4":
-        return get_openai_completion(test_prompt)
-    elif model_mode == "Ollama (local)" and ollama_model:
-        return get_ollama_completion(test_prompt, model=ollama_model)
-    else:
-        return "[Cannot generate test: No valid model selected]"
+    return show_completion(test_prompt, placeholder)
 
-def check_code_style(code_snippet):
+def line_style_issues(code_snippet):
+    # Line-based checks: work on any language and on code that does not parse yet
     issues = []
     if ";" in code_snippet and language == "python":
         issues.append("Avoid using semicolons in Python code.")
     if len(code_snippet.splitlines()) > 20:
         issues.append("Consider breaking the function into smaller parts for readability.")
+    return issues
+
+def check_code_style(code_snippet):
+    if language != "python":
+        # The ast engine only understands Python
+        return line_style_issues(code_snippet) or ["No major style issues detected."]
+
+    report = analyze_code(code_snippet, thresholds={"function_length": 20})
+    if report["syntax_error"]:
+        # Usual while still typing: keep the line-based feedback
+        return [f"Code does not parse yet: {report['syntax_error']}"] + line_style_issues(code_snippet)
+    issues = [f"Line {smell['line']}: {smell['message']}" for smell in report["smells"]]
     return issues or ["No major style issues detected."]
 
 # --- Input Code Area ---
@@ -107,12 +115,12 @@ user_code = st.text_area("✍️ Start writing your code:", value=user_code, hei
 # --- Button to Autocomplete ---
 if st.button("🚀 Autocomplete Code") and user_code.strip():
     with st.spinner("Thinking..."):
-        if model_mode == "Ollama (local)" and ollama_model:
-            st.session_state["completion"] = get_ollama_completion(user_code, model=ollama_model)
-        elif model_mode == "OpenAI GPT-4":
-            st.session_state["completion"] = get_openai_completion(user_code)
-        else:
-            st.session_state["completion"] = "[Unsupported model mode or model not selected]"
+        # Stream tokens into a temporary box; the completion section below shows the final result
+        live = st.empty()
+        completion = show_completion(user_code, live)
+        if completion is not None:
+            st.session_state["completion"] = completion
+            live.empty()
 
 # --- Display Completion (if exists) ---
 if "completion" in st.session_state:
@@ -123,6 +131,7 @@ if "completion" in st.session_state:
     # --- Clipboard Copy ---
     if st.button("📋 Copy to clipboard"):
         try:
+            import pyperclip
             pyperclip.copy(response)
             st.success("Copied to clipboard!")
         except Exception:
@@ -138,7 +147,6 @@ if "completion" in st.session_state:
 
     # --- Save Full Session ---
     if st.button("📥 Save Full Session"):
-        session_filename = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
         session_data = {
             "user_code": user_code,
             "completion": response,
@@ -146,16 +154,14 @@ if "completion" in st.session_state:
             "model_mode": model_mode,
             "ollama_model": ollama_model
         }
-        with open(os.path.join(saved_sessions_path, session_filename), "w", encoding="utf-8") as f:
-            json.dump(session_data, f, indent=2)
-        st.success(f"Session saved as {session_filename}")
+        session_name = sessions.save(session_data)
+        st.success(f"Session saved as {session_name}")
 
     # --- Autotest Generator ---
     if st.button("🧪 Generate Unit Tests"):
         with st.spinner("Generating tests..."):
-            tests = generate_autotest(user_code)
             st.subheader("🧪 Suggested Unit Tests:")
-            st.code(tests, language=language)
+            generate_autotest(user_code, st.empty())
 
     # --- Code Style Checker ---
     if st.button("🧱 Check Code Style"):
@@ -172,5 +178,11 @@ st.markdown("- 📋 Clipboard copy button for suggestions")
 st.markdown("- 🧠 Multiple language support (Python, JS, Java, SQL)")
 st.markdown("- 🧪 Autotest generator from input code")
 st.markdown("- 🧱 Code style feedback tool")
-st.markdown("- 📊 Token usage (OpenAI) – Coming Soon")
-st.markdown("- 📂 Load/save previous sessions with code + response")
+st.markdown("- 📊 Token usage, time to first token and tokens/sec per model (sidebar)")
+st.markdown("- 📂 Load/save previous sessions with code + response, with full-text search")
+st.markdown("- 🗃️ Shared LLM response cache (identical temperature-0 requests are answered instantly)")
+
+# --- Cache stats and timings (rendered last so they include this run) ---
+render_queue_status(st.sidebar)
+render_cache_stats(st.sidebar)
+render_metrics(st.sidebar)
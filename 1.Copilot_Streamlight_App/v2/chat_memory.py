@@ -0,0 +1,175 @@
+"""Bounded chat memory for the Chat Assistant tab.
+
+Instead of re-sending the whole history every turn, a prompt is built from:
+
+- the most recent turns that fit in a sliding token window;
+- a rolling summary of everything that slid out of the window, refreshed
+  in batches so the summarization cost is amortized over several turns;
+- for long sessions, the few older exchanges most similar to the new
+  question, found by embedding (shared MiniLM embedder).
+
+Each part has a fixed token budget, so the prompt stays roughly the same
+size however long the conversation gets. The full history is still kept
+for display.
+"""
+import math
+import os
+
+from shared.llm_backends import LLMError
+
+# Recent conversation sent verbatim
+WINDOW_TOKENS = int(os.getenv("CHAT_WINDOW_TOKENS", "1500"))
+# Upper bound for the rolling summary of older turns
+SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "300"))
+# Evicted text collected before the summary is refreshed (one LLM call per batch)
+SUMMARY_BATCH_TOKENS = int(os.getenv("CHAT_SUMMARY_BATCH_TOKENS", "600"))
+# Older exchanges recalled by similarity to the new question
+RECALL_TURNS = int(os.getenv("CHAT_RECALL_TURNS", "2"))
+RECALL_MIN_SIMILARITY = 0.35
+RECALL_TOKENS = 600
+
+SUMMARY_PROMPT = """You maintain a compact memory of a conversation between a developer and a coding assistant.
+Update the summary with the new exchanges. Keep decisions, requirements, names of files,
+functions and variables, and open questions; drop small talk. At most {words} words.
+
+Current summary:
+{summary}
+
+New exchanges:
+{exchanges}
+
+Updated summary:"""
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English and code on Llama-style vocabularies
+    return max(1, len(text) // 4) if text else 0
+
+
+def _format(messages):
+    names = {"user": "User", "assistant": "AI"}
+    return "\n".join(f"{names.get(m['role'], m['role'].capitalize())}: {m['content']}" for m in messages)
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ChatMemory:
+    """Keeps ``history`` (every message) plus the summary and embeddings of evicted exchanges."""
+
+    def __init__(self, history=None, window_tokens=WINDOW_TOKENS):
+        self.history = history if history is not None else []
+        self.window_tokens = window_tokens
+        self.summary = ""
+        # history[:summarized] is folded into the summary, history[summarized:evicted] waits for the next batch
+        self.summarized = 0
+        self.evicted = 0
+        # (user message, assistant message, vector) for exchanges outside the window
+        self.archive = []
+        self.last_stats = {}
+
+    # --- window ---
+    def _window_start(self):
+        """Index of the first message that still fits in the window (whole exchanges only)."""
+        start, used = len(self.history), 0
+        while start >= 2:
+            cost = sum(estimate_tokens(m["content"]) for m in self.history[start - 2:start])
+            if used + cost > self.window_tokens:
+                break
+            used += cost
+            start -= 2
+        # Never drop the latest exchange, even when it alone is larger than the window
+        return max(0, min(start, len(self.history) - 2))
+
+    # --- prompt ---
+    def build_messages(self, question, embed_query=None):
+        """Messages to send for ``question``: summary, recent window, recalled turns, question.
+
+        Everything that changes from turn to turn comes last, so consecutive
+        prompts share a long prefix that Ollama can reuse from its KV cache.
+        """
+        start = self._window_start()
+        # Turns that left the window but are not in the summary yet stay verbatim (bounded by the batch size)
+        pending = self.history[self.summarized:start]
+        if sum(estimate_tokens(m["content"]) for m in pending) <= 2 * SUMMARY_BATCH_TOKENS:
+            start = min(start, self.summarized)
+        recent = self.history[start:]
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"})
+
+        messages.extend(recent)
+
+        recalled = self._recall(question, embed_query) if embed_query else []
+        if recalled:
+            messages.append({"role": "system", "content": "Relevant earlier exchanges:\n" + "\n\n".join(recalled)})
+        messages.append({"role": "user", "content": question})
+        self.last_stats = {
+            "messages": len(self.history),
+            "window_messages": len(recent),
+            "recalled": len(recalled),
+            "summary_tokens": estimate_tokens(self.summary),
+            "prompt_tokens": sum(estimate_tokens(m["content"]) for m in messages),
+        }
+        return messages
+
+    def _recall(self, question, embed_query):
+        if not self.archive or RECALL_TURNS <= 0:
+            return []
+        query = embed_query(question)
+        ranked = sorted(((_cosine(query, vector), user, reply) for user, reply, vector in self.archive),
+                        key=lambda item: item[0], reverse=True)
+        recalled, used = [], 0
+        for score, user, reply in ranked[:RECALL_TURNS]:
+            text = _format([user, reply])
+            if score < RECALL_MIN_SIMILARITY or used + estimate_tokens(text) > RECALL_TOKENS:
+                break
+            recalled.append(text)
+            used += estimate_tokens(text)
+        return recalled
+
+    # --- updates ---
+    def add_exchange(self, question, reply, summarize=None, embed_documents=None):
+        """Record a finished exchange, then fold turns that left the window into memory.
+
+        ``summarize(prompt) -> str`` refreshes the rolling summary (an
+        ``LLMError`` keeps the old one until the next batch);
+        ``embed_documents(texts) -> vectors`` makes evicted turns searchable
+        and is only called once turns actually leave the window.
+        Either may be None to skip that part.
+        """
+        self.history.extend([
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": reply},
+        ])
+        start = self._window_start()
+        if start <= self.evicted:
+            return
+
+        newly_evicted = self.history[self.evicted:start]
+        self.evicted = start
+        if embed_documents:
+            pairs = [newly_evicted[i:i + 2] for i in range(0, len(newly_evicted) - 1, 2)]
+            vectors = embed_documents([_format(pair) for pair in pairs])
+            self.archive.extend((pair[0], pair[1], vector) for pair, vector in zip(pairs, vectors))
+
+        pending = self.history[self.summarized:self.evicted]
+        if summarize and sum(estimate_tokens(m["content"]) for m in pending) >= SUMMARY_BATCH_TOKENS:
+            prompt = SUMMARY_PROMPT.format(words=SUMMARY_TOKENS * 3 // 4, summary=self.summary or "(empty)",
+                                           exchanges=_format(pending))
+            try:
+                summary = summarize(prompt).strip()
+            except LLMError:
+                # Keep the old summary; the pending turns are retried with the next batch
+                return
+            if summary:
+                self.summary = summary[:SUMMARY_TOKENS * 4]
+                self.summarized = self.evicted
+
+    def clear(self):
+        self.history.clear()
+        self.__init__(self.history, self.window_tokens)
+
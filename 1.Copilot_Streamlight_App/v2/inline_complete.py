@@ -0,0 +1,146 @@
+"""Inline (as-you-type) code completion for the Code Completion tab.
+
+A suggestion is requested when the user pauses typing, from a bounded
+window around the cursor instead of the whole buffer:
+
+- the prefix (up to ``INLINE_PREFIX_CHARS`` before the cursor) and suffix
+  (up to ``INLINE_SUFFIX_CHARS`` after it), cut at line boundaries;
+- local code models that were trained for fill-in-the-middle (codegemma,
+  deepseek-coder, codellama) get their FIM template as a raw prompt, so the
+  suggestion fits between prefix and suffix; other models get a short chat
+  prompt with a cursor marker;
+- generation is capped at ``INLINE_MAX_TOKENS`` and stops at a blank line,
+  which keeps a suggestion short and the latency low.
+
+``SuggestionCache`` remembers recent suggestions: if the user types the
+beginning of one, the rest is shown again without a model call.
+
+Stale requests are cancelled rather than awaited: a keystroke reruns the
+Streamlit script, which stops the running one, and closing the token
+iterator cancels the request in ``shared/llm_backends.py``.
+"""
+import os
+from collections import deque
+
+PREFIX_CHARS = int(os.getenv("INLINE_PREFIX_CHARS", "1500"))
+SUFFIX_CHARS = int(os.getenv("INLINE_SUFFIX_CHARS", "500"))
+MAX_TOKENS = int(os.getenv("INLINE_MAX_TOKENS", "48"))
+# Pause after the last keystroke before a suggestion is requested
+DEBOUNCE_MS = int(os.getenv("INLINE_DEBOUNCE_MS", "300"))
+CACHE_ITEMS = 64
+
+# Fill-in-the-middle prompt format and end-of-fill tokens, by model family
+FIM_TEMPLATES = {
+    "codegemma": ("<|fim_prefix|>{prefix}<|fim_suffix|>{suffix}<|fim_middle|>",
+                  ["<|file_separator|>", "<|fim_prefix|>", "<|fim_suffix|>", "<|fim_middle|>"]),
+    "deepseek-coder": ("<｜fim▁begin｜>{prefix}<｜fim▁hole｜>{suffix}<｜fim▁end｜>",
+                       ["<｜fim▁begin｜>", "<｜fim▁hole｜>", "<｜fim▁end｜>", "<|EOT|>"]),
+    "codellama": ("<PRE> {prefix} <SUF>{suffix} <MID>", ["<EOT>", "<PRE>", "<SUF>", "<MID>"]),
+}
+
+CHAT_PROMPT = """Complete the {language} code at <CURSOR>. Reply with only the code to insert there,
+no explanations and no code fences. Keep it short: finish the current line or block.
+
+{prefix}<CURSOR>{suffix}"""
+
+
+def cursor_position(previous, current):
+    """Best guess of the cursor in ``current``: the end of what changed since ``previous``.
+
+    The editor widgets do not report the cursor, but a rerun happens after
+    every edit, so the edit is where the two buffers stop agreeing.
+    """
+    start = 0
+    limit = min(len(previous), len(current))
+    while start < limit and previous[start] == current[start]:
+        start += 1
+    end = 0
+    while end < limit - start and previous[-1 - end] == current[-1 - end]:
+        end += 1
+    return len(current) - end
+
+
+def window(text, cursor):
+    """``(prefix, suffix)`` around ``cursor``, bounded and cut at line boundaries."""
+    prefix, suffix = text[:cursor], text[cursor:]
+    if len(prefix) > PREFIX_CHARS:
+        prefix = prefix[-PREFIX_CHARS:]
+        prefix = prefix[prefix.find("\n") + 1:]
+    if len(suffix) > SUFFIX_CHARS:
+        suffix = suffix[:SUFFIX_CHARS]
+        suffix = suffix[:suffix.rfind("\n") + 1]
+    return prefix, suffix
+
+
+def fim_template(backend, model):
+    """The model's fill-in-the-middle template and stop tokens, or None."""
+    if backend != "ollama" or not model:
+        return None
+    family = model.split(":")[0]
+    return next((template for name, template in FIM_TEMPLATES.items() if family.startswith(name)), None)
+
+
+def build_request(backend, model, language, prefix, suffix):
+    """``(prompt, options)`` for ``shared.llm_backends.stream``: a raw FIM prompt or chat messages."""
+    options = {"num_predict": MAX_TOKENS}
+    fim = fim_template(backend, model)
+    if fim:
+        template, stop = fim
+        return template.format(prefix=prefix, suffix=suffix), {**options, "stop": stop + ["\n\n"]}
+    prompt = CHAT_PROMPT.format(language=language, prefix=prefix, suffix=suffix)
+    if backend == "openai":
+        return [{"role": "user", "content": prompt}], {"max_tokens": MAX_TOKENS}
+    return [{"role": "user", "content": prompt}], {**options, "stop": ["\n\n"]}
+
+
+def clean_suggestion(text):
+    """Drop code fences and a trailing blank line that chat models add around the code."""
+    lines = text.split("\n")
+    if lines and lines[0].lstrip().startswith("```"):
+        lines = lines[1:]
+    if lines and lines[-1].strip().startswith("```"):
+        lines = lines[:-1]
+    return "\n".join(lines).rstrip()
+
+
+class SuggestionCache:
+    """Recent ``(prefix, suffix, suggestion)`` triples, matched as the user types into a suggestion."""
+
+    def __init__(self, items=CACHE_ITEMS):
+        self.entries = deque(maxlen=items)
+        self.hits = 0
+
+    def lookup(self, prefix, suffix):
+        """The rest of an earlier suggestion the user has been typing out, or None."""
+        for old_prefix, old_suffix, suggestion in reversed(self.entries):
+            if old_suffix != suffix or not prefix.startswith(old_prefix):
+                continue
+            typed = prefix[len(old_prefix):]
+            if suggestion.startswith(typed) and len(typed) < len(suggestion):
+                self.hits += 1
+                return suggestion[len(typed):]
+        return None
+
+    def add(self, prefix, suffix, suggestion):
+        if suggestion:
+            self.entries.append((prefix, suffix, suggestion))
+
+
+def suggest(text, cursor, backend, model, language, cache, stream, stats=None):
+    """Token iterator of the suggestion at ``cursor``; ``stream`` is ``shared.llm_backends.stream``.
+
+    Served from ``cache`` when the user typed the beginning of an earlier
+    suggestion. A suggestion that streams to the end is added to ``cache``.
+    """
+    prefix, suffix = window(text, cursor)
+    cached = cache.lookup(prefix, suffix)
+    if cached is not None:
+        yield cached
+        return
+    prompt, options = build_request(backend, model, language, prefix, suffix)
+    tokens = []
+    # Deterministic, so the response cache answers exact repeats (e.g. undo) as well
+    for token in stream(backend, prompt, model, 0.0, options=options, stats=stats):
+        tokens.append(token)
+        yield token
+    cache.add(prefix, suffix, clean_suggestion("".join(tokens)))
@@ -1,13 +1,29 @@
 import streamlit as st
-import subprocess
-import openai
 import os
-import pyperclip
+import sys
+import time
 from datetime import datetime
+from pathlib import Path
 import re
-import json
-import git
-from git import Repo, InvalidGitRepositoryError
+
+# The app folder is not a package; make the repo-level helpers importable
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from shared.llm_backends import LLMError, as_messages, complete, stream
+from shared.metrics import stage
+from shared.repo_index import get_repo_index
+from shared.session_store import get_session_store
+from shared.streamlit_helpers import (
+    render_cache_stats, render_metrics, render_queue_status, render_session_picker, render_stream,
+    use_session_client
+)
+from chat_memory import ChatMemory
+from inline_complete import DEBOUNCE_MS, SuggestionCache, clean_suggestion, cursor_position, fim_template, suggest
+
+try:
+    # Optional: an editor that reruns the script on every edit, not only on Ctrl+Enter / blur
+    from streamlit_ace import st_ace
+except ImportError:
+    st_ace = None
 
 # === FIX GIT ENV FOR WINDOWS ===
 os.environ['GIT_PYTHON_REFRESH'] = 'quiet'
@@ -15,6 +31,8 @@ os.environ['GIT_PYTHON_GIT_EXECUTABLE'] = r'C:\Program Files\Git\bin\git.exe'
 
 # === CONFIGURATION ===
 st.set_page_config(page_title="🧠 Mini Copilot", layout="wide")
+# Fair queuing between users of a shared Ollama; interactive requests go first
+use_session_client()
 
 st.title("💻 Your Mini AI Code Copilot")
 
@@ -22,11 +40,16 @@ st.title("💻 Your Mini AI Code Copilot")
 tabs = st.tabs(["✍️ Code Completion", "💬 Chat Assistant"])
 
 # === SESSION MANAGEMENT ===
-saved_sessions_path = "saved_sessions"
-os.makedirs(saved_sessions_path, exist_ok=True)
+# Indexed SQLite store in saved_sessions/; older per-session JSON files there are imported once
+sessions = get_session_store("saved_sessions", text_fields=("user_code", "completion"))
 
 # === GIT HELPER ===
 def auto_commit_changes(commit_message="Auto-commit from Mini Copilot"):
+    # Imported on first use: GitPython is slow to import and most reruns never commit
+    try:
+        from git import InvalidGitRepositoryError, Repo
+    except ImportError:
+        return False, "GitPython is not installed (pip install GitPython)."
     try:
         repo = Repo(".")
         if repo.is_dirty():
@@ -46,59 +69,144 @@ ollama_model = None
 if model_mode == "Ollama (local)":
     ollama_model = st.sidebar.selectbox("Choose Ollama model:", ["codellama", "deepseek-coder", "codegemma"])
 
+backend = "openai" if model_mode == "OpenAI GPT-4" else "ollama"
+model = ollama_model or "gpt-4"
+
 temperature = st.sidebar.slider("Creativity (temperature):", 0.0, 1.0, 0.3, 0.1)
 language = st.sidebar.selectbox("Code language:", ["python", "javascript", "java", "sql"])
 
+# === REPOSITORY CONTEXT ===
+# Indexed in a background thread; only changed files are re-parsed and re-embedded
+use_repo_context = st.sidebar.checkbox(
+    "📚 Repository context", value=True,
+    help="Adds the most relevant functions and classes of the working repository (the one auto-commit "
+         "writes to) to completion and chat prompts."
+)
+repo_indexer = get_repo_index(os.getenv("REPO_INDEX_ROOT", ".")) if use_repo_context else None
+if repo_indexer is not None:
+    repo_status = repo_indexer.status()
+    st.sidebar.caption(
+        f"📚 {repo_status['symbols']} symbols from {repo_status['files']} files"
+        + (" · indexing…" if repo_status["indexing"] else "")
+        + ("" if repo_status["embedded"] else " · name matching only (no embedder)")
+        + (f" · ⚠️ {repo_status['error']}" if repo_status["error"] else "")
+    )
+
+
+def repo_context(query, exclude=""):
+    """Relevant definitions from the repository for ``query``, or "" (``REPO_CONTEXT_TOKENS`` budget)."""
+    if repo_indexer is None:
+        return ""
+    return repo_indexer.index.context(query, exclude=exclude)
+
+# === INLINE SUGGESTIONS ===
+def accept_suggestion(code, cursor, suggestion):
+    state = st.session_state
+    state.inline_accepted = code[:cursor] + suggestion + code[cursor:]
+    state.inline_previous = state.inline_accepted
+    state.inline_cursor = cursor + len(suggestion)
+    # A new editor key makes the widget start from the accepted text
+    state.inline_version += 1
+
+
+def render_inline_editor(initial_code):
+    """Editor with a suggestion at the (inferred) cursor, refreshed after each typing pause."""
+    state = st.session_state
+    state.setdefault("inline_version", 0)
+    state.setdefault("inline_cache", SuggestionCache())
+    key = f"inline_editor_{state.inline_version}"
+    initial = state.pop("inline_accepted", initial_code)
+    if st_ace is not None:
+        code = st_ace(value=initial, language=language, auto_update=True, height=300, key=key)
+    else:
+        code = st.text_area("✍️ Start writing your code:", value=initial, height=300, key=key)
+
+    previous = state.get("inline_previous", initial)
+    if code != previous:
+        state.inline_cursor = cursor_position(previous, code)
+    state.inline_previous = code
+    cursor = min(state.get("inline_cursor", len(code)), len(code))
+
+    ghost = st.empty()
+    if not code.strip():
+        return code
+    last = state.get("inline_last")
+    if last and last["code"] == code and last["cursor"] == cursor:
+        # Rerun without an edit (another widget): show the same suggestion again
+        suggestion = last["suggestion"]
+    else:
+        # Debounce: a keystroke during the pause reruns the script and stops this run here,
+        # before any request is sent; a later keystroke cancels the request in flight
+        time.sleep(DEBOUNCE_MS / 1000)
+        ghost.caption("💡 …")
+        hits = state.inline_cache.hits
+        try:
+            with stage("copilot.inline", model=model) as fields:
+                # Keep the raw tokens: leading whitespace and newlines matter when inserting
+                tokens = []
+                render_stream((tokens.append(t) or t for t in suggest(
+                    code, cursor, backend, model, language, state.inline_cache, stream)), ghost, language=language)
+                suggestion = clean_suggestion("".join(tokens))
+                fields["cached"] = state.inline_cache.hits > hits
+        except LLMError as e:
+            ghost.caption(f"⚠️ No suggestion – {e}")
+            return code
+        state.inline_last = {"code": code, "cursor": cursor, "suggestion": suggestion}
+
+    if suggestion:
+        ghost.code(suggestion, language=language)
+        mode = "fill-in-the-middle" if fim_template(backend, model) else "chat prompt"
+        st.button("⇥ Accept suggestion", on_click=accept_suggestion, args=(code, cursor, suggestion),
+                  help=f"Inserts the suggestion at line {code[:cursor].count(chr(10)) + 1} ({mode})")
+    else:
+        ghost.empty()
+    return code
+
+
 # === COMPLETION MODE ===
 with tabs[0]:
     st.subheader("✍️ Code Completion Mode")
 
-    load_session = st.selectbox("📂 Load previous session:", ["None"] + os.listdir(saved_sessions_path))
-    if load_session != "None":
-        with open(os.path.join(saved_sessions_path, load_session), "r", encoding="utf-8") as f:
-            saved_data = json.load(f)
-            st.session_state["completion"] = saved_data["completion"]
-            user_code = saved_data["user_code"]
-            language = saved_data.get("language", "python")
+    load_session = render_session_picker(st, sessions)
+    saved_data = sessions.load(load_session) if load_session is not None else None
+    if saved_data:
+        st.session_state["completion"] = saved_data["completion"]
+        user_code = saved_data["user_code"]
+        language = saved_data.get("language", "python")
     else:
         user_code = ""
 
-    user_code = st.text_area("✍️ Start writing your code:", value=user_code, height=300)
+    inline_mode = st.toggle(
+        "⚡ Inline suggestions while typing",
+        help="Suggests a short completion at the cursor whenever you pause typing. "
+             "Install streamlit-ace for suggestions on every pause; the plain editor updates on Ctrl+Enter."
+    )
+    if inline_mode:
+        user_code = render_inline_editor(user_code)
+    else:
+        user_code = st.text_area("✍️ Start writing your code:", value=user_code, height=300)
 
-    def get_ollama_completion(prompt, model="codellama"):
-        try:
-            full_prompt = f"""Complete the following {language} code:\n\n{prompt}\n\n### Completion:\n"""
-            result = subprocess.run([
-                "ollama", "run", model
-            ], input=full_prompt.encode(), capture_output=True, timeout=180)
-            output = result.stdout.decode().strip()
-            return output or result.stderr.decode().strip()
-        except subprocess.TimeoutExpired:
-            return "[Error: Model timed out]"
-        except Exception as e:
-            return f"[Error running model: {e}]"
-
-    def get_openai_completion(prompt):
-        try:
-            openai.api_key = os.getenv("OPENAI_API_KEY")
-            response = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": f"You are a helpful assistant that completes {language} code."},
-                    {"role": "user", "content": f"Complete this code:\n{prompt}"}
-                ],
-                temperature=temperature
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            return f"[OpenAI error: {e}]"
+    def completion_messages(prompt):
+        context = repo_context(prompt, exclude=prompt)
+        context = f"Relevant code from the repository:\n\n{context}\n\n" if context else ""
+        if backend == "openai":
+            return [
+                {"role": "system", "content": f"You are a helpful assistant that completes {language} code."},
+                {"role": "user", "content": f"{context}Complete this code:\n{prompt}"}
+            ]
+        return as_messages(f"""{context}Complete the following {language} code:\n\n{prompt}\n\n### Completion:\n""")
 
     if st.button("🚀 Autocomplete Code") and user_code.strip():
         with st.spinner("Thinking..."):
-            if model_mode == "OpenAI GPT-4":
-                st.session_state["completion"] = get_openai_completion(user_code)
-            elif model_mode == "Ollama (local)":
-                st.session_state["completion"] = get_ollama_completion(user_code, model=ollama_model)
+            # Stream into a temporary box; the section below shows the final completion
+            live = st.empty()
+            try:
+                st.session_state["completion"] = render_stream(
+                    stream(backend, completion_messages(user_code), model, temperature), live, language=language
+                )
+                live.empty()
+            except LLMError as e:
+                live.error(f"⚠️ The model request failed – {e}")
 
     if "completion" in st.session_state:
         response = st.session_state["completion"]
@@ -107,6 +215,7 @@ with tabs[0]:
 
         if st.button("📋 Copy to clipboard"):
             try:
+                import pyperclip
                 pyperclip.copy(response)
                 st.success("Copied!")
             except:
@@ -126,50 +235,108 @@ with tabs[0]:
                 "model_mode": model_mode,
                 "ollama_model": ollama_model
             }
-            name = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            with open(os.path.join(saved_sessions_path, name), "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2)
+            name = sessions.save(data)
             st.success(f"Saved session: {name}")
 
         if st.button("🔁 Auto-commit to Git"):
             ok, msg = auto_commit_changes()
             st.success(msg) if ok else st.warning(msg)
+            if ok and repo_indexer is not None:
+                repo_indexer.refresh()
 
 # === CHAT MODE ===
+def summarize_chat(prompt):
+    """Refresh the rolling chat summary with the selected backend (deterministic, cached).
+
+    Raises ``LLMError``; ``ChatMemory.add_exchange`` then keeps the old summary.
+    """
+    return complete(backend, as_messages(prompt), model, 0.0)
+
+
+def get_chat_embedder():
+    # Optional: recall of older turns needs sentence-transformers; without it only the summary is used
+    if st.session_state.get("chat_embedder_failed"):
+        return None
+    try:
+        from shared.embeddings import get_embedder
+        return get_embedder()
+    except ImportError:
+        pass
+    except Exception as e:
+        # e.g. the model download failed: don't retry (and fail) on every turn
+        st.warning(f"⚠️ Chat recall disabled, the embedding model is unavailable ({e}); using the summary only.")
+    st.session_state.chat_embedder_failed = True
+    return None
+
+
+def embed_chat_turns(texts):
+    embedder = get_chat_embedder()
+    return embedder.embed_documents(texts) if embedder else []
+
+
+def embed_chat_question(text):
+    embedder = get_chat_embedder()
+    return embedder.embed_query(text) if embedder else []
+
+
 with tabs[1]:
     st.subheader("💬 Chat-based Code Assistant")
 
     if "chat_history" not in st.session_state:
         st.session_state.chat_history = []
+    if "chat_memory" not in st.session_state:
+        # Recent turns verbatim, older ones summarized / recalled: the prompt no longer grows with the chat
+        st.session_state.chat_memory = ChatMemory(st.session_state.chat_history)
+    memory = st.session_state.chat_memory
 
     user_input = st.text_input("Ask something about coding:", key="chat_input")
 
     if st.button("💬 Send") and user_input.strip():
         with st.spinner("Generating answer..."):
-            messages = st.session_state.chat_history + [
-                {"role": "user", "content": user_input}
-            ]
+            # Older turns are only searched (and the embedder loaded) once some have left the window
+            messages = memory.build_messages(user_input, embed_query=embed_chat_question)
+            context = repo_context(user_input)
+            if context:
+                # Right before the question, so the history before it stays a reusable prefix
+                messages.insert(len(messages) - 1,
+                                {"role": "system", "content": f"Relevant code from the repository:\n\n{context}"})
+            # Chat messages for both backends; with Ollama an unchanged history is a prefix served from its KV cache
+            prefill = st.session_state.chat_prefill = {}
+            live = st.empty()
             try:
-                if model_mode == "OpenAI GPT-4":
-                    openai.api_key = os.getenv("OPENAI_API_KEY")
-                    reply = openai.ChatCompletion.create(
-                        model="gpt-4",
-                        messages=messages,
-                        temperature=temperature
-                    ).choices[0].message.content.strip()
-                else:
-                    chat_prompt = "\n".join([f"User: {m['content']}" if m['role'] == 'user' else f"AI: {m['content']}" for m in messages])
-                    reply = get_ollama_completion(chat_prompt, model=ollama_model)
-            except Exception as e:
-                reply = f"[Error: {e}]"
-
-            st.session_state.chat_history.extend([
-                {"role": "user", "content": user_input},
-                {"role": "assistant", "content": reply}
-            ])
+                reply = render_stream(stream(backend, messages, model, temperature, stats=prefill), live)
+            except LLMError as e:
+                reply = None
+                st.error(f"⚠️ The model request failed – {e}")
+            live.empty()
+
+        if reply is not None:
+            with st.spinner("Updating chat memory..."):
+                memory.add_exchange(user_input, reply, summarize=summarize_chat, embed_documents=embed_chat_turns)
+
+    if memory.history:
+        stats = memory.last_stats
+        st.caption(
+            f"🧠 Memory: {len(memory.history)} messages · last prompt ~{stats.get('prompt_tokens', 0)} tokens "
+            f"({stats.get('window_messages', 0)} recent, {stats.get('recalled', 0)} recalled, "
+            f"summary ~{stats.get('summary_tokens', 0)} tokens)"
+        )
+        prefill = st.session_state.get("chat_prefill")
+        if prefill and "prompt_eval_duration" in prefill:
+            # Tokens Ollama actually had to evaluate; the reused prefix is not counted
+            st.caption(f"⏱️ Last turn: prefilled {prefill.get('prompt_eval_count', 0)} new tokens in "
+                       f"{prefill['prompt_eval_duration'] / 1e6:.0f} ms")
+        if st.button("🧹 Clear chat"):
+            memory.clear()
+            st.rerun()
 
     for msg in st.session_state.chat_history:
         if msg['role'] == 'user':
             st.markdown(f"**👤 You:** {msg['content']}")
         else:
             st.markdown(f"**🤖 AI:** {msg['content']}")
+
+# === CACHE STATS & TIMINGS (rendered last so they include this run) ===
+render_queue_status(st.sidebar)
+render_cache_stats(st.sidebar)
+render_metrics(st.sidebar)
@@ -0,0 +1,178 @@
+"""Semantic answer cache for the RAG app.
+
+Analysts ask the same question in different words ("main risks?" vs. "what
+risks are mentioned?"). The LLM response cache only matches identical
+prompts, so every rewording still paid for retrieval and a full generation.
+Here answers are stored with the embedding of their question, per scope (the
+document fingerprint plus the settings that shape the answer). A new question
+whose embedding is close enough to a stored one (cosine similarity above the
+threshold) gets the stored answer and its retrieved context back, without
+retrieval or generation.
+
+Entries live in one SQLite file shared by every session and process. The
+least recently used ones are evicted once the file holds more than
+``RAG_ANSWER_CACHE_MAX_ENTRIES`` answers or ``RAG_ANSWER_CACHE_MAX_MB``.
+"""
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+
+CACHE_DIR = Path(os.getenv("RAG_ANSWER_CACHE_DIR", "rag_answer_cache"))
+# Cosine similarity of the question embeddings; rewordings of one question usually score above
+# it, different questions about the same topic below. Lower = more reuse, more wrong matches.
+THRESHOLD = float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.85"))
+MAX_ENTRIES = int(os.getenv("RAG_ANSWER_CACHE_MAX_ENTRIES", "5000"))
+MAX_BYTES = int(os.getenv("RAG_ANSWER_CACHE_MAX_MB", "64")) * 1024 * 1024
+
+_lock = threading.Lock()
+_caches = {}
+
+
+def scope_key(*parts):
+    """Hash of everything a stored answer depends on besides the question."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+
+def _unit(vector):
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return array("f", (x / norm for x in vector))
+
+
+class AnswerCache:
+    """Answers with their question embeddings, looked up by similarity within a scope."""
+
+    def __init__(self, path, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # scope -> ((newest id, entries), ids, unit vectors as rows); rebuilt when the scope's entries change
+        self._matrices = {}
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "seconds_saved": 0.0}
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False, timeout=10)
+        # WAL lets other processes read while one writes
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " id INTEGER PRIMARY KEY, scope TEXT NOT NULL, question TEXT NOT NULL, vector BLOB NOT NULL,"
+            " answer TEXT NOT NULL, context TEXT NOT NULL, sources TEXT NOT NULL, seconds REAL NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0,"
+            " size INTEGER NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_scope ON answers (scope)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_accessed ON answers (accessed)")
+        self._db.commit()
+
+    def lookup(self, scope, vector, threshold=THRESHOLD, record=True):
+        """The stored answer closest to ``vector`` in ``scope`` if at least ``threshold`` similar, else None.
+
+        A hit is a dict with ``question``, ``answer``, ``context``, ``sources``,
+        ``similarity`` and ``seconds`` (what producing the answer originally took).
+        ``record=False`` leaves the hit/miss counters alone (e.g. a page redraw).
+        """
+        import numpy as np
+
+        with self._lock:
+            ids, matrix = self._matrix(scope)
+        best_id, best = None, -1.0
+        if ids:
+            # One matrix-vector product instead of a Python loop over every stored answer
+            similarities = matrix @ np.frombuffer(_unit(vector), dtype=np.float32)
+            position = int(similarities.argmax())
+            best_id, best = ids[position], float(similarities[position])
+        with self._lock:
+            row = None
+            if best_id is not None and best >= threshold:
+                row = self._db.execute(
+                    "SELECT question, answer, context, sources, seconds FROM answers WHERE id = ?", (best_id,)
+                ).fetchone()
+            if row is None:
+                # Nothing close enough, or evicted since the matrix was built
+                if record:
+                    self.stats["misses"] += 1
+                return None
+            question, answer, context, sources, seconds = row
+            if record:
+                # Redraws neither count nor keep the entry alive
+                self._db.execute("UPDATE answers SET accessed = ?, hits = hits + 1 WHERE id = ?",
+                                 (time.time(), best_id))
+                self._db.commit()
+                self.stats["hits"] += 1
+                self.stats["seconds_saved"] += seconds
+        return {"question": question, "answer": answer, "context": context, "sources": json.loads(sources),
+                "similarity": best, "seconds": seconds}
+
+    def _matrix(self, scope):
+        """``(ids, unit vectors)`` of ``scope``, newest first; reused until an entry is added or removed."""
+        import numpy as np
+
+        # Other processes share the file: compare the newest id and the entry count with the cached ones
+        version = self._db.execute("SELECT MAX(id), COUNT(*) FROM answers WHERE scope = ?", (scope,)).fetchone()
+        cached = self._matrices.get(scope)
+        if cached is None or cached[0] != version:
+            # Newest first, so a regenerated answer wins over the one it replaced (argmax takes the first)
+            rows = self._db.execute("SELECT id, vector FROM answers WHERE scope = ? ORDER BY id DESC",
+                                    (scope,)).fetchall()
+            matrix = np.frombuffer(b"".join(blob for _, blob in rows), dtype=np.float32)
+            cached = self._matrices[scope] = (version, [entry_id for entry_id, _ in rows],
+                                              matrix.reshape(len(rows), -1) if rows else matrix)
+        return cached[1], cached[2]
+
+    def store(self, scope, question, vector, answer, context, sources, seconds):
+        """Remember an answer; ``seconds`` is how long retrieval + generation took."""
+        blob = _unit(vector).tobytes()
+        sources = json.dumps(list(sources), ensure_ascii=False)
+        size = len(blob) + len(question.encode()) + len(answer.encode()) + len(context.encode()) + len(sources)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO answers (scope, question, vector, answer, context, sources, seconds, created, accessed,"
+                " size) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (scope, question, blob, answer, context, sources, seconds, now, now, size),
+            )
+            self._trim()
+            self._db.commit()
+            self.stats["stores"] += 1
+
+    def _trim(self):
+        entries, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM answers").fetchone()
+        if entries <= self.max_entries and total <= self.max_bytes:
+            return
+        for entry_id, size in self._db.execute("SELECT id, size FROM answers ORDER BY accessed").fetchall():
+            if entries <= self.max_entries and total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM answers WHERE id = ?", (entry_id,))
+            entries -= 1
+            total -= size
+            self.stats["evictions"] += 1
+        # Matrices of scopes that lost entries would otherwise stay in memory until their next lookup
+        self._matrices.clear()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM answers")
+            self._db.commit()
+            self._matrices.clear()
+
+    def summary(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM answers").fetchone()
+        return {**self.stats, "lookups": lookups, "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+                "entries": entries, "bytes": size}
+
+
+def get_answer_cache(directory=CACHE_DIR):
+    """The process-wide cache in ``directory`` (one SQLite connection shared by all sessions)."""
+    path = Path(directory) / "answers.sqlite"
+    with _lock:
+        if path not in _caches:
+            _caches[path] = AnswerCache(path)
+        return _caches[path]
@@ -1,30 +1,35 @@
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-import subprocess
+import sys
+from pathlib import Path
 
-# Load & split PDF
-docs = PyPDFLoader("BUILDINGLLMS.pdf").load()
-splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-chunks = splitter.split_documents(docs)
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.embeddings import get_embedder
+from shared.llm_backends import as_messages, stream
+from context_builder import build_context
+from chunking import TokenSplitter, embedding_token_counter
+from pdf_pages import iter_pdf_pages
 
-# Use new embeddings wrapper (with GPU + batching)
-embedder = HuggingFaceEmbeddings(
-    model_name='sentence-transformers/all-MiniLM-L6-v2',
-    model_kwargs={'device': 'cuda'},
-    encode_kwargs={'batch_size': 32}
-)
 
-# Vector store
-db = Chroma.from_documents(chunks, embedding=embedder)
+def main():
+    # Shared embeddings wrapper (auto device + adaptive batching)
+    embedder = get_embedder()
 
-# RAG prompt
-question = "What are the main risks mentioned in the document?"
-results = db.similarity_search(question, k=3)
-context = "\n\n".join([doc.page_content for doc in results])
+    # Load & split PDF: pages parsed in parallel and cached, chunks sized in embedding-model tokens
+    pages = iter_pdf_pages(Path("BUILDINGLLMS.pdf").read_bytes())
+    splitter = TokenSplitter(count=embedding_token_counter(embedder))
+    chunks = list(splitter.iter_pages(pages, source="BUILDINGLLMS.pdf"))
 
-rag_prompt = f"""Answer based on the context below.
+    # Vector store
+    db = Chroma.from_documents(chunks, embedding=embedder)
+
+    # RAG prompt
+    question = "What are the main risks mentioned in the document?"
+    results = db.similarity_search(question, k=8)
+    # Merge overlapping chunks, drop duplicates and keep within the token budget
+    context, _, report = build_context(results, "mistral")
+
+    # Literal lines stay at column 0: indentation would be sent to the model
+    rag_prompt = f"""Answer based on the context below.
 
 Context:
 {context}
@@ -33,5 +38,15 @@ Question:
 {question}
 """
 
-response = subprocess.run(["ollama", "run", "mistral"], input=rag_prompt.encode(), capture_output=True)
-print(response.stdout.decode())
+    # Print tokens as the model produces them
+    stats = {}
+    answer = stream("ollama", as_messages(rag_prompt), "mistral", 0.0, stats=stats)
+    for token in answer:
+        print(token, end="", flush=True)
+    print()
+    print(f"[context: {report['context_tokens']} tokens from {report['passages']} passages, "
+          f"prompt tokens sent: {stats.get('prompt_eval_count', 'n/a (cached)')}]")
+
+
+if __name__ == "__main__":
+    main()
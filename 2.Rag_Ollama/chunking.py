@@ -0,0 +1,196 @@
+"""Token-aware chunking that respects page and section boundaries.
+
+``RecursiveCharacterTextSplitter(chunk_size=500)`` counts characters: a chunk
+of tables or numbers holds far more tokens than one of prose, and text past
+the embedding model's sequence limit (256 word pieces for MiniLM) is silently
+cut off before it is embedded. ``TokenSplitter`` sizes chunks in tokens of the
+embedding model's own tokenizer (estimated when there is none), and:
+
+- never lets a chunk span two pages, so every chunk cites an exact page;
+- starts a new chunk at each section heading ("Item 1A. Risk Factors",
+  "3.2 Liquidity", all-caps titles, markdown headings) and records the
+  heading in ``metadata["section"]``, also for the following pages;
+- breaks between sentences, and inside a sentence only when that sentence
+  alone is over the budget;
+- overlaps neighbouring chunks of a section by up to ``overlap_tokens`` of
+  whole sentences, sliced from the page text, so the context builder can
+  merge neighbours back together.
+"""
+import math
+import re
+
+# ~500 characters of English prose, well inside MiniLM's 256-token limit
+CHUNK_TOKENS = 128
+OVERLAP_TOKENS = 16
+CHARS_PER_TOKEN = 4
+MAX_HEADING_WORDS = 12
+# Shorter "sentences" are list numbers and abbreviations ("1.", "Inc."); kept with the next one
+MIN_SENTENCE_CHARS = 20
+
+LINE_RE = re.compile(r"[^\n]+")
+# End of a sentence: punctuation, optional closing quotes/brackets, then whitespace
+SENTENCE_END_RE = re.compile(r"[.!?][\"')\]”’]*\s+")
+MARKDOWN_HEADING_RE = re.compile(r"#{1,6}\s+\S")
+KEYWORD_HEADING_RE = re.compile(r"(?:item|section|article|part|chapter|note|schedule)\s+[0-9ivxlc]+[a-z]?[.:)]?(?:\s|$)",
+                                re.IGNORECASE)
+NUMBERED_HEADING_RE = re.compile(r"\d+(?:\.\d+)*\.?\s+[A-Z]")
+
+
+def estimate_tokens(texts):
+    return [max(1, len(text) // CHARS_PER_TOKEN) for text in texts]
+
+
+def tokenizer_counter(tokenizer):
+    """``count(texts) -> [tokens]`` with a Hugging Face tokenizer."""
+    def count(texts):
+        # One batched call per page; fast tokenizers encode the batch in parallel
+        return [len(ids) for ids in tokenizer(list(texts), add_special_tokens=False)["input_ids"]]
+    return count
+
+
+def embedding_token_counter(embedder=None):
+    """Counts with the embedding model's own tokenizer, or estimates when there is none."""
+    tokenizer = getattr(getattr(embedder, "model", None), "tokenizer", None)
+    return estimate_tokens if tokenizer is None else tokenizer_counter(tokenizer)
+
+
+def is_heading(line):
+    line = line.strip()
+    words = line.split()
+    if not words or len(words) > MAX_HEADING_WORDS or len(line) < 3:
+        return False
+    if MARKDOWN_HEADING_RE.match(line) or KEYWORD_HEADING_RE.match(line):
+        return True
+    if line[-1] in ".,;:":
+        return False
+    if NUMBERED_HEADING_RE.match(line):
+        # "3.2 Liquidity and Capital Resources", not a wrapped line of a numbered list
+        capitalized = sum(word[0].isupper() for word in words[1:] if len(word) > 3)
+        return capitalized * 2 >= len([word for word in words[1:] if len(word) > 3])
+    letters = [c for c in line if c.isalpha()]
+    return len(letters) >= 4 and line.upper() == line
+
+
+def _sentences(text, start, end):
+    """``(start, end)`` spans of the sentences in ``text[start:end]``, whitespace trimmed."""
+    spans = []
+    for match in SENTENCE_END_RE.finditer(text, start, end):
+        if match.start() + 1 - start >= MIN_SENTENCE_CHARS:
+            spans.append((start, match.start() + 1))
+            start = match.end()
+    spans.append((start, end))
+    result = []
+    for a, b in spans:
+        while a < b and text[a].isspace():
+            a += 1
+        while b > a and text[b - 1].isspace():
+            b -= 1
+        if a < b:
+            result.append((a, b))
+    return result
+
+
+def _units(text):
+    """``(start, end, heading)`` spans of one page: heading lines and sentences of paragraphs."""
+    units = []
+    block = None
+    previous_end = 0
+    for match in LINE_RE.finditer(text):
+        line_start, line_end = match.span()
+        paragraph_break = text.count("\n", previous_end, line_start) >= 2
+        previous_end = line_end
+        if not match.group().strip():
+            continue
+        heading = is_heading(match.group())
+        if block and (heading or paragraph_break):
+            units.extend((a, b, False) for a, b in _sentences(text, *block))
+            block = None
+        if heading:
+            units.append((line_start, line_end, True))
+        else:
+            block = (block[0], line_end) if block else (line_start, line_end)
+    if block:
+        units.extend((a, b, False) for a, b in _sentences(text, *block))
+    return units
+
+
+def _split_long(text, start, end, parts):
+    """Cut ``text[start:end]`` into ``parts`` pieces of similar length, at spaces where possible."""
+    size = (end - start) / parts
+    cuts = []
+    for i in range(1, parts):
+        target = int(start + i * size)
+        cut = text.rfind(" ", start, target + 1)
+        if cut <= (cuts[-1] if cuts else start):
+            # No space to break at (a long number or URL)
+            cut = target
+        cuts.append(cut)
+    starts = [start] + [cut + 1 if text[cut] == " " else cut for cut in cuts]
+    return list(zip(starts, cuts + [end]))
+
+
+class TokenSplitter:
+    """Splits pages into chunks of at most ``chunk_tokens`` tokens (see the module docstring)."""
+
+    def __init__(self, chunk_tokens=CHUNK_TOKENS, overlap_tokens=OVERLAP_TOKENS, count=None):
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.count = count or estimate_tokens
+
+    def split_page(self, text, section=None):
+        """``([(chunk_text, section)], section)``; the returned section carries over to the next page."""
+        units = _units(text)
+        counts = self.count([text[a:b] for a, b, _ in units]) if units else []
+        sized = []
+        for (a, b, heading), tokens in zip(units, counts):
+            if tokens <= self.chunk_tokens or heading:
+                sized.append((a, b, heading, tokens))
+                continue
+            parts = math.ceil(tokens / self.chunk_tokens)
+            pieces = _split_long(text, a, b, parts)
+            sized.extend((pa, pb, False, math.ceil(tokens / len(pieces))) for pa, pb in pieces)
+
+        chunks, current, tokens = [], [], 0
+        current_section = section
+
+        def emit():
+            chunks.append((text[current[0][0]:current[-1][1]], current_section))
+
+        for unit in sized:
+            a, b, heading, unit_tokens = unit
+            if current and (heading or tokens + unit_tokens > self.chunk_tokens):
+                emit()
+                current = [] if heading else self._overlap(current)
+                tokens = sum(u[3] for u in current)
+            if heading:
+                section = current_section = text[a:b].strip().lstrip("#").strip()
+            current.append(unit)
+            tokens += unit_tokens
+        if current:
+            emit()
+        return chunks, section
+
+    def _overlap(self, units):
+        """Trailing units of a full chunk (never all of it) within the overlap budget."""
+        carried, tokens = [], 0
+        for unit in reversed(units[1:]):
+            if unit[2] or tokens + unit[3] > self.overlap_tokens:
+                break
+            carried.insert(0, unit)
+            tokens += unit[3]
+        return carried
+
+    def iter_pages(self, pages, **metadata):
+        """Chunk the ``(page, text)`` pairs of one document lazily into LangChain documents.
+
+        Every chunk gets ``metadata`` plus its ``page`` and, once a heading was
+        seen, its ``section``.
+        """
+        from langchain_core.documents import Document
+
+        section = None
+        for page, text in pages:
+            pieces, section = self.split_page(text, section)
+            for piece, piece_section in pieces:
+                extra = {"page": page, "section": piece_section} if piece_section else {"page": page}
+                yield Document(page_content=piece, metadata={**metadata, **extra})
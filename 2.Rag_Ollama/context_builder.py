@@ -0,0 +1,201 @@
+"""Token-budgeted context assembly for the RAG prompt.
+
+Retrieved chunks are ranked best-first. Before they go into the prompt:
+
+1. chunks of the same page that overlap (``chunk_overlap``) or touch are
+   merged back into one passage, so the shared text is sent once;
+2. near-duplicates (same paragraph on several pages, repeated headers) are
+   dropped, keeping the better-ranked copy;
+3. passages are packed in rank order until the token budget is used up.
+
+Tokens are counted with the target model's Hugging Face tokenizer when
+``RAG_TOKENIZER`` names one, otherwise estimated from the characters-per-token
+ratio that Ollama's own ``prompt_eval_count`` reports for this model.
+"""
+import os
+import re
+import threading
+
+# Context tokens per prompt; the question and instructions come on top
+DEFAULT_BUDGET = int(os.getenv("RAG_CONTEXT_TOKENS", "1024"))
+# Shortest shared text treated as splitter overlap rather than coincidence
+MIN_OVERLAP = 20
+# Word-shingle Jaccard similarity above which two passages count as duplicates
+DUPLICATE_SIMILARITY = 0.8
+# English prose averages ~4 characters per token on Llama/Mistral vocabularies
+DEFAULT_CHARS_PER_TOKEN = 4.0
+
+_lock = threading.Lock()
+_tokenizers = {}
+_chars_per_token = {}
+
+
+# === TOKEN COUNTING ===
+def get_token_counter(model):
+    """``count(text) -> int`` for ``model``: exact with ``RAG_TOKENIZER``, calibrated estimate otherwise."""
+    name = os.getenv("RAG_TOKENIZER")
+    if name:
+        with _lock:
+            if name not in _tokenizers:
+                try:
+                    from transformers import AutoTokenizer
+                    _tokenizers[name] = AutoTokenizer.from_pretrained(name)
+                except Exception:
+                    # Offline node or unknown name: fall back to the estimate
+                    _tokenizers[name] = None
+        tokenizer = _tokenizers[name]
+        if tokenizer is not None:
+            return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+    return lambda text: estimate_tokens(text, model)
+
+
+def estimate_tokens(text, model):
+    if not text:
+        return 0
+    return max(1, round(len(text) / _chars_per_token.get(model, DEFAULT_CHARS_PER_TOKEN)))
+
+
+def calibrate(model, prompt, prompt_tokens):
+    """Refine the estimate with the prompt token count Ollama reported for ``prompt``."""
+    if not prompt_tokens:
+        return
+    ratio = len(prompt) / prompt_tokens
+    # A count that only covers part of the prompt (e.g. reused prefix) would skew the ratio
+    if not 2.0 <= ratio <= 8.0:
+        return
+    with _lock:
+        previous = _chars_per_token.get(model)
+        _chars_per_token[model] = ratio if previous is None else 0.8 * previous + 0.2 * ratio
+
+
+# === MERGING & DEDUPLICATION ===
+def _overlap(left, right):
+    """Length of the longest suffix of ``left`` that is a prefix of ``right``."""
+    for size in range(min(len(left), len(right)) - 1, MIN_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _same_page(a, b):
+    keys = ("doc_id", "source", "page")
+    return all(a.metadata.get(k) == b.metadata.get(k) for k in keys)
+
+
+def _join(left, right):
+    """``right`` appended to ``left`` without their shared text, or None if they are not neighbours."""
+    if right in left:
+        return left
+    size = _overlap(left, right)
+    return left + right[size:] if size else None
+
+
+def merge_passages(docs):
+    """Merge overlapping chunks of the same page; returns ``[(text, metadata, rank)]`` best-first."""
+    passages = []
+    for rank, doc in enumerate(docs):
+        text = doc.page_content.strip()
+        for passage in passages:
+            if not _same_page(passage["doc"], doc):
+                continue
+            merged = _join(passage["text"], text) or _join(text, passage["text"])
+            if merged:
+                passage["text"] = merged
+                passage["merged"] += 1
+                break
+        else:
+            passages.append({"text": text, "doc": doc, "rank": rank, "merged": 0})
+
+    # A merge can make a passage the missing link between two others
+    changed = True
+    while changed:
+        changed = False
+        for i, a in enumerate(passages):
+            for b in passages[i + 1:]:
+                if not _same_page(a["doc"], b["doc"]):
+                    continue
+                merged = _join(a["text"], b["text"]) or _join(b["text"], a["text"])
+                if merged:
+                    a["text"], a["merged"] = merged, a["merged"] + b["merged"] + 1
+                    passages.remove(b)
+                    changed = True
+                    break
+            if changed:
+                break
+    return passages
+
+
+def _shingles(text, size=3):
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def drop_duplicates(passages):
+    """Drop passages that repeat a better-ranked one; returns ``(kept, dropped_count)``."""
+    kept, seen = [], []
+    for passage in passages:
+        shingles = _shingles(passage["text"])
+        duplicate = any(
+            passage["text"] in other["text"]
+            or len(shingles & other_shingles) / (len(shingles | other_shingles) or 1) >= DUPLICATE_SIMILARITY
+            for other, other_shingles in seen
+        )
+        if not duplicate:
+            kept.append(passage)
+            seen.append((passage, shingles))
+    return kept, len(passages) - len(kept)
+
+
+# === PACKING ===
+def _truncate(text, budget, count):
+    """Longest sentence-aligned prefix of ``text`` within ``budget`` tokens."""
+    sentences = re.split(r"(?<=[.!?])\s+", text)
+    result = ""
+    for sentence in sentences:
+        candidate = f"{result} {sentence}".strip()
+        if count(candidate) > budget:
+            break
+        result = candidate
+    return result
+
+
+def build_context(docs, model, budget=DEFAULT_BUDGET, separator="\n\n"):
+    """Pack ranked ``docs`` into at most ``budget`` tokens of context.
+
+    Returns ``(context, used_docs, report)``; ``used_docs`` are the documents
+    whose text made it into the context, ``report`` counts what happened.
+    """
+    count = get_token_counter(model)
+    passages = merge_passages(docs)
+    merged = sum(p["merged"] for p in passages)
+    passages, duplicates = drop_duplicates(passages)
+
+    parts, used, tokens, skipped = [], [], 0, 0
+    separator_tokens = count(separator)
+    for passage in sorted(passages, key=lambda p: p["rank"]):
+        cost = count(passage["text"]) + (separator_tokens if parts else 0)
+        if tokens + cost <= budget:
+            parts.append(passage["text"])
+            used.append(passage["doc"])
+            tokens += cost
+        elif not parts:
+            # Even the best passage is too long: keep as much of it as fits
+            text = _truncate(passage["text"], budget, count)
+            if text:
+                parts.append(text)
+                used.append(passage["doc"])
+                tokens = count(text)
+            skipped += 1
+        else:
+            skipped += 1
+
+    report = {
+        "retrieved_chunks": len(docs),
+        "passages": len(parts),
+        "merged_chunks": merged,
+        "duplicates_dropped": duplicates,
+        "over_budget": skipped,
+        "context_tokens": tokens,
+        "budget": budget,
+    }
+    return separator.join(parts), used, report
@@ -0,0 +1,156 @@
+"""Incremental multi-document corpus for the RAG app.
+
+All documents share one persistent Chroma collection. Adding a PDF streams
+its pages through load -> split -> embed -> upsert in bounded batches, so
+memory stays flat however large the file is, and documents already in the
+corpus are never processed again. Removing a document deletes its chunks.
+
+A small JSON manifest next to the collection records which documents are in
+the corpus; a document only counts as added once all its chunks are stored.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from pdf_pages import iter_pdf_pages
+
+CORPUS_ROOT = Path(os.getenv("RAG_CORPUS_DIR", "rag_corpus"))
+# Chunks embedded and upserted per batch; bounds memory during ingestion
+BATCH_SIZE = int(os.getenv("RAG_INGEST_BATCH", "64"))
+
+_lock = threading.Lock()
+_stores = {}
+
+
+def document_id(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def _corpus_path(settings):
+    # Chunks made with other splitter/embedding settings cannot be mixed in one collection
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+    return CORPUS_ROOT / digest
+
+
+class Corpus:
+    def __init__(self, settings, load_embedder):
+        self.path = _corpus_path(settings)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.path / "manifest.json"
+        # Listing documents needs only the manifest; the model and Chroma wait for the first add or search
+        self._load_embedder = load_embedder
+        self._db = None
+        self._lock = threading.Lock()
+
+    @property
+    def db(self):
+        if self._db is None:
+            embedder = self._load_embedder()
+            from langchain_community.vectorstores import Chroma
+
+            with self._lock:
+                if self._db is None:
+                    self._db = Chroma(persist_directory=str(self.path / "chroma"), embedding_function=embedder)
+        return self._db
+
+    # --- manifest ---
+    def _read_manifest(self):
+        if not self.manifest_path.exists():
+            return {}
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        tmp = self.manifest_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    def documents(self):
+        """``{doc_id: info}`` for every fully ingested document."""
+        return self._read_manifest()
+
+    def __contains__(self, doc_id):
+        return doc_id in self._read_manifest()
+
+    # --- ingestion ---
+    def add_document(self, name, data, splitter, on_progress=None):
+        """Stream a PDF into the corpus; returns its id. Known documents are skipped.
+
+        ``splitter`` is a ``chunking.TokenSplitter``. Pages are extracted in
+        parallel and cached (``pdf_pages.py``); ``on_progress(pages_done,
+        total_pages)`` is called as pages come in.
+        """
+        doc_id = document_id(data)
+        if doc_id in self:
+            return doc_id
+
+        db = self.db
+        with self._lock:
+            # Leftovers of an interrupted ingestion of this same file
+            db.delete(where={"doc_id": doc_id})
+        seen = {"pages": 0}
+
+        def progress(done, total):
+            seen["pages"] = total
+            if on_progress:
+                on_progress(done, total)
+
+        batch, chunk_count = [], 0
+        for chunk in splitter.iter_pages(iter_pdf_pages(data, on_progress=progress), source=name, doc_id=doc_id):
+            batch.append(chunk)
+            if len(batch) >= BATCH_SIZE:
+                chunk_count += self._upsert(doc_id, batch, chunk_count)
+                batch = []
+        if batch:
+            chunk_count += self._upsert(doc_id, batch, chunk_count)
+
+        with self._lock:
+            manifest = self._read_manifest()
+            manifest[doc_id] = {"name": name, "pages": seen["pages"], "chunks": chunk_count,
+                                "bytes": len(data), "added_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+            self._write_manifest(manifest)
+        return doc_id
+
+    def _upsert(self, doc_id, chunks, offset):
+        ids = [f"{doc_id}:{offset + i}" for i in range(len(chunks))]
+        db = self.db
+        with self._lock:
+            db.add_documents(chunks, ids=ids)
+        return len(chunks)
+
+    def remove_document(self, doc_id):
+        db = self.db
+        with self._lock:
+            db.delete(where={"doc_id": doc_id})
+            manifest = self._read_manifest()
+            manifest.pop(doc_id, None)
+            self._write_manifest(manifest)
+
+    # --- search ---
+    def similarity_search(self, question, k=3, doc_ids=None):
+        """Search the whole corpus, or only ``doc_ids`` when given."""
+        return self.db.similarity_search(question, k=k, filter=doc_filter(doc_ids))
+
+
+def doc_filter(doc_ids):
+    """Chroma ``where`` clause restricting a search to ``doc_ids`` (None = everything)."""
+    if not doc_ids:
+        return None
+    return {"doc_id": doc_ids[0]} if len(doc_ids) == 1 else {"doc_id": {"$in": list(doc_ids)}}
+
+
+def get_corpus(settings, load_embedder):
+    """Process-wide corpus for these settings, shared by every session.
+
+    ``load_embedder()`` returns the embedding model; it is only called once a
+    document is added, removed or searched.
+    """
+    key = json.dumps(settings, sort_keys=True)
+    with _lock:
+        if key not in _stores:
+            _stores[key] = Corpus(settings, load_embedder)
+        return _stores[key]
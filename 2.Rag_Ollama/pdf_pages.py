@@ -0,0 +1,266 @@
+"""Parallel PDF text extraction with a per-page text cache.
+
+pypdf parses a PDF one page after another on one core, so a 1,000-page filing
+keeps a single CPU busy for minutes. Here the pages are extracted by a pool of
+worker processes, ``PAGES_PER_TASK`` pages per task. Every worker memory-maps
+the file itself, so only page numbers and extracted text cross process
+boundaries, never the document bytes.
+
+Extracted text is cached per (file hash, page) in SQLite. Ingesting a document
+again (other chunk settings, an evicted or rebuilt index, the other app mode)
+skips parsing entirely, and an interrupted ingestion resumes with the pages it
+had not reached. Least recently used documents are dropped once the cache
+exceeds ``RAG_PAGE_CACHE_MAX_MB``.
+"""
+import hashlib
+import mmap
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from multiprocessing import get_all_start_methods, get_context
+from pathlib import Path
+
+CACHE_DIR = Path(os.getenv("RAG_PAGE_CACHE_DIR", "rag_page_cache"))
+MAX_CACHE_BYTES = int(os.getenv("RAG_PAGE_CACHE_MAX_MB", "512")) * 1024 * 1024
+WORKERS = int(os.getenv("RAG_EXTRACT_WORKERS", os.cpu_count() or 1))
+# Each task parses the file's cross-reference table once; more pages per task amortize that
+PAGES_PER_TASK = int(os.getenv("RAG_EXTRACT_PAGES_PER_TASK", "16"))
+# Below this many pages to parse, starting worker processes costs more than it saves
+PARALLEL_MIN_PAGES = 32
+# Never "fork": the app process runs threads (model warm-up, the LLM event loop, the repo
+# indexer, torch) whose locks a forked worker could inherit held
+START_METHOD = os.getenv("RAG_EXTRACT_START_METHOD",
+                         "forkserver" if "forkserver" in get_all_start_methods() else "spawn")
+
+_lock = threading.Lock()
+_start_lock = threading.Lock()
+_pool = None
+_caches = {}
+
+
+def file_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+# === EXTRACTION ===
+def _open_mapped(path):
+    f = open(path, "rb")
+    try:
+        return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except Exception:
+        f.close()
+        raise
+
+
+def page_count(path):
+    from pypdf import PdfReader
+
+    f, mapped = _open_mapped(path)
+    try:
+        return len(PdfReader(mapped).pages)
+    finally:
+        mapped.close()
+        f.close()
+
+
+def _extract_tasks(path, tasks):
+    """Yield ``[(page, text)]`` per list of page numbers in ``tasks``, parsing the file once."""
+    from pypdf import PdfReader
+
+    # Mapped only meanwhile, so the file can be deleted afterwards (also on Windows)
+    f, mapped = _open_mapped(path)
+    try:
+        reader = PdfReader(mapped)
+        for pages in tasks:
+            yield [(page, reader.pages[page].extract_text() or "") for page in pages]
+    finally:
+        mapped.close()
+        f.close()
+
+
+def extract_range(path, pages):
+    """``[(page, text)]`` for ``pages`` of the PDF at ``path`` (0-based page numbers)."""
+    return list(_extract_tasks(path, [pages]))[0]
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=get_context(START_METHOD))
+        return _pool
+
+
+@contextmanager
+def _plain_main():
+    """Start workers without the app script.
+
+    Streamlit installs the app script as ``__main__``, and new spawn or
+    forkserver workers re-run ``__main__`` from its file before taking work:
+    the whole app, model warm-up included, in every worker. They are started
+    while a plain module stands in for it; tasks only need this module.
+    """
+    with _start_lock:
+        main = sys.modules.get("__main__")
+        sys.modules["__main__"] = types.ModuleType("__main__")
+        try:
+            yield
+        finally:
+            sys.modules["__main__"] = main
+
+
+def _reset_pool():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _extracted(path, missing, workers):
+    """``(page, text)`` for the ``missing`` pages, in order; parallel when it pays off."""
+    tasks = [missing[i:i + PAGES_PER_TASK] for i in range(0, len(missing), PAGES_PER_TASK)]
+    finished = 0
+    if workers > 1 and len(missing) >= PARALLEL_MIN_PAGES:
+        try:
+            # map() submits every task (starting the workers) before it returns
+            with _plain_main():
+                results_in_order = _get_pool().map(extract_range, [path] * len(tasks), tasks)
+            # map() keeps task order; only finished tasks wait in memory
+            for results in results_in_order:
+                finished += 1
+                yield results
+            return
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory): finish here, start a fresh pool next time
+            _reset_pool()
+    yield from _extract_tasks(path, tasks[finished:])
+
+
+# === PAGE CACHE ===
+class PageCache:
+    """Extracted page text per (file hash, page), with LRU eviction by document."""
+
+    def __init__(self, path, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = {"cached_pages": 0, "extracted_pages": 0, "evictions": 0}
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False, timeout=10)
+        # WAL lets other processes read while one writes
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " file TEXT NOT NULL, page INTEGER NOT NULL, text TEXT NOT NULL, PRIMARY KEY (file, page))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " file TEXT PRIMARY KEY, accessed REAL NOT NULL, size INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.commit()
+
+    def get(self, digest):
+        """``{page: text}`` already extracted for the file with hash ``digest``."""
+        with self._lock:
+            rows = self._db.execute("SELECT page, text FROM pages WHERE file = ?", (digest,)).fetchall()
+            if rows:
+                self._db.execute("UPDATE files SET accessed = ? WHERE file = ?", (time.time(), digest))
+                self._db.commit()
+        return dict(rows)
+
+    def add(self, digest, pages):
+        size = sum(len(text.encode()) for _, text in pages)
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO pages (file, page, text) VALUES (?, ?, ?)",
+                                 [(digest, page, text) for page, text in pages])
+            self._db.execute(
+                "INSERT INTO files (file, accessed, size) VALUES (?, ?, ?)"
+                " ON CONFLICT (file) DO UPDATE SET accessed = excluded.accessed, size = size + excluded.size",
+                (digest, time.time(), size),
+            )
+            self._trim(keep=digest)
+            self._db.commit()
+
+    def _trim(self, keep):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for digest, size in self._db.execute("SELECT file, size FROM files ORDER BY accessed").fetchall():
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            self._db.execute("DELETE FROM pages WHERE file = ?", (digest,))
+            self._db.execute("DELETE FROM files WHERE file = ?", (digest,))
+            total -= size
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM pages")
+            self._db.execute("DELETE FROM files")
+            self._db.commit()
+
+
+def get_page_cache(directory=CACHE_DIR):
+    """The process-wide page cache in ``directory`` (one SQLite connection shared by all sessions)."""
+    path = Path(directory) / "pages.sqlite"
+    with _lock:
+        if path not in _caches:
+            _caches[path] = PageCache(path)
+        return _caches[path]
+
+
+# === PUBLIC API ===
+def extract_pages(path, digest, workers=WORKERS, cache=None, on_progress=None):
+    """Yield ``(page, text)`` for every page of the PDF at ``path`` in page order (0-based).
+
+    ``digest`` identifies the file contents in the cache (``file_hash``);
+    ``cache=False`` disables the cache. ``on_progress(pages_done, total_pages)``
+    is called as pages become available.
+    """
+    if cache is None:
+        cache = get_page_cache()
+    total = page_count(path)
+    known = cache.get(digest) if cache else {}
+    missing = [page for page in range(total) if page not in known]
+
+    batches = _extracted(path, missing, workers)
+    fresh = {}
+    for page in range(total):
+        if page in known:
+            text = known.pop(page)
+            if cache:
+                cache.stats["cached_pages"] += 1
+        else:
+            if page not in fresh:
+                # Ranges finish in page order, so the next one starts with this page
+                results = next(batches)
+                if cache:
+                    cache.add(digest, results)
+                    cache.stats["extracted_pages"] += len(results)
+                fresh.update(results)
+            text = fresh.pop(page)
+        if on_progress:
+            on_progress(page + 1, total)
+        yield page, text
+
+
+def iter_pdf_pages(data, workers=WORKERS, cache=None, on_progress=None):
+    """``extract_pages`` for PDF bytes (e.g. an upload); the temporary copy is removed afterwards."""
+    digest = file_hash(data)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
+        tmp_file.write(data)
+        tmp_path = tmp_file.name
+    try:
+        yield from extract_pages(tmp_path, digest, workers, cache, on_progress)
+    finally:
+        os.remove(tmp_path)
@@ -0,0 +1,154 @@
+"""Hybrid retrieval for the RAG app: BM25 + dense vectors, optional reranking.
+
+MiniLM vectors are good at paraphrases but blur exact terms such as clause
+numbers, tickers and statute names. A local inverted-index BM25 score catches
+those; both scores are min-max normalized over the candidate pool and mixed
+with weight ``alpha`` (1.0 = dense only, 0.0 = BM25 only). An optional
+cross-encoder then rescores only the top-N fused candidates, on CPU.
+"""
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+# Keeps "14.2.3", "10-K", "§" references and "u.s.c" together as single terms
+TOKEN_RE = re.compile(r"§|[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+RERANK_MODEL = os.getenv("RAG_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+_lock = threading.Lock()
+_retrievers = {}
+_reranker = None
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 over an in-memory inverted index (term -> {doc: term frequency})."""
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.k1, self.b = k1, b
+        self.postings = defaultdict(dict)
+        self.lengths = []
+        for i, text in enumerate(texts):
+            terms = tokenize(text)
+            self.lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self.postings[term][i] = tf
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        n = len(self.lengths)
+        self.idf = {term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+                    for term, docs in self.postings.items()}
+
+    def scores(self, query):
+        """``{doc_index: score}`` for documents sharing at least one term with the query."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term].items():
+                norm = 1 - self.b + self.b * self.lengths[i] / (self.avg_length or 1)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        return scores
+
+    def search(self, query, k, allowed=None):
+        scores = self.scores(query)
+        ranked = sorted(((s, i) for i, s in scores.items() if allowed is None or i in allowed), reverse=True)
+        return [(i, s) for s, i in ranked[:k]]
+
+
+def _normalize(scores):
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    if high == low:
+        return {key: 1.0 for key in scores}
+    return {key: (value - low) / (high - low) for key, value in scores.items()}
+
+
+def _content_key(text, metadata):
+    return text, json.dumps(metadata or {}, sort_keys=True, default=str)
+
+
+class HybridRetriever:
+    def __init__(self, db):
+        self.db = db
+        stored = db.get(include=["documents", "metadatas"])
+        self.texts = stored["documents"]
+        self.metadatas = stored["metadatas"]
+        self.bm25 = BM25Index(self.texts)
+        # Keyed by chunk id, not text: identical chunks (boilerplate, one passage in two
+        # documents) keep their own scores, documents and pages
+        self._index_of = {chunk_id: i for i, chunk_id in enumerate(stored["ids"])}
+        self._index_of_content = {_content_key(text, meta): i
+                                  for i, (text, meta) in enumerate(zip(self.texts, self.metadatas))}
+
+    def _position(self, doc):
+        i = self._index_of.get(getattr(doc, "id", None))
+        if i is None:
+            # Older langchain versions return no ids; text and metadata still tell documents and pages apart
+            i = self._index_of_content.get(_content_key(doc.page_content, doc.metadata))
+        return i
+
+    def _allowed(self, where):
+        if not where:
+            return None
+        condition = where.get("doc_id")
+        doc_ids = set(condition["$in"]) if isinstance(condition, dict) else {condition}
+        return {i for i, meta in enumerate(self.metadatas) if (meta or {}).get("doc_id") in doc_ids}
+
+    def candidates(self, question, n=20, alpha=0.5, where=None):
+        """Fused ``[(Document, score)]`` for the top ``n`` candidates."""
+        from langchain_core.documents import Document
+
+        dense = self.db.similarity_search_with_relevance_scores(question, k=n, filter=where) if alpha > 0 else []
+        positions = [(self._position(doc), score) for doc, score in dense]
+        dense_scores = {i: score for i, score in positions if i is not None}
+        sparse_scores = dict(self.bm25.search(question, n, self._allowed(where))) if alpha < 1 else {}
+
+        dense_norm, sparse_norm = _normalize(dense_scores), _normalize(sparse_scores)
+        fused = {i: alpha * dense_norm.get(i, 0.0) + (1 - alpha) * sparse_norm.get(i, 0.0)
+                 for i in set(dense_norm) | set(sparse_norm)}
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:n]
+        return [(Document(page_content=self.texts[i], metadata=self.metadatas[i] or {}), score)
+                for i, score in ranked]
+
+    def search(self, question, k=3, alpha=0.5, rerank=False, rerank_candidates=20, where=None):
+        candidates = self.candidates(question, n=max(k, rerank_candidates if rerank else k), alpha=alpha, where=where)
+        if rerank and candidates:
+            candidates = rerank_documents(question, candidates)
+        return [doc for doc, _ in candidates[:k]]
+
+
+def get_reranker():
+    """Process-wide cross-encoder, loaded on first use; CPU keeps it off the embedding GPU."""
+    global _reranker
+    if _reranker is None:
+        with _lock:
+            if _reranker is None:
+                from sentence_transformers import CrossEncoder
+                _reranker = CrossEncoder(RERANK_MODEL, device=os.getenv("RAG_RERANK_DEVICE", "cpu"))
+    return _reranker
+
+
+def rerank_documents(question, candidates):
+    scores = get_reranker().predict([(question, doc.page_content) for doc, _ in candidates])
+    return sorted(((doc, float(score)) for (doc, _), score in zip(candidates, scores)),
+                  key=lambda item: item[1], reverse=True)
+
+
+def get_hybrid_retriever(db, slot, version):
+    """Process-wide retriever for the store in ``slot`` (e.g. an index key).
+
+    ``version`` must change whenever the store's contents do; the BM25 index
+    is then rebuilt and the stale one dropped.
+    """
+    with _lock:
+        cached = _retrievers.get(slot)
+        if cached is None or cached[0] != version or cached[1].db is not db:
+            cached = _retrievers[slot] = (version, HybridRetriever(db))
+        return cached[1]
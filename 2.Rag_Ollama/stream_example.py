@@ -1,55 +1,96 @@
 import streamlit as st
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-import subprocess
-import tempfile
-import os
-#THE SAME AS set STREAMLIT_WATCH_DISABLE=true AT COMMAND LINE TO : Streamlit's file watcher tries to inspect all modules to reload them on code change,
-#  PyTorch's internal module torch.classes has a non-standard structure that confuses Streamlit's watcher
-#Result: You see an exception from torch._classes.py, but your app still runs fine
+import time
+from pathlib import Path
+from vector_index import get_or_build_index, index_key
+from corpus import doc_filter, document_id, get_corpus
+from retrieval import get_hybrid_retriever
+from context_builder import DEFAULT_BUDGET, build_context, calibrate, get_token_counter
+from answer_cache import THRESHOLD, get_answer_cache, scope_key
+from chunking import TokenSplitter, embedding_token_counter
+from pdf_pages import iter_pdf_pages
 import sys
-import types
 
-# Fake the torch.classes module path to avoid Streamlit crash
-import torch
-torch.classes.__path__ = types.SimpleNamespace(_path=[])
+# The app folder is not a package; make the repo-level helpers importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.embeddings import DEFAULT_BACKEND, ONNX_FILE, get_embedder, warm_up_in_background
+from shared.llm_backends import LLMError, as_messages, stream
+from shared.metrics import stage
+from shared.streamlit_helpers import (
+    hide_torch_classes, render_cache_stats, render_metrics, render_queue_status, render_stream, use_session_client
+)
 
+# Chunking and embedding settings; chunk sizes are in tokens of the embedding model
+CHUNK_TOKENS = 128
+CHUNK_OVERLAP_TOKENS = 16
+EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+# Deterministic answers, so repeated questions can be served from the LLM cache
+LLM_MODEL = "mistral"
+LLM_TEMPERATURE = 0.0
 
 st.set_page_config(page_title="Local RAG with Ollama", layout="centered")
+# Fair queuing between users of a shared Ollama; interactive requests go first
+use_session_client()
 st.title("📄🔍 RAG App with Local Ollama")
 
-uploaded_file = st.file_uploader("Upload a PDF document", type=["pdf"])
-question = st.text_input("Ask a question about the document:")
-
-if uploaded_file and question:
-    with st.spinner("Processing document and searching for answers..."):
-        # Save PDF temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-            tmp_file.write(uploaded_file.read())
-            tmp_path = tmp_file.name
-
-        # Load and split PDF
-        loader = PyPDFLoader(tmp_path)
-        docs = loader.load()
-        splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        chunks = splitter.split_documents(docs)
-
-        # Embed and store in Chroma
-        embedder = HuggingFaceEmbeddings(
-            model_name='sentence-transformers/all-MiniLM-L6-v2',
-            model_kwargs={'device': 'cuda'},
-            encode_kwargs={'batch_size': 32}
-        )
-        db = Chroma.from_documents(chunks, embedding=embedder)
-
-        # Search similar chunks
-        results = db.similarity_search(question, k=3)
-        context = "\n\n".join([doc.page_content for doc in results])
-
-        # Build prompt
-        rag_prompt = f"""Answer the question based on the context below.
+# torch, langchain and Chroma are imported only by the code paths that need them, so the
+# page renders right away. The embedding model loads once per process on a background
+# thread and is shared by every session; later reruns return immediately.
+warm_up_in_background(EMBEDDING_MODEL, on_ready=hide_torch_classes)
+hide_torch_classes()
+
+# Anything that changes the stored vectors must be part of the index key
+settings = {"chunk_tokens": CHUNK_TOKENS, "chunk_overlap_tokens": CHUNK_OVERLAP_TOKENS,
+            "embedding_model": EMBEDDING_MODEL, "embedding_backend": DEFAULT_BACKEND}
+if DEFAULT_BACKEND == "onnx":
+    # A quantized export embeds differently from the full-precision one
+    settings["onnx_file"] = ONNX_FILE
+
+
+# --- Retrieval settings ---
+st.sidebar.markdown("**🔍 Retrieval**")
+retrieval_mode = st.sidebar.selectbox("Retriever:", ["Hybrid (BM25 + vectors)", "Hybrid + rerank", "Vectors only"])
+dense_weight = st.sidebar.slider("Vector weight (0 = BM25 only):", 0.0, 1.0, 0.5, 0.1,
+                                 disabled=retrieval_mode == "Vectors only")
+context_budget = st.sidebar.slider("Context budget (tokens):", 256, 4096, DEFAULT_BUDGET, 128)
+# Retrieve a few more chunks than fit; the context builder merges, dedupes and packs to the budget
+TOP_K = 8
+
+# --- Answer reuse ---
+st.sidebar.markdown("**♻️ Similar questions**")
+reuse_answers = st.sidebar.checkbox("Reuse answers to similar questions", value=True)
+similarity_threshold = st.sidebar.slider("Minimum similarity:", 0.70, 1.0, THRESHOLD, 0.01,
+                                         disabled=not reuse_answers)
+# Shared by every session; answers are keyed by document fingerprint and question embedding
+answers = get_answer_cache()
+
+
+def load_embedder():
+    # Returns at once if the warm-up finished, else waits for it
+    with st.spinner("Loading embedding model..."):
+        return get_embedder(EMBEDDING_MODEL)
+
+
+def make_splitter(embedder):
+    # Counted with the embedding model's own tokenizer, so no chunk is cut off when embedded
+    return TokenSplitter(CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, count=embedding_token_counter(embedder))
+
+
+def retrieve(db, slot, version, question, where=None):
+    with stage("rag.retrieve", mode=retrieval_mode):
+        if retrieval_mode == "Vectors only":
+            return db.similarity_search(question, k=TOP_K, filter=where)
+        # BM25 catches exact terms (clause numbers, tickers) that vectors blur
+        retriever = get_hybrid_retriever(db, slot, version)
+        return retriever.search(question, k=TOP_K, alpha=dense_weight,
+                                rerank=retrieval_mode == "Hybrid + rerank", where=where)
+
+
+def answer_question(question, results):
+    with stage("rag.context"):
+        context, used, report = build_context(results, LLM_MODEL, budget=context_budget)
+
+    # Build prompt
+    rag_prompt = f"""Answer the question based on the context below.
 
 Context:
 {context}
@@ -58,23 +99,168 @@ Question:
 {question}
 """
 
-        # Run Ollama model locally
-        try:
-            response = subprocess.run(
-                ["ollama", "run", "mistral"],
-                input=rag_prompt.encode(),
-                capture_output=True,
-                timeout=60
-            )
-            answer = response.stdout.decode()
-        except Exception as e:
-            answer = f"Error calling Ollama: {e}"
-
-        # Clean up temp file
-        os.remove(tmp_path)
-
-        st.subheader("📌 Answer:")
-        st.write(answer)
-
-        st.subheader("🔎 Retrieved Context:")
-        st.text(context)
+    # Run Ollama model locally, showing the answer as it is generated
+    stats = {}
+
+    st.subheader("📌 Answer:")
+    placeholder = st.empty()
+    try:
+        answer = render_stream(stream("ollama", as_messages(rag_prompt), LLM_MODEL, LLM_TEMPERATURE, stats=stats),
+                               placeholder)
+    except LLMError as e:
+        answer = None
+        placeholder.error(f"⚠️ Error calling Ollama – {e}")
+
+    # Ollama's own count when the model ran; an estimate when the answer came from the cache
+    if stats.get("prompt_eval_count"):
+        calibrate(LLM_MODEL, rag_prompt, stats["prompt_eval_count"])
+        prompt_tokens = f"{stats['prompt_eval_count']} prompt tokens sent"
+    else:
+        prompt_tokens = f"~{get_token_counter(LLM_MODEL)(rag_prompt)} prompt tokens (cached answer)"
+    st.caption(
+        f"🧮 {prompt_tokens} · context {report['context_tokens']}/{report['budget']} tokens from "
+        f"{report['retrieved_chunks']} chunks: {report['merged_chunks']} merged, "
+        f"{report['duplicates_dropped']} duplicates dropped, {report['over_budget']} over budget"
+    )
+
+    st.subheader("🔎 Retrieved Context:")
+    sources = sorted({f"{doc.metadata.get('source')} p.{doc.metadata.get('page', 0) + 1}"
+                      for doc in used if "doc_id" in doc.metadata})
+    if sources:
+        st.caption("Sources: " + ", ".join(sources))
+    st.text(context)
+    return answer, context, sources
+
+
+def show_reused_answer(question, hit):
+    st.subheader("📌 Answer:")
+    st.markdown(hit["answer"])
+    reused_from = "an earlier run" if hit["question"] == question else f"“{hit['question']}”"
+    st.caption(f"♻️ Reused the answer to {reused_from} (similarity {hit['similarity']:.2f}), "
+               f"saving ~{hit['seconds']:.1f}s")
+    st.button("🔄 Answer this question anew", on_click=st.session_state.update, args=({"fresh_answer": True},))
+
+    st.subheader("🔎 Retrieved Context:")
+    if hit["sources"]:
+        st.caption("Sources: " + ", ".join(hit["sources"]))
+    st.text(hit["context"])
+
+
+def answer_with_reuse(question, fingerprint, open_store):
+    """Show the stored answer to a similar question, or retrieve, generate and store a new one.
+
+    ``open_store()`` returns ``(db, slot, version, where)`` for ``retrieve``;
+    it is only called when no stored answer is close enough.
+    """
+    # Everything besides the question that shapes the answer
+    scope = scope_key(fingerprint, LLM_MODEL, LLM_TEMPERATURE, retrieval_mode, dense_weight, context_budget)
+    reuse = reuse_answers and not st.session_state.pop("fresh_answer", False)
+    # Any widget change reruns the script; only count a question once per session
+    asked = st.session_state.get("last_question") != (scope, question)
+    st.session_state["last_question"] = (scope, question)
+    vector = None
+    if reuse_answers:
+        with stage("rag.answer_lookup") as fields:
+            vector = load_embedder().embed_query(question)
+            hit = answers.lookup(scope, vector, similarity_threshold, record=asked) if reuse else None
+            fields["hit"] = hit is not None
+        if hit:
+            show_reused_answer(question, hit)
+            return
+
+    db, slot, version, where = open_store()
+    start = time.perf_counter()
+    with st.spinner("Searching for answers..."):
+        results = retrieve(db, slot, version, question, where)
+    answer, context, sources = answer_question(question, results)
+    if vector is not None and answer:
+        answers.store(scope, question, vector, answer, context, sources, time.perf_counter() - start)
+
+
+def render_answer_reuse_stats(container):
+    stats = answers.summary()
+    container.markdown("**♻️ Answer reuse**")
+    container.caption(
+        f"{stats['hits']} of {stats['lookups']} questions answered from similar ones "
+        f"(hit rate {stats['hit_rate']:.0%}) · ~{stats['seconds_saved']:.0f}s saved · "
+        f"{stats['entries']} answers stored, {stats['bytes'] / 1024:.0f} KB"
+    )
+
+
+mode = st.radio("Mode:", ["📄 Single document", "📚 Corpus"], horizontal=True)
+
+if mode == "📄 Single document":
+    uploaded_file = st.file_uploader("Upload a PDF document", type=["pdf"])
+    question = st.text_input("Ask a question about the document:")
+
+    if uploaded_file and question:
+        embedder = load_embedder()
+        pdf_bytes = uploaded_file.getvalue()
+        key = index_key(pdf_bytes, settings)
+
+        def load_chunks():
+            # Pages are parsed by a process pool and cached per (file hash, page)
+            bar = st.progress(0.0, text="Reading pages...")
+            with stage("rag.pdf_parse") as fields:
+                pages = list(iter_pdf_pages(pdf_bytes, on_progress=lambda done, total: bar.progress(
+                    done / max(total, 1), text=f"Reading pages: {done}/{total}")))
+                fields["pages"] = len(pages)
+            bar.empty()
+            with stage("rag.split"):
+                return list(make_splitter(embedder).iter_pages(pages, source=uploaded_file.name))
+
+        def open_index():
+            # Reuse the stored index for this PDF + settings, or embed and persist it once
+            with st.spinner("Processing document..."), stage("rag.index") as fields:
+                db, reused = get_or_build_index(pdf_bytes, settings, embedder, load_chunks)
+                fields["reused"] = reused
+            st.caption("♻️ Reused stored index for this document" if reused else "🆕 Document indexed and stored")
+            return db, key, key, None
+
+        # The index key doubles as the document fingerprint for stored answers
+        answer_with_reuse(question, key, open_index)
+
+else:
+    # Many PDFs added over time; only new documents are processed
+    # Browsing the corpus does not wait for the embedding model; adding or asking does
+    corpus = get_corpus(settings, load_embedder)
+    uploads = st.file_uploader("Add PDF documents to the corpus", type=["pdf"], accept_multiple_files=True)
+    new_files = [f for f in uploads or [] if document_id(f.getvalue()) not in corpus]
+
+    if new_files and st.button(f"➕ Add {len(new_files)} new document(s)"):
+        splitter = make_splitter(load_embedder())
+        for f in new_files:
+            bar = st.progress(0.0, text=f"Indexing {f.name}...")
+
+            def show_progress(done, total, bar=bar, name=f.name):
+                bar.progress(done / max(total, 1), text=f"Indexing {name}: page {done}/{total}")
+
+            with stage("corpus.ingest", document=f.name):
+                corpus.add_document(f.name, f.getvalue(), splitter, on_progress=show_progress)
+            bar.empty()
+        st.success(f"Added {len(new_files)} document(s) to the corpus.")
+
+    documents = corpus.documents()
+    with st.expander(f"📚 {len(documents)} document(s) in the corpus"):
+        for doc_id, info in documents.items():
+            cols = st.columns([5, 1])
+            cols[0].markdown(f"**{info['name']}** – {info['pages']} pages, {info['chunks']} chunks")
+            if cols[1].button("🗑 Remove", key=f"remove_{doc_id}"):
+                corpus.remove_document(doc_id)
+                st.rerun()
+
+    selected = st.multiselect("Search only in (empty = whole corpus):", list(documents),
+                              format_func=lambda doc_id: documents[doc_id]["name"])
+    question = st.text_input("Ask a question about the corpus:")
+
+    if question and documents:
+        slot, version = f"corpus:{corpus.path}", tuple(sorted(documents))
+        # Answers stay valid until a document is added or removed, or the selection changes
+        answer_with_reuse(question, (slot, version, sorted(selected)),
+                          lambda: (corpus.db, slot, version, doc_filter(selected)))
+
+# Cache stats and timings (rendered last so they include this run)
+render_queue_status(st.sidebar)
+render_cache_stats(st.sidebar)
+render_answer_reuse_stats(st.sidebar)
+render_metrics(st.sidebar)
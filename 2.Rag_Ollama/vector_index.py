@@ -0,0 +1,110 @@
+"""Persistent, content-addressed Chroma indexes for the RAG app.
+
+Each index lives in its own folder under ``INDEX_ROOT`` named after a hash of
+the document bytes plus the splitter/embedding settings, so re-uploading the
+same PDF (or asking a follow-up question) reopens the stored vectors instead
+of loading, splitting and embedding the document again.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+INDEX_ROOT = Path(os.getenv("RAG_INDEX_DIR", "rag_index"))
+MAX_INDEX_BYTES = int(os.getenv("RAG_INDEX_MAX_MB", "2048")) * 1024 * 1024
+
+# Written last, so a half-built index (crash, Ctrl+C) is never reused.
+READY_MARKER = ".ready"
+# Touched on every open; eviction drops the least recently used index first.
+LAST_USED_MARKER = ".last_used"
+
+# Open Chroma handles shared by every rerun and session in this process.
+_open_indexes = {}
+_registry_lock = threading.Lock()
+
+
+def index_key(data, settings):
+    """Hash of the document bytes + the settings that shape its vectors."""
+    digest = hashlib.sha256(data)
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()[:32]
+
+
+def _index_path(key):
+    return INDEX_ROOT / key
+
+
+def _touch(path):
+    (path / LAST_USED_MARKER).write_text(str(time.time()), encoding="utf-8")
+
+
+def _last_used(path):
+    marker = path / LAST_USED_MARKER
+    return marker.stat().st_mtime if marker.exists() else path.stat().st_mtime
+
+
+def _dir_size(path):
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def open_index(key, embedder):
+    """Reopen a stored index, or return None if it was never (fully) built."""
+    path = _index_path(key)
+    if not (path / READY_MARKER).exists():
+        return None
+    _touch(path)
+    with _registry_lock:
+        if key not in _open_indexes:
+            from langchain_community.vectorstores import Chroma
+
+            _open_indexes[key] = Chroma(persist_directory=str(path), embedding_function=embedder)
+        return _open_indexes[key]
+
+
+def build_index(key, chunks, embedder):
+    path = _index_path(key)
+    # Leftovers from an interrupted build are not trustworthy.
+    shutil.rmtree(path, ignore_errors=True)
+    path.mkdir(parents=True)
+    from langchain_community.vectorstores import Chroma
+
+    db = Chroma.from_documents(chunks, embedding=embedder, persist_directory=str(path))
+    _touch(path)
+    (path / READY_MARKER).write_text("ok", encoding="utf-8")
+    with _registry_lock:
+        _open_indexes[key] = db
+    return db
+
+
+def get_or_build_index(data, settings, embedder, load_chunks):
+    """Return ``(db, reused)``; ``load_chunks()`` only runs on a cache miss."""
+    key = index_key(data, settings)
+    db = open_index(key, embedder)
+    if db is not None:
+        return db, True
+    db = build_index(key, load_chunks(), embedder)
+    evict_indexes(keep=key)
+    return db, False
+
+
+def evict_indexes(max_bytes=MAX_INDEX_BYTES, keep=None):
+    """Delete least recently used indexes until the total fits in ``max_bytes``."""
+    if not INDEX_ROOT.exists():
+        return []
+    entries = [(p, _dir_size(p)) for p in INDEX_ROOT.iterdir() if p.is_dir()]
+    total = sum(size for _, size in entries)
+    evicted = []
+    for path, size in sorted(entries, key=lambda e: _last_used(e[0])):
+        if total <= max_bytes:
+            break
+        if path.name == keep:
+            continue
+        with _registry_lock:
+            _open_indexes.pop(path.name, None)
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        evicted.append(path.name)
+    return evicted
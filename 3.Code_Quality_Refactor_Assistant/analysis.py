@@ -0,0 +1,179 @@
+"""Prompts and execution strategies for the "Analyze & Refactor" step.
+
+Two modes are offered:
+
+* concurrent: the five review prompts are independent, so they are dispatched
+  together on a worker pool instead of one after another. The per-backend
+  concurrency limit in ``shared/llm_backends.py`` is shared by every session
+  of the process, so a busy box queues requests instead of overloading Ollama
+  or hitting OpenAI rate limits.
+* structured: one request asks for a JSON document holding all five sections,
+  so large inputs are sent (and prefilled) once instead of five times. Fields
+  that fail validation are re-requested on their own.
+"""
+import json
+import contextvars
+import os
+import queue
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+# Section name -> prompt template, in display order. ``{facts}`` is the
+# deterministic static-analysis report: the LLM explains it instead of guessing.
+PROMPTS = {
+    "score": "Rate the following Python code from 1–10 based on readability, structure, and best practices. Return just a number.\n\n{facts}\n\n{code}",
+    "feedback": "Give a detailed list of improvements for the following Python code.\n\n{facts}\n\n{code}",
+    "refactored_code": "Refactor the following Python code for clarity, simplicity, and Python best practices:\n\n{facts}\n\n{code}",
+    "code_smells": "Static analysis already found the smells listed below. Explain why each one matters and how to fix it, then mention any design-level smells or anti-patterns it cannot detect.\n\n{facts}\n\n{code}",
+    "complexity": "The cyclomatic complexity of this Python code was measured below. Do not recompute it; explain what the numbers mean for this code and which functions to simplify first.\n\n{facts}\n\n{code}",
+}
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("ANALYSIS_WORKERS", "16")), thread_name_prefix="analysis")
+
+
+def build_prompts(code, facts=""):
+    return {name: template.format(code=code, facts=facts) for name, template in PROMPTS.items()}
+
+
+def stream_analysis(code, stream_llm, facts=""):
+    """Run every prompt concurrently and yield ``(section, token)`` pairs as they arrive.
+
+    ``stream_llm(prompt)`` must yield the answer's tokens (a single token is
+    fine for non-streaming backends). A ``(section, None)`` pair marks that
+    section as finished. Iterate from the Streamlit script thread: workers
+    never touch the UI, they only feed the queue.
+    """
+    events = queue.Queue()
+
+    def work(section, prompt):
+        try:
+            for token in stream_llm(prompt):
+                events.put((section, token))
+        except Exception as e:
+            events.put((section, f"[Error: {e}]"))
+        finally:
+            events.put((section, None))
+
+    prompts = build_prompts(code, facts)
+    for section, prompt in prompts.items():
+        # Each worker keeps the session's user and priority for the LLM queue
+        _executor.submit(contextvars.copy_context().run, work, section, prompt)
+
+    remaining = len(prompts)
+    while remaining:
+        section, token = events.get()
+        if token is None:
+            remaining -= 1
+        yield section, token
+
+
+# === STRUCTURED (SINGLE REQUEST) MODE ===
+FIELD_DESCRIPTIONS = {
+    "score": "integer from 1 to 10 rating readability, structure, and best practices",
+    "feedback": "markdown string with a detailed list of improvements",
+    "refactored_code": "string with the full refactored code, for clarity, simplicity, and Python best practices (no markdown fences)",
+    "code_smells": "markdown string explaining the detected smells and any design-level anti-patterns",
+    "complexity": "markdown string explaining the measured cyclomatic complexity (do not recompute it)",
+}
+
+FIELD_SCHEMAS = {
+    "score": {"type": "integer", "minimum": 1, "maximum": 10},
+    "feedback": {"type": "string"},
+    "refactored_code": {"type": "string"},
+    "code_smells": {"type": "string"},
+    "complexity": {"type": "string"},
+}
+
+# Stands in for a section the model never answered validly
+INVALID_FIELD = "[Error: the model did not return a valid value for this section]"
+
+STRUCTURED_PROMPT = """Review the following Python code. Answer with one JSON object and nothing else, with exactly these keys:
+{fields}
+
+{facts}
+
+Code:
+{code}"""
+
+
+def build_structured_prompt(code, fields=None, facts=""):
+    fields = fields or list(FIELD_DESCRIPTIONS)
+    described = "\n".join(f'- "{name}": {FIELD_DESCRIPTIONS[name]}' for name in fields)
+    return STRUCTURED_PROMPT.format(fields=described, facts=facts, code=code)
+
+
+def response_schema(fields=None):
+    """JSON schema for an answer holding ``fields``; Ollama uses it to constrain generation."""
+    fields = fields or list(FIELD_SCHEMAS)
+    return {
+        "type": "object",
+        "properties": {name: FIELD_SCHEMAS[name] for name in fields},
+        "required": list(fields),
+    }
+
+
+def _extract_json(text):
+    """Parse the first JSON object in ``text``, tolerating code fences and chatter."""
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip())
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return {}
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _validate_field(name, value):
+    """Return the cleaned value, or None if it does not match the schema."""
+    if name == "score":
+        # JSON true is an int to Python; 1e999 parses as inf
+        if isinstance(value, bool):
+            return None
+        try:
+            number = float(value)
+            score = int(number)
+        except (TypeError, ValueError, OverflowError):
+            return None
+        return str(score) if number.is_integer() and 1 <= score <= 10 else None
+    if isinstance(value, str) and value.strip():
+        return value.strip()
+    return None
+
+
+def parse_structured(text, fields=None):
+    """Return ``(valid_fields, failed_field_names)`` for one JSON answer."""
+    data = _extract_json(text)
+    valid, failed = {}, []
+    for name in fields or FIELD_DESCRIPTIONS:
+        value = _validate_field(name, data.get(name))
+        if value is None:
+            failed.append(name)
+        else:
+            valid[name] = value
+    return valid, failed
+
+
+def structured_analysis(code, ask_json, facts="", max_retries=1):
+    """Run the whole review as one JSON request.
+
+    ``ask_json(prompt, schema)`` returns the model's raw text answer. Fields that are
+    missing or invalid are re-requested (only those fields) up to
+    ``max_retries`` times; anything still failing is reported in its section.
+    """
+    results, failed = parse_structured(ask_json(build_structured_prompt(code, facts=facts), response_schema()))
+    for _ in range(max_retries):
+        if not failed:
+            break
+        prompt = build_structured_prompt(code, failed, facts)
+        retry, failed = parse_structured(ask_json(prompt, response_schema(failed)), failed)
+        results.update(retry)
+    for name in failed:
+        results[name] = INVALID_FIELD
+    return results
+
+
+def invalid_fields(results):
+    """Names of the sections ``structured_analysis`` could not fill."""
+    return [name for name, value in results.items() if value == INVALID_FIELD]
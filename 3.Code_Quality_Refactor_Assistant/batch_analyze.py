@@ -0,0 +1,333 @@
+"""Headless batch / CI mode for the Code Quality Assistant.
+
+Walks a repository, runs the static analysis engine on every Python file
+across a process pool, optionally reviews each file with an LLM (large files
+are split at function/class boundaries, with a bounded number of requests in
+flight) and writes a JSON report plus an optional SARIF file for code-scanning
+tools. Runs are incremental: files whose content hash matches the previous
+JSON report are copied over instead of being analyzed again.
+
+Usage:
+    python batch_analyze.py path/to/repo                          # static + Ollama review
+    python batch_analyze.py path/to/repo --backend none           # static analysis only
+    python batch_analyze.py . --sarif quality.sarif --fail-over-complexity 15
+"""
+import argparse
+import ast
+import fnmatch
+import hashlib
+import json
+import os
+import sys
+import textwrap
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+# The app folder is not a package; make the repo-level helpers importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.code_analysis import analyze_code, format_facts
+from shared.llm_backends import LLMError, as_messages, complete, get_backend, set_client
+from analysis import invalid_fields, structured_analysis
+
+REPORT_VERSION = 1
+SKIP_DIRS = {".git", ".hg", ".svn", "__pycache__", ".venv", "venv", "env", "node_modules",
+             ".tox", ".nox", ".mypy_cache", ".pytest_cache", "build", "dist", "site-packages"}
+
+
+# === DISCOVERY ===
+def find_python_files(root, excludes):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS and not d.endswith(".egg-info")]
+        for name in filenames:
+            if not name.endswith(".py"):
+                continue
+            rel = Path(dirpath, name).relative_to(root).as_posix()
+            if any(fnmatch.fnmatch(rel, pattern) for pattern in excludes):
+                continue
+            yield rel
+
+
+# === SPLITTING ===
+def _node_start(node):
+    # Decorators belong to the definition they decorate
+    decorators = getattr(node, "decorator_list", [])
+    return min([d.lineno for d in decorators] + [node.lineno])
+
+
+def split_units(source, max_lines):
+    """Split source into chunks of at most ``max_lines`` at top-level boundaries.
+
+    Oversized classes are split further by method; a single function longer
+    than the limit is kept whole. Returns ``[(first_line, last_line, text)]``.
+    """
+    lines = source.splitlines()
+    if len(lines) <= max_lines:
+        return [(1, len(lines), source)]
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return [(1, len(lines), source)]
+
+    spans = []
+    for node in tree.body:
+        start, end = _node_start(node), node.end_lineno
+        if isinstance(node, ast.ClassDef) and end - start + 1 > max_lines:
+            header_end = node.body[0].lineno - 1 if node.body else end
+            spans.append((start, max(start, header_end)))
+            spans.extend((_node_start(child), child.end_lineno) for child in node.body)
+        else:
+            spans.append((start, end))
+
+    chunks, chunk_start, chunk_end = [], None, None
+    for start, end in spans:
+        if chunk_start is not None and end - chunk_start + 1 > max_lines:
+            chunks.append((chunk_start, chunk_end))
+            chunk_start = None
+        if chunk_start is None:
+            chunk_start = start
+        chunk_end = end
+    if chunk_start is not None:
+        chunks.append((chunk_start, chunk_end))
+
+    # Lines between spans (comments, blank lines) go with the following chunk
+    units = []
+    for i, (start, end) in enumerate(chunks):
+        first = 1 if i == 0 else chunks[i - 1][1] + 1
+        last = len(lines) if i == len(chunks) - 1 else end
+        units.append((first, last, textwrap.dedent("\n".join(lines[first - 1:last]))))
+    return units
+
+
+# === STATIC ANALYSIS (process pool) ===
+def analyze_file(root, rel, max_lines):
+    start = time.perf_counter()
+    data = Path(root, rel).read_bytes()
+    source = data.decode("utf-8", errors="replace")
+    report = analyze_code(source)
+    units = split_units(source, max_lines)
+    return {
+        "path": rel,
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "static_analysis": report,
+        "units": units,
+        "static_s": round(time.perf_counter() - start, 4),
+    }
+
+
+def _facts_for_unit(report, first, last):
+    """Restrict a file report to one chunk's line range."""
+    if report["syntax_error"]:
+        return format_facts(report)
+    functions = [f for f in report["functions"] if first <= f["line"] <= last]
+    complexities = [f["complexity"] for f in functions]
+    unit_report = {
+        "syntax_error": None,
+        "summary": {
+            "lines": last - first + 1,
+            "functions": len(functions),
+            "classes": report["summary"]["classes"],
+            "max_complexity": max(complexities, default=0),
+            "average_complexity": round(sum(complexities) / len(complexities), 2) if complexities else 0,
+        },
+        "functions": functions,
+        "smells": [s for s in report["smells"] if first <= s["line"] <= last],
+    }
+    return format_facts(unit_report)
+
+
+# === LLM REVIEW (bounded concurrency) ===
+SYSTEM_PROMPT = "You are a senior Python engineer helping improve code."
+
+
+def make_ask_json(backend, model, temperature):
+    def ask_json(prompt, schema):
+        # Ollama can constrain its output to the schema; GPT-4 follows the prompt
+        return complete(backend, as_messages(prompt, SYSTEM_PROMPT), model, temperature,
+                        format=schema if backend == "ollama" else None)
+    return ask_json
+
+
+def review_units(files, ask_json, concurrency):
+    """LLM-review every chunk of every file with ``concurrency`` worker threads.
+
+    The backend's own limit decides how many requests are really in flight;
+    a chunk whose request fails gets an ``error`` entry, one with sections the
+    model never answered validly an ``invalid_fields`` list; both are retried
+    next run.
+    """
+    jobs = [(entry, i, unit) for entry in files for i, unit in enumerate(entry["units"])]
+    results = {}
+    lock = threading.Lock()
+
+    def work(job):
+        entry, index, (first, last, text) = job
+        start = time.perf_counter()
+        facts = _facts_for_unit(entry["static_analysis"], first, last)
+        try:
+            review = structured_analysis(text, ask_json, facts=facts)
+            invalid = invalid_fields(review)
+            if invalid:
+                review["invalid_fields"] = invalid
+        except LLMError as e:
+            review = {"error": str(e)}
+        review.update(first_line=first, last_line=last, llm_s=round(time.perf_counter() - start, 3))
+        with lock:
+            results.setdefault(entry["path"], {})[index] = review
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="llm") as pool:
+        for done, _ in enumerate(pool.map(work, jobs), start=1):
+            if done % 10 == 0 or done == len(jobs):
+                print(f"  reviewed {done}/{len(jobs)} chunks", file=sys.stderr)
+    return {path: [reviews[i] for i in sorted(reviews)] for path, reviews in results.items()}
+
+
+# === REPORTS ===
+def load_previous(path, config):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    # Different backend/model/settings: nothing from the old run can be reused
+    if previous.get("version") != REPORT_VERSION or previous.get("config") != config:
+        return {}
+    return previous.get("files", {})
+
+
+def to_sarif(report):
+    rules, results = {}, []
+    for path, entry in sorted(report["files"].items()):
+        static = entry["static_analysis"]
+        if static["syntax_error"]:
+            rules.setdefault("syntax_error", {"id": "syntax_error", "shortDescription": {"text": "syntax error"}})
+            results.append({
+                "ruleId": "syntax_error",
+                "level": "error",
+                "message": {"text": static["syntax_error"]},
+                "locations": [{"physicalLocation": {"artifactLocation": {"uri": path}}}],
+            })
+        for smell in static["smells"]:
+            rules.setdefault(smell["kind"], {
+                "id": smell["kind"],
+                "shortDescription": {"text": smell["kind"].replace("_", " ")},
+            })
+            results.append({
+                "ruleId": smell["kind"],
+                "level": "warning",
+                "message": {"text": smell["message"]},
+                "locations": [{"physicalLocation": {
+                    "artifactLocation": {"uri": path},
+                    "region": {"startLine": smell["line"]},
+                }}],
+            })
+    return {
+        "$schema": "https://json.schemastore.org/sarif-2.1.0.json",
+        "version": "2.1.0",
+        "runs": [{
+            "tool": {"driver": {"name": "code-quality-assistant", "rules": list(rules.values())}},
+            "results": results,
+        }],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", help="Repository to analyze")
+    parser.add_argument("--backend", choices=["ollama", "openai", "none"], default="ollama",
+                        help="LLM used for the prose review; 'none' runs static analysis only")
+    parser.add_argument("--model", help="Model name (default: codellama for Ollama, gpt-4 for OpenAI)")
+    parser.add_argument("--temperature", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Static analysis processes")
+    parser.add_argument("--llm-concurrency", type=int,
+                        help="Max LLM requests in flight (default: OLLAMA_MAX_CONCURRENCY / OPENAI_MAX_CONCURRENCY)")
+    parser.add_argument("--max-chunk-lines", type=int, default=400, help="Split files larger than this")
+    parser.add_argument("--exclude", action="append", default=[], help="Glob of paths to skip (repeatable)")
+    parser.add_argument("--json", default="quality_report.json", help="JSON report; also the incremental state")
+    parser.add_argument("--sarif", help="Also write a SARIF 2.1.0 file here")
+    parser.add_argument("--full", action="store_true", help="Ignore the previous report and analyze everything")
+    parser.add_argument("--fail-over-complexity", type=int,
+                        help="Exit with status 1 if any function is more complex than this")
+    args = parser.parse_args()
+
+    root = Path(args.root).resolve()
+    model = args.model or {"ollama": "codellama", "openai": "gpt-4"}.get(args.backend)
+    config = {"backend": args.backend, "model": model, "temperature": args.temperature,
+              "max_chunk_lines": args.max_chunk_lines}
+    previous = {} if args.full else load_previous(args.json, config)
+
+    started = time.perf_counter()
+    paths = sorted(find_python_files(root, args.exclude))
+
+    # Hash first (cheap) so unchanged files skip both static analysis and the LLM
+    changed, files = [], {}
+    for rel in paths:
+        digest = hashlib.sha256(Path(root, rel).read_bytes()).hexdigest()
+        failed = any("error" in review or "invalid_fields" in review
+                     for review in previous.get(rel, {}).get("llm_review", []))
+        if rel in previous and previous[rel]["sha256"] == digest and not failed:
+            files[rel] = {**previous[rel], "reused": True}
+        else:
+            changed.append(rel)
+    print(f"{len(paths)} Python files, {len(changed)} new or changed", file=sys.stderr)
+
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        analyzed = list(pool.map(analyze_file, [root] * len(changed), changed,
+                                 [args.max_chunk_lines] * len(changed), chunksize=16))
+
+    reviews = {}
+    if args.backend != "none" and analyzed:
+        llm_backend = get_backend(args.backend)
+        # CI runs queue behind interactive requests on a shared Ollama host
+        set_client(priority="batch", process_wide=True)
+        if args.llm_concurrency:
+            llm_backend.set_max_concurrency(max(1, args.llm_concurrency))
+        reviews = review_units(analyzed, make_ask_json(args.backend, model, args.temperature),
+                               llm_backend.max_concurrency)
+
+    for entry in analyzed:
+        units = entry.pop("units")
+        llm = reviews.get(entry["path"], [])
+        llm_s = round(sum(r["llm_s"] for r in llm), 3)
+        files[entry["path"]] = {
+            "sha256": entry["sha256"],
+            "static_analysis": entry["static_analysis"],
+            "llm_review": llm,
+            "chunks": len(units),
+            "timing": {"static_s": entry["static_s"], "llm_s": llm_s,
+                       "total_s": round(entry["static_s"] + llm_s, 3)},
+            "reused": False,
+        }
+
+    all_functions = [f for entry in files.values() for f in entry["static_analysis"]["functions"]]
+    report = {
+        "version": REPORT_VERSION,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "config": config,
+        "summary": {
+            "files": len(files),
+            "analyzed": len(analyzed),
+            "reused": len(files) - len(analyzed),
+            "syntax_errors": sum(1 for e in files.values() if e["static_analysis"]["syntax_error"]),
+            "smells": sum(len(e["static_analysis"]["smells"]) for e in files.values()),
+            "max_complexity": max((f["complexity"] for f in all_functions), default=0),
+            "wall_s": round(time.perf_counter() - started, 3),
+        },
+        "files": dict(sorted(files.items())),
+    }
+
+    with open(args.json, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    if args.sarif:
+        with open(args.sarif, "w", encoding="utf-8") as f:
+            json.dump(to_sarif(report), f, indent=2)
+    print(json.dumps(report["summary"]), file=sys.stderr)
+
+    if args.fail_over_complexity is not None and report["summary"]["max_complexity"] > args.fail_over_complexity:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,30 @@
 import streamlit as st
-import subprocess
-import openai
-import os
-import pyperclip
+import sys
+import time
 from datetime import datetime
-import json
+from pathlib import Path
+
+# The app folder is not a package; make the repo-level helpers importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.code_analysis import analyze_code, format_facts
+from shared.llm_backends import LLMError, as_messages, complete, stream
+from shared.metrics import stage
+from shared.session_store import get_session_store
+from shared.streamlit_helpers import (
+    REDRAW_INTERVAL, render_cache_stats, render_metrics, render_queue_status, render_session_picker,
+    use_session_client
+)
+from analysis import stream_analysis, structured_analysis
 
 # === PAGE CONFIG ===
 st.set_page_config(page_title="🧼 Code Quality Assistant", layout="centered")
+# Fair queuing between users of a shared Ollama; analyses yield to interactive completions and chat
+use_session_client("batch")
 st.title("🧪 Code Quality & Refactor Assistant")
 
-# === SESSION PATH ===
-session_dir = "quality_sessions"
-os.makedirs(session_dir, exist_ok=True)
+# === SESSION STORE ===
+# Indexed SQLite store in quality_sessions/; older per-session JSON files there are imported once
+sessions = get_session_store("quality_sessions", text_fields=("code_input", "refactored_code", "feedback", "code_smells"))
 
 # === MODEL SETTINGS ===
 model_mode = st.selectbox("Choose model backend:", ["Ollama (local)", "OpenAI GPT-4"])
@@ -20,20 +32,23 @@ ollama_model = None
 if model_mode == "Ollama (local)":
     ollama_model = st.selectbox("Select Ollama model:", ["codellama", "deepseek-coder", "codegemma"])
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
 temperature = st.slider("Creativity (temperature):", 0.0, 1.0, 0.3, 0.1)
+analysis_mode = st.radio(
+    "Analysis mode:", ["⚡ Five parallel prompts", "📦 Single JSON request"], horizontal=True,
+    help="The single request sends your code once instead of five times – cheaper and faster on large files."
+)
 
 # === LOAD SESSION ===
-load_file = st.selectbox("📂 Load a previous session:", ["None"] + os.listdir(session_dir))
-if load_file != "None":
-    with open(os.path.join(session_dir, load_file), "r", encoding="utf-8") as f:
-        saved = json.load(f)
-        code_input = saved.get("code_input", "")
-        st.session_state["last_refactored"] = saved.get("refactored_code", "")
-        st.session_state["last_feedback"] = saved.get("feedback", "")
-        st.session_state["last_score"] = saved.get("score", "")
-        st.session_state["last_smells"] = saved.get("code_smells", "")
-        st.session_state["last_complexity"] = saved.get("complexity", "")
+load_file = render_session_picker(st, sessions, label="📂 Load a previous session:")
+saved = sessions.load(load_file) if load_file is not None else None
+if saved:
+    code_input = saved.get("code_input", "")
+    st.session_state["last_refactored"] = saved.get("refactored_code", "")
+    st.session_state["last_feedback"] = saved.get("feedback", "")
+    st.session_state["last_score"] = saved.get("score", "")
+    st.session_state["last_smells"] = saved.get("code_smells", "")
+    st.session_state["last_complexity"] = saved.get("complexity", "")
+    st.session_state["last_static"] = saved.get("static_analysis")
 else:
     code_input = ""
 
@@ -41,56 +56,75 @@ else:
 code_input = st.text_area("Paste your Python code:", value=code_input, height=300, placeholder="def calculate_tax(income):\n    ...")
 
 # === HELPERS ===
-def run_ollama(prompt, model):
-    try:
-        result = subprocess.run(["ollama", "run", model], input=prompt.encode(), capture_output=True, timeout=180)
-        return result.stdout.decode().strip() or result.stderr.decode().strip()
-    except Exception as e:
-        return f"[Ollama error: {e}]"
-
-def run_openai(prompt):
-    try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a senior Python engineer helping improve code."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=temperature
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        return f"[OpenAI error: {e}]"
-
-def ask_llm(prompt):
-    if model_mode == "OpenAI GPT-4":
-        return run_openai(prompt)
-    elif model_mode == "Ollama (local)":
-        return run_ollama(prompt, model=ollama_model)
+backend = "openai" if model_mode == "OpenAI GPT-4" else "ollama"
+model = ollama_model or "gpt-4"
+SYSTEM_PROMPT = "You are a senior Python engineer helping improve code."
+
+def ask_llm(prompt, schema=None):
+    # Ollama can constrain its output to a JSON schema; GPT-4 follows the prompt
+    return complete(backend, as_messages(prompt, SYSTEM_PROMPT), model, temperature,
+                    format=schema if backend == "ollama" else None)
+
+def stream_llm(prompt):
+    # Called from analysis worker threads: no Streamlit calls in here
+    yield from stream(backend, as_messages(prompt, SYSTEM_PROMPT), model, temperature)
+
+# Analysis section -> (title, session_state key), in display order
+SECTIONS = {
+    "score": ("📊 Code Quality Score", "last_score"),
+    "feedback": ("🧠 LLM Feedback", "last_feedback"),
+    "code_smells": ("🧱 Code Smells", "last_smells"),
+    "complexity": ("🧮 Complexity Estimate", "last_complexity"),
+    "refactored_code": ("🧼 Refactored Code", "last_refactored"),
+}
 
 # === ANALYZE BUTTON ===
 if st.button("🧠 Analyze & Refactor") and code_input.strip():
-    with st.spinner("Scoring and reviewing code..."):
-        score_prompt = f"Rate the following Python code from 1–10 based on readability, structure, and best practices. Return just a number.\n\n{code_input}"
-        score = ask_llm(score_prompt)
-
-        feedback_prompt = f"Give a detailed list of improvements for the following Python code.\n\n{code_input}"
-        feedback = ask_llm(feedback_prompt)
-
-        refactor_prompt = f"Refactor the following Python code for clarity, simplicity, and Python best practices:\n\n{code_input}"
-        refactored_code = ask_llm(refactor_prompt)
-
-        smells_prompt = f"Detect any code smells or anti-patterns in this code and explain.\n\n{code_input}"
-        code_smells = ask_llm(smells_prompt)
-
-        complexity_prompt = f"Estimate the cyclomatic complexity of this Python code and explain.\n\n{code_input}"
-        complexity = ask_llm(complexity_prompt)
-
-        st.session_state["last_score"] = score
-        st.session_state["last_feedback"] = feedback
-        st.session_state["last_refactored"] = refactored_code
-        st.session_state["last_smells"] = code_smells
-        st.session_state["last_complexity"] = complexity
+    # Exact metrics and smells come from the ast engine; the LLM only explains them
+    with stage("quality.static_analysis", lines=code_input.count("\n") + 1):
+        static_report = analyze_code(code_input)
+    st.session_state["last_static"] = static_report
+    facts = format_facts(static_report)
+
+    if analysis_mode == "📦 Single JSON request":
+        with st.spinner("Reviewing code in a single request..."):
+            try:
+                results = structured_analysis(code_input, ask_llm, facts=facts)
+            except LLMError as e:
+                st.error(f"⚠️ The review request failed – {e}")
+                results = None
+        if results:
+            for section, (_, key) in SECTIONS.items():
+                st.session_state[key] = results[section]
+    else:
+        with st.spinner("Scoring and reviewing code..."):
+            # All five prompts run at once; each box fills in as its own answer streams back
+            live = st.empty()
+            boxes = {}
+            with live.container():
+                for section, (title, _) in SECTIONS.items():
+                    st.markdown(f"**{title}**")
+                    boxes[section] = st.empty()
+            texts = {section: "" for section in SECTIONS}
+            last_draw = {section: 0.0 for section in SECTIONS}
+
+            for section, token in stream_analysis(code_input, stream_llm, facts=facts):
+                done = token is None
+                if not done:
+                    texts[section] += token
+                # Throttle redraws while tokens stream in
+                if done or time.monotonic() - last_draw[section] >= REDRAW_INTERVAL:
+                    shown = texts[section] if done else texts[section] + "▌"
+                    if section == "refactored_code":
+                        boxes[section].code(shown, language="python")
+                    else:
+                        boxes[section].markdown(shown)
+                    last_draw[section] = time.monotonic()
+
+            live.empty()
+
+            for section, (_, key) in SECTIONS.items():
+                st.session_state[key] = texts[section].strip()
 
 # === DISPLAY RESULTS IF AVAILABLE ===
 if "last_score" in st.session_state:
@@ -100,6 +134,22 @@ if "last_score" in st.session_state:
     st.subheader("🧠 LLM Feedback")
     st.markdown(st.session_state["last_feedback"])
 
+    static_report = st.session_state.get("last_static")
+    if static_report:
+        st.subheader("🔬 Static Analysis")
+        if static_report["syntax_error"]:
+            st.error(f"Code does not parse: {static_report['syntax_error']}")
+        else:
+            summary = static_report["summary"]
+            cols = st.columns(3)
+            cols[0].metric("Max complexity", summary["max_complexity"])
+            cols[1].metric("Max nesting", summary["max_nesting"])
+            cols[2].metric("Smells", summary["smells"])
+            if static_report["functions"]:
+                st.table(static_report["functions"])
+            for smell in static_report["smells"]:
+                st.markdown(f"- line {smell['line']}: {smell['message']}")
+
     st.subheader("🧱 Code Smells")
     st.markdown(st.session_state["last_smells"])
 
@@ -111,6 +161,7 @@ if "last_score" in st.session_state:
 
     if st.button("📋 Copy Refactored Code"):
         try:
+            import pyperclip
             pyperclip.copy(st.session_state["last_refactored"])
             st.success("Copied to clipboard!")
         except:
@@ -129,9 +180,13 @@ if "last_score" in st.session_state:
             "feedback": st.session_state["last_feedback"],
             "refactored_code": st.session_state["last_refactored"],
             "code_smells": st.session_state["last_smells"],
-            "complexity": st.session_state["last_complexity"]
+            "complexity": st.session_state["last_complexity"],
+            "static_analysis": st.session_state.get("last_static")
         }
-        session_file = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(os.path.join(session_dir, session_file), "w", encoding="utf-8") as f:
-            json.dump(session_data, f, indent=2)
+        session_file = sessions.save(session_data)
         st.success(f"Session saved: {session_file}")
+
+# === CACHE STATS & TIMINGS (rendered last so they include this run) ===
+render_queue_status(st.sidebar)
+render_cache_stats(st.sidebar)
+render_metrics(st.sidebar)
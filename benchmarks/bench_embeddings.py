@@ -0,0 +1,116 @@
+"""Embedding throughput benchmark: chunks/sec per device, backend and worker count.
+
+Usage:
+    python benchmarks/bench_embeddings.py                       # synthetic chunks
+    python benchmarks/bench_embeddings.py --pdf report.pdf      # real chunks from a PDF
+    python benchmarks/bench_embeddings.py --backends torch onnx --workers 1 4 8
+
+Use the numbers to size CPU nodes for bulk ingestion.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import shared.embeddings as embeddings
+
+WORDS = ("contract clause liability payment term party risk revenue filing "
+         "statute agreement notice default interest market asset exposure").split()
+
+
+def synthetic_chunks(count, chunk_size):
+    rng = random.Random(0)
+    chunks = []
+    for _ in range(count):
+        # Vary lengths like a real splitter does (short tails, full chunks)
+        target = rng.randint(chunk_size // 4, chunk_size)
+        text = ""
+        while len(text) < target:
+            text += rng.choice(WORDS) + " "
+        chunks.append(text[:target])
+    return chunks
+
+
+def pdf_chunks(path, chunk_size, chunk_overlap):
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    docs = PyPDFLoader(path).load()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return [c.page_content for c in splitter.split_documents(docs)]
+
+
+def run_config(texts, model, device, backend, workers, parallel, repeats):
+    os.environ["EMBEDDING_PARALLEL"] = parallel
+    embeddings.PARALLEL_MODE = parallel
+    start = time.perf_counter()
+    embedder = embeddings.LocalEmbeddings(model, device=device, backend=backend, workers=workers)
+    load_s = time.perf_counter() - start
+    embedder.embed_documents(texts[:32])  # warm-up
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        embedder.embed_documents(texts)
+        timings.append(time.perf_counter() - start)
+    embedder.close()
+    best = min(timings)
+    return {
+        "device": device,
+        "backend": backend,
+        "workers": workers,
+        "parallel": parallel if workers > 1 else "none",
+        "load_s": round(load_s, 2),
+        "best_s": round(best, 3),
+        "chunks_per_s": round(len(texts) / best, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", help="Benchmark on chunks from this PDF instead of synthetic text")
+    parser.add_argument("--chunks", type=int, default=2000, help="Synthetic chunk count")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--model", default=embeddings.DEFAULT_MODEL)
+    parser.add_argument("--devices", nargs="+", default=[embeddings.select_device()])
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx"])
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, max(1, (os.cpu_count() or 1) // 2)])
+    parser.add_argument("--parallel", nargs="+", default=["thread", "process"], choices=["thread", "process"])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    if args.pdf:
+        texts = pdf_chunks(args.pdf, args.chunk_size, args.chunk_overlap)
+    else:
+        texts = synthetic_chunks(args.chunks, args.chunk_size)
+    print(f"{len(texts)} chunks, model {args.model}")
+
+    results = []
+    for device in args.devices:
+        for backend in args.backends:
+            for workers in sorted(set(args.workers)):
+                # Parallel modes only apply to multi-worker CPU runs
+                modes = args.parallel if device == "cpu" and workers > 1 else ["thread"]
+                for parallel in modes:
+                    try:
+                        result = run_config(texts, args.model, device, backend, workers, parallel, args.repeats)
+                    except Exception as e:
+                        print(f"  skipped {device}/{backend}/{workers}/{parallel}: {e}")
+                        continue
+                    results.append(result)
+                    print(f"  {device:5} {backend:6} workers={workers:<3} {result['parallel']:8} "
+                          f"{result['chunks_per_s']:>9} chunks/s  (load {result['load_s']}s)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"chunks": len(texts), "model": args.model, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
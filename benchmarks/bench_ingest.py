@@ -0,0 +1,161 @@
+"""Ingestion throughput of the RAG app: PDF text extraction and chunking.
+
+Extraction of one PDF (a synthetic 1,000-page filing by default, or --pdf):
+    pypdf      one process, page after page (what PyPDFLoader(...).load() does)
+    parallel   pdf_pages.extract_pages over N worker processes, page cache off
+    cached     the same file again, served from the per-page cache
+Chunking of the extracted pages:
+    chars      RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50), if langchain is installed
+    tokens     chunking.TokenSplitter (token counts from --tokenizer, else estimated)
+
+Usage:
+    python benchmarks/bench_ingest.py
+    python benchmarks/bench_ingest.py --pages 300 --workers 2 4 8
+    python benchmarks/bench_ingest.py --pdf filing.pdf --tokenizer sentence-transformers/all-MiniLM-L6-v2
+
+Reports seconds and pages/s per stage, and chunk count and token sizes per
+splitter (chunks over the embedding model's 256-token limit are truncated
+when embedded). Only pypdf is required.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT / "2.Rag_Ollama"))
+from chunking import TokenSplitter, estimate_tokens, tokenizer_counter
+from pdf_pages import PageCache, extract_pages, extract_range, file_hash, page_count
+
+WORDS = ("revenue margin liquidity counterparty exposure covenant impairment goodwill derivative hedge "
+         "obligation lease segment backlog tariff supplier litigation regulatory capital dividend").split()
+MODEL_LIMIT = 256
+
+
+def _sentence(i):
+    words = [WORDS[(i * 7 + j * 3) % len(WORDS)] for j in range(8 + i % 9)]
+    return f"The {' '.join(words)} changed by {i % 97}.{i % 10}% in fiscal {2000 + i % 25}."
+
+
+def make_pdf(path, pages, lines_per_page=48):
+    """Write a text-only PDF that looks like a filing: sections, paragraphs, wrapped lines."""
+    def escape(text):
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids, n = [], 0
+    for page in range(pages):
+        lines = []
+        if page % 5 == 0:
+            lines += [f"ITEM {page // 5 + 1}. RISK FACTORS AND MARKET CONDITIONS {page // 5 + 1}", ""]
+        text = ""
+        while len(lines) < lines_per_page:
+            text += _sentence(n) + " "
+            n += 1
+            if len(text) > 95:
+                lines.append(text[:95].rsplit(" ", 1)[0])
+                text = text[len(lines[-1]) + 1:]
+            if n % 6 == 0:
+                lines += [text.strip(), ""] if text.strip() else [""]
+                text = ""
+        stream = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({escape(line)}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {len(objects)} 0 R "
+                       f"/Resources << /Font << /F1 3 0 R >> >> >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    Path(path).write_bytes(bytes(out))
+
+
+def timed(label, run, pages, report):
+    start = time.perf_counter()
+    result = run()
+    seconds = time.perf_counter() - start
+    report[label] = {"seconds": seconds, "pages_per_second": pages / seconds}
+    print(f"{label:14} {seconds:8.2f}s  {pages / seconds:9.0f} pages/s")
+    return result
+
+
+def chunk_stats(label, chunks, count, report):
+    sizes = count(chunks)
+    over = sum(size > MODEL_LIMIT for size in sizes)
+    report[label] = {"chunks": len(chunks), "mean_tokens": statistics.mean(sizes), "max_tokens": max(sizes),
+                     "over_limit": over}
+    print(f"{label:14} {len(chunks):7} chunks  {statistics.mean(sizes):6.0f} mean / {max(sizes):4} max tokens"
+          f"  {over} over {MODEL_LIMIT}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", help="PDF to ingest (default: a synthetic filing)")
+    parser.add_argument("--pages", type=int, default=1000, help="Pages of the synthetic filing")
+    parser.add_argument("--workers", type=int, nargs="+", default=[os.cpu_count() or 1])
+    parser.add_argument("--tokenizer", help="Hugging Face tokenizer for exact token counts, e.g. the embedding model")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.pdf
+        if not path:
+            path = os.path.join(tmp, "filing.pdf")
+            make_pdf(path, args.pages)
+        pages = page_count(path)
+        digest = file_hash(Path(path).read_bytes())
+        print(f"{path}: {pages} pages, {os.path.getsize(path) / 1e6:.1f} MB, {os.cpu_count()} CPUs\n")
+        report = {"pages": pages, "extract": {}, "chunk": {}}
+
+        texts = timed("pypdf", lambda: [text for _, text in extract_range(path, range(pages))],
+                      pages, report["extract"])
+        for workers in args.workers:
+            timed(f"parallel x{workers}", lambda: list(extract_pages(path, digest, workers, cache=False)),
+                  pages, report["extract"])
+        cache = PageCache(os.path.join(tmp, "pages.sqlite"))
+        list(extract_pages(path, digest, max(args.workers), cache=cache))
+        timed("cached", lambda: list(extract_pages(path, digest, cache=cache)), pages, report["extract"])
+
+        if args.tokenizer:
+            from transformers import AutoTokenizer
+            count = tokenizer_counter(AutoTokenizer.from_pretrained(args.tokenizer))
+        else:
+            count = estimate_tokens
+        print()
+        try:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+        except ImportError:
+            print("chars          skipped (langchain is not installed)")
+        else:
+            splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+            chunks = timed("chars", lambda: [c for text in texts for c in splitter.split_text(text)],
+                           pages, report["chunk"])
+            chunk_stats("  chars", chunks, count, report["chunk"])
+        splitter = TokenSplitter(count=count)
+
+        def split_all():
+            section, chunks = None, []
+            for text in texts:
+                pieces, section = splitter.split_page(text, section)
+                chunks += [piece for piece, _ in pieces]
+            return chunks
+        chunks = timed("tokens", split_all, pages, report["chunk"])
+        chunk_stats("  tokens", chunks, count, report["chunk"])
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
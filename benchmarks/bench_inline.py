@@ -0,0 +1,113 @@
+"""Latency of inline code suggestions: whole-buffer completion vs. the inline mode.
+
+Simulates a developer typing a file line by line and asking for a
+suggestion at the end of every line, with the cursor in the middle of the
+file (there is code after it). Three modes:
+    full     the whole buffer in the chat prompt, no length cap (the "Autocomplete" button)
+    window   bounded prefix/suffix window, fill-in-the-middle for FIM models, short cap
+    cached   window + typing into the previous suggestion, served by the suggestion cache
+
+Usage:
+    python benchmarks/bench_inline.py --model codegemma
+    python benchmarks/bench_inline.py --model deepseek-coder --lines 30 --json inline.json
+    LLM_BACKEND=fake python benchmarks/bench_inline.py      # no Ollama needed
+
+Reports p50/p95 time to the first token and to the complete suggestion.
+The response cache is bypassed so every request reaches the model.
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "1.Copilot_Streamlight_App" / "v2"))
+from shared.llm_backends import as_messages, get_backend, stream
+from shared.ollama_client import preload
+from inline_complete import SuggestionCache, build_request, suggest, window
+
+HEADER = "import json\nfrom pathlib import Path\n\n"
+BODY = [f"def load_{i}(path):\n    data = json.loads(Path(path).read_text())\n    return data.get('item_{i}', [])\n\n"
+        for i in range(60)]
+FOOTER = "\nif __name__ == '__main__':\n    print(load_0('data.json'))\n"
+
+
+def uncached_stream(*args, **kwargs):
+    return stream(*args, cache=False, **kwargs)
+
+
+def timed(tokens):
+    start = time.perf_counter()
+    first, text = None, ""
+    for token in tokens:
+        if first is None:
+            first = time.perf_counter() - start
+        text += token
+    return first or 0.0, time.perf_counter() - start, text
+
+
+def run(mode, backend, model, lines):
+    cache = SuggestionCache()
+    results = []
+    for n in range(1, lines + 1):
+        code = HEADER + "".join(BODY[:n]) + "def load_next(path):\n    "
+        text = code + FOOTER
+        if mode == "full":
+            prompt = f"Complete the following python code:\n\n{text}\n\n### Completion:\n"
+            tokens = uncached_stream(backend, as_messages(prompt), model, 0.0)
+        else:
+            tokens = suggest(text, len(code), backend, model, "python", cache, uncached_stream)
+        first, total, suggestion = timed(tokens)
+        results.append({"line": n, "ttft": first, "seconds": total, "chars": len(suggestion)})
+        if mode == "cached" and suggestion.strip():
+            # Type the first few characters of the suggestion, then ask again
+            typed = suggestion[:max(1, len(suggestion) // 3)]
+            first, total, _ = timed(suggest(code + typed + FOOTER, len(code + typed), backend, model,
+                                            "python", cache, uncached_stream))
+            results.append({"line": n, "ttft": first, "seconds": total, "typed": len(typed)})
+    return results
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="ollama")
+    parser.add_argument("--model", default="codegemma")
+    parser.add_argument("--modes", nargs="+", choices=["full", "window", "cached"], default=["full", "window", "cached"])
+    parser.add_argument("--lines", type=int, default=20, help="Suggestions per mode (one per typed function)")
+    parser.add_argument("--json", help="Also write per-request results to this file")
+    args = parser.parse_args()
+
+    if get_backend(args.backend).name == "ollama":
+        try:
+            preload(args.model)
+        except Exception as e:
+            print(f"Could not preload {args.model}: {e}")
+    prefix, suffix = window(HEADER + "".join(BODY[:args.lines]) + FOOTER, len(HEADER + "".join(BODY[:args.lines])))
+    prompt, _ = build_request(args.backend, args.model, "python", prefix, suffix)
+    print(f"{args.backend}/{args.model}: {'fill-in-the-middle' if isinstance(prompt, str) else 'chat prompt'}, "
+          f"window {len(prefix)} + {len(suffix)} chars")
+
+    report = {}
+    print("\nmode     requests  ttft p50  ttft p95  total p50  total p95")
+    for mode in args.modes:
+        results = report[mode] = run(mode, args.backend, args.model, min(args.lines, len(BODY)))
+        ttft = [r["ttft"] for r in results]
+        total = [r["seconds"] for r in results]
+        print(f"{mode:8} {len(results):9}  {statistics.median(ttft) * 1000:6.0f}ms  {percentile(ttft, 0.95) * 1000:6.0f}ms"
+              f"  {statistics.median(total) * 1000:7.0f}ms  {percentile(total, 0.95) * 1000:7.0f}ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"backend": args.backend, "model": args.model, "results": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""Load test of the apps' main flows against a local fake LLM server.
+
+Starts ``shared/fake_llm_server.py`` (Ollama and OpenAI APIs with a set time
+to first token, token rate and error rate) and drives each flow headlessly
+with Streamlit's ``AppTest``, the way a user clicks through it:
+    completion  copilot v2, "🚀 Autocomplete Code" on a snippet
+    chat        copilot v2, "💬 Send" in the chat tab (each user's history grows)
+    quality     code quality assistant, "🧠 Analyze & Refactor" (five parallel prompts)
+    rag         RAG app, questions about an uploaded synthetic filing (needs its embedding model)
+
+Every flow runs in a fresh process serving --users sessions at once (one
+thread and one AppTest each, like one Streamlit server with several browser
+tabs). After an untimed first page load, each user does --requests
+interactions. Reported per flow: throughput (interactions/s), p50/p95/p99
+latency, failed interactions, LLM requests the server saw, and the peak
+memory (RSS) of the process.
+
+Usage:
+    python benchmarks/bench_load.py --save-baseline load_baseline.json
+    python benchmarks/bench_load.py --baseline load_baseline.json
+    python benchmarks/bench_load.py --flows chat quality --users 8 --api openai --ttft 0.5 --error-rate 0.05
+
+With --baseline, the run exits with status 1 when a flow is slower, serves
+fewer interactions per second or needs more memory than the tolerances
+allow, fails more often, or does not run at all. Baselines are only
+comparable on the same machine with the same settings.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SNIPPET = '''def parse_orders(rows):
+    result = []
+    for row in rows:
+        if row["status"] == "open" and row["total"] > {limit}:
+            result.append({{"id": row["id"], "total": row["total"] * 1.{tax}}})
+    return result
+'''
+# Metric -> direction; latencies and memory regress upwards, throughput downwards
+CHECKS = {"p50": 1, "p95": 1, "throughput": -1, "peak_rss_mb": 1}
+SETTINGS = ("users", "requests", "api", "ttft", "tokens_per_second", "reply_tokens", "error_rate")
+
+
+# === FLOWS (run inside the child process) ===
+def _labelled(widgets, label):
+    for widget in widgets:
+        if widget.label == label:
+            return widget
+    raise LookupError(f"no {label!r} on the page")
+
+
+def _choose_backend(at, api):
+    if api == "openai":
+        _labelled(at.selectbox, "Choose model backend:").set_value("OpenAI GPT-4").run()
+
+
+def _completion(at, user, n):
+    _labelled(at.text_area, "✍️ Start writing your code:").set_value(SNIPPET.format(limit=user * 10 + n, tax=n))
+    _labelled(at.button, "🚀 Autocomplete Code").click().run()
+
+
+def _chat(at, user, n):
+    at.text_input(key="chat_input").set_value(f"User {user}, question {n}: how do I make parse_orders faster?")
+    _labelled(at.button, "💬 Send").click().run()
+
+
+def _quality(at, user, n):
+    _labelled(at.text_area, "Paste your Python code:").set_value(SNIPPET.format(limit=user * 10 + n, tax=n))
+    _labelled(at.button, "🧠 Analyze & Refactor").click().run()
+
+
+def _setup_rag(at, api, pages=20):
+    from bench_ingest import make_pdf
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "filing.pdf")
+        make_pdf(path, pages)
+        data = Path(path).read_bytes()
+    # Every question should reach retrieval and the model, not the answer cache
+    _labelled(at.checkbox, "Reuse answers to similar questions").uncheck()
+    at.file_uploader[0].set_value(("filing.pdf", data, "application/pdf")).run()
+
+
+def _rag(at, user, n):
+    _labelled(at.text_input, "Ask a question about the document:").set_value(
+        f"What does item {n % 4 + 1} say about liquidity and covenant exposure? ({user}.{n})"
+    ).run()
+
+
+# flow -> (app script, setup(at, api), interaction(at, user, n))
+FLOWS = {
+    "completion": ("1.Copilot_Streamlight_App/v2/main_v2.py", _choose_backend, _completion),
+    "chat": ("1.Copilot_Streamlight_App/v2/main_v2.py", _choose_backend, _chat),
+    "quality": ("3.Code_Quality_Refactor_Assistant/main.py", _choose_backend, _quality),
+    "rag": ("2.Rag_Ollama/stream_example.py", _setup_rag, _rag),
+}
+
+
+def _problems(at):
+    """Exceptions and error boxes the last run rendered."""
+    return [str(e.value) for e in at.exception] + [str(e.value) for e in at.error]
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+@contextmanager
+def _parallel_app_tests():
+    """Let AppTest sessions run in parallel threads, as sessions of one Streamlit server.
+
+    Every AppTest run patches Streamlit's config and installs a mock Runtime,
+    and undoes both when it ends. With runs overlapping in threads, one run's
+    cleanup pulls them from under another (empty pages, lost widget state).
+    Here the config patch is held for the whole test, and a run that finds
+    no Runtime installed gets the last one that was. Scripts are compiled once,
+    like the server does, instead of on every run: concurrent compiles also
+    trip a CPython 3.11 bug ("AST constructor recursion depth mismatch").
+    """
+    from unittest.mock import patch
+
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import AppTest
+    from streamlit.testing.v1.util import patch_config_options
+
+    installed = []
+    compiled = {}
+    compile_lock = threading.Lock()
+    compile_script = ScriptCache.get_bytecode
+
+    def instance(cls):
+        if cls._instance is not None:
+            installed[:] = [cls._instance]
+        return cls._instance or installed[0]
+
+    def get_bytecode(self, script_path):
+        with compile_lock:
+            if script_path not in compiled:
+                compiled[script_path] = compile_script(self, script_path)
+            return compiled[script_path]
+
+    with patch_config_options({"global.appTest": True}), \
+            patch.object(Runtime, "instance", classmethod(instance)), \
+            patch.object(Runtime, "exists", classmethod(lambda cls: True)), \
+            patch.object(ScriptCache, "get_bytecode", get_bytecode):
+        # Records a Runtime before the sessions start
+        AppTest.from_string("import streamlit as st", default_timeout=30).run()
+        yield
+
+
+def child(flow, users, requests, timeout, api):
+    """Runs inside the fresh process: ``users`` concurrent sessions of one flow."""
+    from streamlit.testing.v1 import AppTest
+
+    script, setup, interact = FLOWS[flow]
+    script = ROOT / script
+    # ``streamlit run`` puts the script's folder on sys.path for its sibling modules
+    sys.path.insert(0, str(script.parent))
+    ready = threading.Barrier(users)
+    lock = threading.Lock()
+    latencies, failures, errors, starts, ends = [], [], [], [], []
+
+    def session(user):
+        try:
+            at = AppTest.from_file(str(script), default_timeout=timeout)
+            at.run()
+            setup(at, api)
+            problems = _problems(at)
+            if problems:
+                raise RuntimeError(problems[0])
+        except Exception as e:
+            with lock:
+                errors.append(f"{type(e).__name__}: {e}")
+            ready.abort()
+            return
+        try:
+            ready.wait()
+        except threading.BrokenBarrierError:
+            return
+        starts.append(time.perf_counter())
+        for n in range(requests):
+            start = time.perf_counter()
+            try:
+                interact(at, user, n)
+                problems = _problems(at)
+            except Exception as e:
+                problems = [f"{type(e).__name__}: {e}"]
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                failures.extend(problems[:1])
+        ends.append(time.perf_counter())
+
+    threads = [threading.Thread(target=session, args=(user,), daemon=True) for user in range(users)]
+    with _parallel_app_tests():
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    wall = max(ends) - min(starts) if ends and starts else 0.0
+    print(json.dumps({"flow": flow, "latencies": latencies, "failures": failures, "errors": errors[:3],
+                      "seconds": wall, "peak_rss_mb": _peak_rss_mb()}))
+
+
+# === DRIVER ===
+def start_server(args):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "shared.fake_llm_server", "--port", "0", "--ttft", str(args.ttft),
+         "--tokens-per-second", str(args.tokens_per_second), "--reply-tokens", str(args.reply_tokens),
+         "--error-rate", str(args.error_rate), "--error-status", str(args.error_status)],
+        cwd=ROOT, stdout=subprocess.PIPE, text=True,
+    )
+    line = server.stdout.readline()
+    if not line.startswith("Fake LLM server on "):
+        server.kill()
+        raise RuntimeError("the fake LLM server did not start")
+    return server, line.split()[-1]
+
+
+def server_stats(url):
+    with urllib.request.urlopen(f"{url}/fake/stats", timeout=5) as response:
+        return json.load(response)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def measure(flow, args, url, workdir):
+    """Run ``flow`` in a fresh interpreter against the server at ``url``; its report."""
+    env = {**os.environ, "PYTHONUTF8": "1", "OLLAMA_HOST": url, "OPENAI_BASE_URL": f"{url}/v1",
+           "OPENAI_API_KEY": "fake-key", "LLM_CACHE_DISABLED": "1", "REPO_INDEX_ROOT": workdir}
+    # The point is to go over HTTP, not through the in-process fake
+    env.pop("LLM_BACKEND", None)
+    before = server_stats(url)
+    result = subprocess.run([sys.executable, __file__, "--child", flow, "--users", str(args.users),
+                             "--requests", str(args.requests), "--timeout", str(args.timeout), "--api", args.api],
+                            cwd=workdir, capture_output=True, text=True, env=env)
+    after = server_stats(url)
+    lines = result.stdout.strip().splitlines()
+    if result.returncode or not lines:
+        return {"flow": flow, "error": result.stderr.strip().splitlines()[-1:] or ["exited without a report"]}
+    run = json.loads(lines[-1])
+    if run["errors"] or not run["latencies"]:
+        return {"flow": flow, "error": run["errors"] or ["no interaction finished"]}
+    latencies = run["latencies"]
+    return {
+        "flow": flow, "interactions": len(latencies), "seconds": run["seconds"],
+        "throughput": len(latencies) / run["seconds"] if run["seconds"] else 0.0,
+        "p50": percentile(latencies, 0.50), "p95": percentile(latencies, 0.95), "p99": percentile(latencies, 0.99),
+        "mean": statistics.mean(latencies), "failed": len(run["failures"]),
+        "failure_rate": len(run["failures"]) / len(latencies), "first_failures": run["failures"][:3],
+        "llm_requests": after["generations"] - before["generations"],
+        "injected_errors": after["errors"] - before["errors"], "peak_rss_mb": run["peak_rss_mb"],
+    }
+
+
+def compare(reports, baseline, tolerance, memory_tolerance, failure_tolerance):
+    """Regressions of ``reports`` against ``baseline`` as printable lines."""
+    previous = {report["flow"]: report for report in baseline["flows"]}
+    regressions = []
+    for report in reports:
+        before = previous.get(report["flow"])
+        if before is None or "error" in before:
+            continue
+        if "error" in report:
+            regressions.append(f"{report['flow']}: did not run ({report['error'][0]})")
+            continue
+        for metric, direction in CHECKS.items():
+            old, new = before.get(metric), report.get(metric)
+            if not old or new is None:
+                continue
+            allowed = memory_tolerance if metric == "peak_rss_mb" else tolerance
+            change = (new - old) / old
+            if change * direction > allowed:
+                regressions.append(f"{report['flow']}: {metric} {old:.3g} -> {new:.3g} ({change:+.0%}, "
+                                   f"allowed {allowed:.0%})")
+        if report["failure_rate"] > before["failure_rate"] + failure_tolerance:
+            regressions.append(f"{report['flow']}: failure rate {before['failure_rate']:.1%} -> "
+                               f"{report['failure_rate']:.1%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--flows", nargs="+", choices=list(FLOWS), default=list(FLOWS))
+    parser.add_argument("--users", type=int, default=4, help="Concurrent sessions per flow")
+    parser.add_argument("--requests", type=int, default=5, help="Interactions per session")
+    parser.add_argument("--api", choices=["ollama", "openai"], default="ollama",
+                        help="Backend chosen in the copilot and quality apps (RAG always uses Ollama)")
+    parser.add_argument("--ttft", type=float, default=0.2, help="Fake server: seconds to the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="Fake server: token rate")
+    parser.add_argument("--reply-tokens", type=int, default=64, help="Fake server: length of plain-text replies")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fake server: share of failing requests")
+    parser.add_argument("--error-status", type=int, default=503, help="Fake server: status of the failures")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds one script run may take")
+    parser.add_argument("--json", help="Also write the reports to this file")
+    parser.add_argument("--baseline", help="Fail on regressions against this file (written by --save-baseline)")
+    parser.add_argument("--save-baseline", help="Store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed p50/p95 latency increase and throughput drop (0.25 = 25%%)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.15, help="Allowed peak memory increase")
+    parser.add_argument("--failure-tolerance", type=float, default=0.02,
+                        help="Allowed increase of the share of failed interactions")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args.child, args.users, args.requests, args.timeout, args.api)
+
+    settings = {name: getattr(args, name) for name in SETTINGS}
+    server, url = start_server(args)
+    reports = []
+    try:
+        print(f"{args.users} users x {args.requests} interactions, {args.api}, ttft {args.ttft}s, "
+              f"{args.tokens_per_second:g} tokens/s, error rate {args.error_rate:g}\n")
+        print("flow        req/s     p50      p95      p99   failed  LLM calls  peak RSS")
+        for flow in args.flows:
+            with tempfile.TemporaryDirectory() as workdir:
+                report = measure(flow, args, url, workdir)
+            reports.append(report)
+            if "error" in report:
+                print(f"{flow:10}  did not run: {report['error'][0]}")
+                continue
+            rss = f"{report['peak_rss_mb']:6.0f} MB" if report["peak_rss_mb"] is not None else "   n/a"
+            print(f"{flow:10} {report['throughput']:6.2f}  {report['p50']:6.2f}s  {report['p95']:6.2f}s  "
+                  f"{report['p99']:6.2f}s  {report['failed']:6}  {report['llm_requests']:9}  {rss}")
+            for failure in report["first_failures"]:
+                print(f"  ⚠️ {failure[:200]}")
+    finally:
+        server.terminate()
+        server.wait()
+
+    result = {"settings": settings, "flows": reports}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        changed = [name for name in SETTINGS if baseline["settings"].get(name) != settings[name]]
+        if changed:
+            print(f"\n⚠️ Settings differ from the baseline ({', '.join(changed)}); the comparison is unreliable")
+        regressions = compare(reports, baseline, args.tolerance, args.memory_tolerance, args.failure_tolerance)
+        print("\nNo regressions against the baseline" if not regressions else "\nRegressions:")
+        for regression in regressions:
+            print(f"  ❌ {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Prefill time per turn against a running Ollama server, with and without prefix reuse.
+
+Two workloads:
+    chat        a multi-turn conversation; every turn re-sends the history
+    completion  repeated completions on one file that grows at the end
+
+Three modes per workload:
+    cold     model unloaded after every call (keep_alive=0): load + full prefill each time
+    no-reuse model resident, but the prompt start changes every call (full prefill)
+    reuse    model resident, append-only prompts (/api/chat session, stable prefix):
+             only the new suffix is prefilled
+
+Usage:
+    python benchmarks/bench_prefill.py --model mistral
+    python benchmarks/bench_prefill.py --model codellama --workload completion --turns 8 --json prefill.json
+
+Ollama reports ``prompt_eval_count`` / ``prompt_eval_duration`` for the tokens
+it actually evaluated, so a reused prefix shows up as fewer tokens and less time.
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.ollama_client import KEEP_ALIVE, ChatSession, preload, stream_chat, stream_generate
+
+SYSTEM = "You are a concise senior Python reviewer. Answer in at most three sentences."
+QUESTIONS = [
+    "What is the difference between a list and a tuple?",
+    "When should I use a dataclass instead of a dict?",
+    "How do I make that dataclass immutable?",
+    "Can it still have a method that returns a modified copy?",
+    "How would I sort a list of them by two fields?",
+    "What if one of the fields can be None?",
+    "How do I test that sort with pytest?",
+    "And how do I parametrize that test?",
+    "How would I type-annotate the sort key function?",
+    "Summarize the advice you gave so far.",
+]
+FILE_LINES = [f"def handler_{i}(event, context):\n    payload = parse(event)\n"
+              f"    if not payload.get('id_{i}'):\n        return error(400)\n    return store(payload, {i})\n"
+              for i in range(40)]
+
+
+def ms(nanoseconds):
+    return (nanoseconds or 0) / 1e6
+
+
+def run_chat(model, mode, turns, options):
+    keep_alive = 0 if mode == "cold" else KEEP_ALIVE
+    session = ChatSession(model, system=SYSTEM, options=options, keep_alive=keep_alive)
+    results = []
+    for question in QUESTIONS[:turns]:
+        stats = {}
+        if mode == "reuse":
+            "".join(session.send(question))
+            stats = session.stats[-1]
+        else:
+            # Same history, but a changing first line defeats the KV cache prefix match
+            messages = [{"role": "system", "content": f"[request {time.time_ns()}] {SYSTEM}"}]
+            messages += session.messages[1:] + [{"role": "user", "content": question}]
+            reply = "".join(stream_chat(messages, model, options=options, stats=stats, keep_alive=keep_alive))
+            session.messages = messages + [{"role": "assistant", "content": reply}]
+        results.append(stats)
+    return results
+
+
+def run_completion(model, mode, turns, options):
+    results = []
+    for turn in range(turns):
+        code = "".join(FILE_LINES[:5 * (turn + 1)])
+        prompt = f"Complete the following python code:\n\n{code}\n\n### Completion:\n"
+        if mode != "reuse":
+            prompt = f"# request {time.time_ns()}\n{prompt}"
+        stats = {}
+        "".join(stream_generate(prompt, model, options=options, stats=stats,
+                                keep_alive=0 if mode == "cold" else KEEP_ALIVE))
+        results.append(stats)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="mistral")
+    parser.add_argument("--workload", choices=["chat", "completion", "both"], default="both")
+    parser.add_argument("--modes", nargs="+", choices=["cold", "no-reuse", "reuse"], default=["cold", "no-reuse", "reuse"])
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--num-predict", type=int, default=48, help="Cap on generated tokens per call")
+    parser.add_argument("--json", help="Also write per-turn results to this file")
+    args = parser.parse_args()
+
+    options = {"temperature": 0.0, "num_predict": args.num_predict}
+    workloads = ["chat", "completion"] if args.workload == "both" else [args.workload]
+    report = {}
+    for workload in workloads:
+        run = run_chat if workload == "chat" else run_completion
+        for mode in args.modes:
+            if mode != "cold":
+                preload(args.model)
+            turns = run(args.model, mode, min(args.turns, len(QUESTIONS)), options)
+            report[f"{workload}/{mode}"] = turns
+            print(f"\n{workload} – {mode}")
+            print("  turn  prompt tokens evaluated  prefill ms  load ms")
+            for i, stats in enumerate(turns, 1):
+                print(f"  {i:4}  {stats.get('prompt_eval_count', 0):23}  {ms(stats.get('prompt_eval_duration')):10.0f}"
+                      f"  {ms(stats.get('load_duration')):7.0f}")
+            later = [ms(s.get("prompt_eval_duration")) for s in turns[1:]] or [0.0]
+            print(f"  median prefill after the first turn: {statistics.median(later):.0f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "results": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Retrieval quality/latency benchmark for the RAG app.
+
+Reports recall@k and p50/p95 retrieval latency for dense-only, BM25-only,
+hybrid and hybrid + cross-encoder rerank on a fixed local question set.
+
+Usage:
+    python benchmarks/bench_retrieval.py                                  # built-in synthetic filing
+    python benchmarks/bench_retrieval.py --pdf contract.pdf --questions questions.json
+    python benchmarks/bench_retrieval.py --alphas 0.3 0.5 0.7 --k 5
+
+A questions file is a JSON list of ``{"question": ..., "expected": [...]}``;
+a question counts as recalled when any of its top-k chunks contains one of
+the ``expected`` strings (case-insensitive).
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "2.Rag_Ollama"))
+from shared.embeddings import get_embedder
+from retrieval import HybridRetriever
+
+FILLER = ("the parties agree that obligations under this agreement remain in force and that any "
+          "notice shall be delivered in writing to the registered address of the receiving party "
+          "market conditions interest rates and liquidity may affect results of operations").split()
+
+# (fact planted in one chunk, question about it, string that identifies the chunk)
+FACTS = [
+    ("Clause 14.2.3 sets the early termination fee at 4.5 percent of the remaining contract value.",
+     "What does clause 14.2.3 say about termination?", "14.2.3"),
+    ("Clause 9.1 requires the supplier to maintain professional liability insurance of 2 million euros.",
+     "What insurance does clause 9.1 require?", "clause 9.1 requires"),
+    ("Holdings in NVDA were reduced by 30 percent during the fourth quarter to limit concentration risk.",
+     "What happened to the NVDA position?", "NVDA"),
+    ("The fund's exposure to TSLA options is capped at 2 percent of net asset value.",
+     "How much TSLA exposure is allowed?", "TSLA"),
+    ("Section 10(b) of the Securities Exchange Act and Rule 10b-5 prohibit fraud in connection with securities.",
+     "Which rule prohibits securities fraud?", "Rule 10b-5"),
+    ("Under 15 U.S.C. § 78j the commission may prescribe rules against manipulative devices.",
+     "What does 15 U.S.C. § 78j allow?", "78j"),
+    ("The main risks identified are currency fluctuations, supplier concentration and cyber attacks.",
+     "What are the main risks mentioned in the document?", "currency fluctuations"),
+    ("Either party may end the agreement with ninety days written notice without giving a reason.",
+     "How can the contract be cancelled without cause?", "ninety days written notice"),
+    ("Revenue grew 12 percent year over year, driven mainly by subscription renewals in Europe.",
+     "Why did sales increase?", "subscription renewals"),
+    ("Disputes are settled by arbitration in Geneva under the rules of the ICC.",
+     "Where are disagreements resolved?", "arbitration in Geneva"),
+]
+
+
+def synthetic_corpus(chunks, seed=0):
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(chunks):
+        texts.append(" ".join(rng.choice(FILLER) for _ in range(rng.randint(40, 80))) + ".")
+    for fact, _, _ in FACTS:
+        # Bury each fact in an ordinary-looking chunk
+        position = rng.randrange(len(texts))
+        texts[position] = " ".join(rng.choice(FILLER) for _ in range(30)) + ". " + fact
+    questions = [{"question": q, "expected": [marker]} for _, q, marker in FACTS]
+    return texts, questions
+
+
+def pdf_corpus(path, chunk_size, chunk_overlap):
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return [c.page_content for c in splitter.split_documents(PyPDFLoader(path).load())]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def evaluate(name, search, questions, k, repeats):
+    hits, latencies = 0, []
+    for item in questions:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            docs = search(item["question"])
+            latencies.append((time.perf_counter() - start) * 1000)
+        expected = [e.lower() for e in item["expected"]]
+        if any(e in doc.page_content.lower() for doc in docs[:k] for e in expected):
+            hits += 1
+    return {
+        "retriever": name,
+        f"recall@{k}": round(hits / len(questions), 3),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", help="Index this PDF instead of the synthetic filing")
+    parser.add_argument("--questions", help="JSON question set (required with --pdf)")
+    parser.add_argument("--chunks", type=int, default=2000, help="Synthetic corpus size")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--alphas", nargs="+", type=float, default=[0.5], help="Vector weights for hybrid runs")
+    parser.add_argument("--rerank-candidates", type=int, default=20)
+    parser.add_argument("--no-rerank", action="store_true", help="Skip the cross-encoder run")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed searches per question")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    if args.pdf:
+        if not args.questions:
+            parser.error("--questions is required with --pdf")
+        texts = pdf_corpus(args.pdf, args.chunk_size, args.chunk_overlap)
+    else:
+        texts, questions = synthetic_corpus(args.chunks)
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = json.load(f)
+
+    from langchain_community.vectorstores import Chroma
+
+    start = time.perf_counter()
+    db = Chroma.from_texts(texts, embedding=get_embedder(), collection_name="bench_retrieval")
+    retriever = HybridRetriever(db)
+    print(f"{len(texts)} chunks indexed in {time.perf_counter() - start:.1f}s, {len(questions)} questions")
+
+    k = args.k
+    runs = [
+        ("vectors", lambda q: db.similarity_search(q, k=k)),
+        ("bm25", lambda q: retriever.search(q, k=k, alpha=0.0)),
+    ]
+    for alpha in args.alphas:
+        runs.append((f"hybrid a={alpha}", lambda q, a=alpha: retriever.search(q, k=k, alpha=a)))
+    if not args.no_rerank:
+        for alpha in args.alphas:
+            runs.append((f"hybrid a={alpha} + rerank", lambda q, a=alpha: retriever.search(
+                q, k=k, alpha=a, rerank=True, rerank_candidates=args.rerank_candidates)))
+
+    results = []
+    for name, search in runs:
+        search(questions[0]["question"])  # warm-up (loads the cross-encoder once)
+        result = evaluate(name, search, questions, k, args.repeats)
+        results.append(result)
+        print(f"  {name:26} recall@{k} {result[f'recall@{k}']:.2f}   "
+              f"p50 {result['p50_ms']:8.2f} ms   p95 {result['p95_ms']:8.2f} ms")
+
+    db.delete_collection()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"chunks": len(texts), "questions": len(questions), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
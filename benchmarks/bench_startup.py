@@ -0,0 +1,116 @@
+"""Cold start and per-rerun script time of the Streamlit apps.
+
+Each app is started in a fresh Python process (nothing imported yet, like a
+new container) and run headless with Streamlit's ``AppTest``:
+    process     interpreter start until the first page is rendered
+    streamlit   importing Streamlit itself (the floor for every app)
+    first run   first script run: the app's imports and module-level work
+    rerun       later runs in the same process, as after every widget interaction
+
+Also lists which known heavy packages the first run imported; features that
+need them should import them on first use, not at startup.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --apps rag copilot-v2 --reruns 20 --json startup.json
+
+Apps run in a scratch directory so their session stores and caches start
+empty. Ollama does not need to be running; nothing calls a model at startup.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+APPS = {
+    "copilot-v1": "1.Copilot_Streamlight_App/v1/main.py",
+    "copilot-v2": "1.Copilot_Streamlight_App/v2/main_v2.py",
+    "rag": "2.Rag_Ollama/stream_example.py",
+    "quality": "3.Code_Quality_Refactor_Assistant/main.py",
+}
+HEAVY_MODULES = ["torch", "transformers", "sentence_transformers", "chromadb", "langchain", "langchain_community",
+                 "pypdf", "openai", "git", "pyperclip", "numpy"]
+
+
+def child(app, reruns, timeout, spawned):
+    """Runs inside the fresh process: time the first run and the reruns of one app."""
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    streamlit_seconds = time.perf_counter() - started
+
+    script = ROOT / APPS[app]
+    # ``streamlit run`` puts the script's folder on sys.path for its sibling modules
+    sys.path.insert(0, str(script.parent))
+    before = set(sys.modules)
+    app_test = AppTest.from_file(str(script), default_timeout=timeout)
+    start = time.perf_counter()
+    app_test.run()
+    first = time.perf_counter() - start
+    # Wall clock, because the process started before this interpreter could time anything
+    process = time.time() - spawned
+    errors = [str(e.value) for e in app_test.exception]
+    heavy = [name for name in HEAVY_MODULES if name in sys.modules and name not in before]
+
+    times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app_test.run()
+        times.append(time.perf_counter() - start)
+    print(json.dumps({"app": app, "streamlit": streamlit_seconds, "first_run": first, "process": process,
+                      "reruns": times, "heavy_imports": heavy, "errors": errors}))
+
+
+def measure(app, reruns, timeout, workdir):
+    """Start a fresh interpreter for ``app`` and return its measurements."""
+    result = subprocess.run([sys.executable, __file__, "--child", app, "--reruns", str(reruns),
+                             "--timeout", str(timeout), "--spawned", repr(time.time())],
+                            cwd=workdir, capture_output=True, text=True, env={**os.environ, "PYTHONUTF8": "1"})
+    lines = result.stdout.strip().splitlines()
+    if result.returncode or not lines:
+        raise RuntimeError(f"{app} failed:\n{result.stderr[-2000:]}")
+    return json.loads(lines[-1])
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", nargs="+", choices=list(APPS), default=list(APPS))
+    parser.add_argument("--reruns", type=int, default=10, help="Reruns timed after the first run")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds one script run may take")
+    parser.add_argument("--json", help="Also write all measurements to this file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--spawned", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args.child, args.reruns, args.timeout, args.spawned)
+
+    reports = []
+    print("app          process  streamlit  first run  rerun p50  rerun p95  heavy imports at startup")
+    for app in args.apps:
+        with tempfile.TemporaryDirectory() as workdir:
+            report = measure(app, args.reruns, args.timeout, workdir)
+        reports.append(report)
+        print(f"{app:12} {report['process']:6.2f}s  {report['streamlit']:8.2f}s  {report['first_run']:8.2f}s"
+              f"  {statistics.median(report['reruns'] or [0]) * 1000:7.0f}ms  "
+              f"{percentile(report['reruns'], 0.95) * 1000:7.0f}ms  {', '.join(report['heavy_imports']) or '-'}")
+        for error in report["errors"]:
+            print(f"  ⚠️ {app} raised: {error}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""Helpers shared by the Copilot, RAG and Code Quality apps.
+
+The apps live in folders that are not importable packages, so each script
+puts the repository root on ``sys.path`` before importing from here.
+"""
@@ -0,0 +1,218 @@
+"""Deterministic static analysis for Python code, built on ``ast``.
+
+Computes per-function cyclomatic complexity, nesting depth and length, plus
+common smells, in milliseconds and with the same answer on every run. The
+apps feed these numbers to the LLM as facts and keep the LLM for the prose.
+Everything returned is plain dicts/lists so it can go straight into JSON.
+"""
+import ast
+
+# Limits above which a smell is reported; callers can override any of them
+THRESHOLDS = {
+    "complexity": 10,
+    "nesting": 4,
+    "function_length": 50,
+    "parameters": 5,
+    "returns": 5,
+    "line_length": 120,
+}
+
+_BRANCHES = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.IfExp, ast.ExceptHandler, ast.Assert)
+_NESTING = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.With, ast.AsyncWith, ast.Try)
+if hasattr(ast, "TryStar"):
+    _NESTING += (ast.TryStar,)
+_FUNCTIONS = (ast.FunctionDef, ast.AsyncFunctionDef)
+_MUTABLE_DEFAULTS = (ast.List, ast.Dict, ast.Set, ast.ListComp, ast.DictComp, ast.SetComp)
+
+
+def _walk_own(node):
+    """Walk a function body without descending into nested functions/classes."""
+    stack = list(ast.iter_child_nodes(node))
+    while stack:
+        child = stack.pop()
+        yield child
+        if not isinstance(child, _FUNCTIONS + (ast.ClassDef, ast.Lambda)):
+            stack.extend(ast.iter_child_nodes(child))
+
+
+def cyclomatic_complexity(func):
+    """McCabe complexity: 1 + one per decision point in the function's own body."""
+    complexity = 1
+    for node in _walk_own(func):
+        if isinstance(node, _BRANCHES):
+            complexity += 1
+        elif isinstance(node, ast.BoolOp):
+            complexity += len(node.values) - 1
+        elif isinstance(node, ast.comprehension):
+            complexity += 1 + len(node.ifs)
+        elif hasattr(ast, "match_case") and isinstance(node, ast.match_case):
+            complexity += 1
+    return complexity
+
+
+def max_nesting(node, depth=0):
+    """Deepest level of nested control blocks, not counting nested functions."""
+    deepest = depth
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, _FUNCTIONS + (ast.ClassDef, ast.Lambda)):
+            continue
+        child_depth = depth + 1 if isinstance(child, _NESTING) else depth
+        deepest = max(deepest, max_nesting(child, child_depth))
+    return deepest
+
+
+def _qualified_functions(tree):
+    """Yield ``(qualified_name, node)`` for every function and method."""
+    def visit(node, prefix):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, _FUNCTIONS):
+                name = f"{prefix}{child.name}"
+                yield name, child
+                yield from visit(child, f"{name}.")
+            elif isinstance(child, ast.ClassDef):
+                yield from visit(child, f"{prefix}{child.name}.")
+            else:
+                yield from visit(child, prefix)
+    yield from visit(tree, "")
+
+
+def _smell(kind, line, message):
+    return {"kind": kind, "line": line, "message": message}
+
+
+def _function_metrics(name, func, limits, smells):
+    args = func.args
+    parameters = [a.arg for a in args.posonlyargs + args.args + args.kwonlyargs if a.arg not in ("self", "cls")]
+    metrics = {
+        "name": name,
+        "line": func.lineno,
+        "length": func.end_lineno - func.lineno + 1,
+        "complexity": cyclomatic_complexity(func),
+        "max_nesting": max_nesting(func),
+        "parameters": len(parameters),
+    }
+
+    if metrics["complexity"] > limits["complexity"]:
+        smells.append(_smell("high_complexity", func.lineno,
+                             f"`{name}` has cyclomatic complexity {metrics['complexity']} (limit {limits['complexity']})."))
+    if metrics["max_nesting"] > limits["nesting"]:
+        smells.append(_smell("deep_nesting", func.lineno,
+                             f"`{name}` nests blocks {metrics['max_nesting']} levels deep (limit {limits['nesting']})."))
+    if metrics["length"] > limits["function_length"]:
+        smells.append(_smell("long_function", func.lineno,
+                             f"`{name}` is {metrics['length']} lines long; consider breaking it into smaller parts."))
+    if metrics["parameters"] > limits["parameters"]:
+        smells.append(_smell("too_many_parameters", func.lineno,
+                             f"`{name}` takes {metrics['parameters']} parameters (limit {limits['parameters']})."))
+    returns = sum(isinstance(n, ast.Return) for n in _walk_own(func))
+    if returns > limits["returns"]:
+        smells.append(_smell("too_many_returns", func.lineno, f"`{name}` has {returns} return statements."))
+    for default in args.defaults + [d for d in args.kw_defaults if d is not None]:
+        if isinstance(default, _MUTABLE_DEFAULTS) or (
+            isinstance(default, ast.Call) and getattr(default.func, "id", None) in ("list", "dict", "set")
+        ):
+            smells.append(_smell("mutable_default_argument", default.lineno,
+                                 f"`{name}` uses a mutable default argument; default to None instead."))
+    return metrics
+
+
+def _module_smells(tree, lines, limits):
+    smells = []
+    imported, used = {}, set()
+    statement_lines = {}
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ExceptHandler) and node.type is None:
+            smells.append(_smell("bare_except", node.lineno, "Bare `except:` also catches KeyboardInterrupt/SystemExit."))
+        elif isinstance(node, ast.Global):
+            smells.append(_smell("global_statement", node.lineno, f"`global {', '.join(node.names)}` makes state hard to follow."))
+        elif isinstance(node, ast.ImportFrom) and any(alias.name == "*" for alias in node.names):
+            smells.append(_smell("wildcard_import", node.lineno, f"`from {node.module} import *` hides where names come from."))
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                name = (alias.asname or alias.name).split(".")[0]
+                imported.setdefault(name, node.lineno)
+        elif isinstance(node, ast.Name):
+            used.add(node.id)
+        elif isinstance(node, ast.Attribute):
+            root = node
+            while isinstance(root, ast.Attribute):
+                root = root.value
+            if isinstance(root, ast.Name):
+                used.add(root.id)
+
+        # Two simple (body-less) statements starting on one line means a `;` separator
+        if isinstance(node, ast.stmt) and not hasattr(node, "body"):
+            statement_lines.setdefault(node.lineno, []).append(node)
+
+    for line, statements in sorted(statement_lines.items()):
+        if len(statements) > 1:
+            smells.append(_smell("semicolon", line, "Avoid using semicolons in Python code."))
+
+    # Names listed in __all__ count as used
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "__all__" for t in node.targets):
+            used.update(e.value for e in getattr(node.value, "elts", []) if isinstance(e, ast.Constant))
+    for name, line in sorted(imported.items(), key=lambda item: item[1]):
+        if name not in used:
+            smells.append(_smell("unused_import", line, f"`{name}` is imported but never used."))
+
+    for number, text in enumerate(lines, start=1):
+        if len(text) > limits["line_length"]:
+            smells.append(_smell("long_line", number, f"Line is {len(text)} characters long (limit {limits['line_length']})."))
+    return smells
+
+
+def analyze_code(code, thresholds=None):
+    """Analyze Python source and return a JSON-serializable report.
+
+    Keys: ``summary``, ``functions`` (per-function metrics), ``smells`` and
+    ``syntax_error`` (a message, or None when the code parsed).
+    """
+    limits = {**THRESHOLDS, **(thresholds or {})}
+    lines = code.splitlines()
+    report = {"summary": {"lines": len(lines)}, "functions": [], "smells": [], "syntax_error": None}
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        report["syntax_error"] = f"{e.msg} (line {e.lineno})"
+        return report
+
+    for name, func in _qualified_functions(tree):
+        report["functions"].append(_function_metrics(name, func, limits, report["smells"]))
+    report["smells"].extend(_module_smells(tree, lines, limits))
+    report["smells"].sort(key=lambda s: s["line"])
+
+    complexities = [f["complexity"] for f in report["functions"]]
+    report["summary"].update({
+        "functions": len(report["functions"]),
+        "classes": sum(isinstance(n, ast.ClassDef) for n in ast.walk(tree)),
+        # Decision points in top-level code, outside any function
+        "module_complexity": cyclomatic_complexity(tree),
+        "max_complexity": max(complexities, default=0),
+        "average_complexity": round(sum(complexities) / len(complexities), 2) if complexities else 0,
+        "max_nesting": max([f["max_nesting"] for f in report["functions"]] + [max_nesting(tree)]),
+        "smells": len(report["smells"]),
+    })
+    return report
+
+
+def format_facts(report):
+    """Render a report as a compact text block to paste into an LLM prompt."""
+    if report["syntax_error"]:
+        return f"Static analysis: the code does not parse ({report['syntax_error']})."
+    summary = report["summary"]
+    lines = [
+        "Static analysis facts (computed with Python's ast, treat as ground truth):",
+        f"- {summary['lines']} lines, {summary['functions']} functions, {summary['classes']} classes",
+        f"- cyclomatic complexity: max {summary['max_complexity']}, average {summary['average_complexity']}",
+    ]
+    for f in report["functions"]:
+        lines.append(f"- `{f['name']}` (line {f['line']}): complexity {f['complexity']}, "
+                     f"nesting {f['max_nesting']}, {f['length']} lines, {f['parameters']} parameters")
+    if report["smells"]:
+        lines.append("Detected smells:")
+        lines.extend(f"- line {s['line']}: {s['message']}" for s in report["smells"])
+    else:
+        lines.append("No smells detected by static analysis.")
+    return "\n".join(lines)
@@ -0,0 +1,204 @@
+"""One embedding model per process, loaded once and kept warm.
+
+Streamlit re-executes app scripts on every interaction, but imported modules
+stay in ``sys.modules``; keeping the model here means every rerun and every
+user session of the process shares the same loaded weights.
+
+The device is picked automatically (CUDA, then Apple MPS, then CPU). On CPU,
+documents are encoded in length-sorted batches sized by a token budget and
+can be spread over several cores; an ONNX (optionally int8-quantized) MiniLM
+export can be used instead of the PyTorch weights. Every knob can be
+overridden with an ``EMBEDDING_*`` environment variable.
+
+Queries from concurrent sessions are micro-batched: the ones that arrive
+while a query is being encoded are encoded together in one forward pass.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+from shared.metrics import stage
+from shared.scheduler import MicroBatcher
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# "torch" (default) or "onnx"; ONNX files ship in the MiniLM hub repo under onnx/
+DEFAULT_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# e.g. "onnx/model_qint8_avx2.onnx" for the int8-quantized export
+ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model.onnx")
+# Rough number of tokens encoded per forward pass; bigger is faster until RAM/cache runs out
+BATCH_TOKENS = {"cpu": 8192, "mps": 16384, "cuda": 32768}
+MAX_BATCH_SIZE = 256
+# "thread" or "process"; only used on CPU when more than one worker is configured
+PARALLEL_MODE = os.getenv("EMBEDDING_PARALLEL", "thread")
+# Below this many texts, parallel encoding costs more than it saves
+PARALLEL_MIN_TEXTS = 512
+
+_lock = threading.Lock()
+_warming_lock = threading.Lock()
+_embedders = {}
+# model name -> background warm-up thread
+_warming = {}
+
+
+def select_device():
+    """``EMBEDDING_DEVICE`` if set, else the fastest device torch can see."""
+    forced = os.getenv("EMBEDDING_DEVICE")
+    if forced:
+        return forced
+    try:
+        import torch
+    except ImportError:
+        return "cpu"
+    if torch.cuda.is_available():
+        return "cuda"
+    if getattr(torch.backends, "mps", None) and torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def default_workers(device):
+    if device != "cpu":
+        return 1
+    return int(os.getenv("EMBEDDING_WORKERS", max(1, (os.cpu_count() or 1) // 2)))
+
+
+def _estimate_tokens(text):
+    # ~4 characters per word piece is close enough for batch sizing
+    return max(1, len(text) // 4)
+
+
+def plan_batches(texts, batch_tokens, max_seq_length):
+    """Group text indices into length-sorted batches under a token budget.
+
+    Sorting by length keeps padding low; the budget lets short chunks go in
+    large batches and long chunks in small ones.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    batches, batch, longest = [], [], 0
+    for i in order:
+        tokens = min(_estimate_tokens(texts[i]), max_seq_length)
+        longest_if_added = max(longest, tokens)
+        if batch and (longest_if_added * (len(batch) + 1) > batch_tokens or len(batch) >= MAX_BATCH_SIZE):
+            batches.append(batch)
+            batch, longest_if_added = [], tokens
+        batch.append(i)
+        longest = longest_if_added
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class LocalEmbeddings(Embeddings):
+    """LangChain embeddings over a sentence-transformers model with a tuned CPU path."""
+
+    def __init__(self, model_name=DEFAULT_MODEL, device=None, backend=DEFAULT_BACKEND, workers=None):
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.device = device or select_device()
+        self.backend = backend
+        self.workers = workers if workers is not None else default_workers(self.device)
+        self.batch_tokens = int(os.getenv("EMBEDDING_BATCH_TOKENS", BATCH_TOKENS.get(self.device, 8192)))
+
+        kwargs = {"device": self.device}
+        if backend == "onnx":
+            kwargs.update(backend="onnx", model_kwargs={"file_name": ONNX_FILE})
+        with stage("embed.load", model=model_name, device=self.device, backend=backend):
+            self.model = SentenceTransformer(model_name, **kwargs)
+        self._pool = None
+        self._executor = None
+        self._queries = MicroBatcher(lambda texts: self._encode(texts).tolist(), name="embed-queries")
+
+    def _encode(self, texts):
+        return self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True, show_progress_bar=False)
+
+    def embed_documents(self, texts):
+        texts = [t.replace("\n", " ") for t in texts]
+        if not texts:
+            return []
+        with stage("embed.documents", texts=len(texts), device=self.device):
+            return self._embed_documents(texts)
+
+    def _embed_documents(self, texts):
+        parallel = self.device == "cpu" and self.workers > 1 and len(texts) >= PARALLEL_MIN_TEXTS
+        if parallel and PARALLEL_MODE == "process":
+            return self._embed_multi_process(texts)
+
+        batches = plan_batches(texts, self.batch_tokens, self.model.max_seq_length)
+        chunks = [[texts[i] for i in batch] for batch in batches]
+        if parallel:
+            # torch and onnxruntime release the GIL inside their kernels
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embed")
+            encoded = list(self._executor.map(self._encode, chunks))
+        else:
+            encoded = [self._encode(chunk) for chunk in chunks]
+
+        vectors = [None] * len(texts)
+        for batch, batch_vectors in zip(batches, encoded):
+            for i, vector in zip(batch, batch_vectors):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def _embed_multi_process(self, texts):
+        if self._pool is None:
+            self._pool = self.model.start_multi_process_pool(["cpu"] * self.workers)
+        longest = max(min(_estimate_tokens(t), self.model.max_seq_length) for t in texts)
+        batch_size = max(1, min(MAX_BATCH_SIZE, self.batch_tokens // longest))
+        return self.model.encode_multi_process(texts, self._pool, batch_size=batch_size).tolist()
+
+    def embed_query(self, text):
+        with stage("embed.query", device=self.device):
+            return self._queries.submit(text.replace("\n", " "))
+
+    def close(self):
+        if self._pool is not None:
+            self.model.stop_multi_process_pool(self._pool)
+            self._pool = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+def get_embedder(model_name=DEFAULT_MODEL, device=None, backend=DEFAULT_BACKEND):
+    """Return the process-wide embedder for this model/device/backend, loading it on first use."""
+    device = device or select_device()
+    key = (model_name, device, backend)
+    embedder = _embedders.get(key)
+    if embedder is not None:
+        return embedder
+    with _lock:
+        # Another session may have finished loading while we waited.
+        if key not in _embedders:
+            _embedders[key] = LocalEmbeddings(model_name, device=device, backend=backend)
+        return _embedders[key]
+
+
+def warm_up(model_name=DEFAULT_MODEL):
+    """Load the model and run one encode so the first real query is not slow."""
+    embedder = get_embedder(model_name)
+    embedder.embed_query("warm-up")
+    return embedder
+
+
+def warm_up_in_background(model_name=DEFAULT_MODEL, on_ready=None):
+    """Start ``warm_up`` on a daemon thread (once per process) and return right away.
+
+    The page renders while the model loads; ``get_embedder`` blocks only if
+    it is needed before loading finished. ``on_ready()`` runs after loading.
+    """
+    with _warming_lock:
+        if model_name in _warming:
+            return _warming[model_name]
+
+        def load():
+            warm_up(model_name)
+            if on_ready:
+                on_ready()
+
+        thread = _warming[model_name] = threading.Thread(target=load, name="embed-warm-up", daemon=True)
+        thread.start()
+        return thread
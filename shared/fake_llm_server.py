@@ -0,0 +1,231 @@
+"""Local stand-in for Ollama and the OpenAI API, for load tests without a model.
+
+    python -m shared.fake_llm_server --port 11500 --ttft 0.3 --tokens-per-second 40 --error-rate 0.02
+    OLLAMA_HOST=http://localhost:11500 OPENAI_BASE_URL=http://localhost:11500/v1 OPENAI_API_KEY=fake \\
+        streamlit run 2.Rag_Ollama/stream_example.py
+
+Unlike ``LLM_BACKEND=fake`` (``FakeBackend``, inside the app process), the
+apps talk to this server over HTTP exactly as they talk to the real ones, so
+connection pooling, streaming, retries and the per-backend concurrency limits
+are all part of what is measured. It serves:
+
+- ``POST /api/chat`` and ``/api/generate``: NDJSON streams with Ollama's final
+  counters (``prompt_eval_count``, ``eval_duration``, ...);
+- ``POST /v1/chat/completions``: server-sent events, with the usage chunk
+  when ``stream_options.include_usage`` is set;
+- ``POST /api/embed``: deterministic unit vectors derived from the text;
+- ``GET /api/tags``, ``/api/version``; ``GET /fake/stats`` for request counts.
+
+Replies are what ``FakeBackend`` would answer (the user's words, or a filled
+JSON schema), stretched to ``--reply-tokens`` for plain text. The first token
+comes after ``--ttft`` seconds, the rest at ``--tokens-per-second``; a share
+``--error-rate`` of generation requests fails with ``--error-status``.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+
+from shared.llm_backends import FakeBackend
+from shared.http_server import read_request, respond, start_chunked, write_chunk
+
+OLLAMA_PATHS = {"/api/chat", "/api/generate"}
+OPENAI_PATHS = {"/v1/chat/completions", "/chat/completions"}
+EMBED_PATHS = {"/api/embed", "/api/embeddings"}
+
+
+class FakeLLMServer:
+    def __init__(self, ttft=0.2, tokens_per_second=50.0, reply_tokens=64, error_rate=0.0, error_status=503,
+                 embedding_dim=384, seed=0):
+        self.ttft = ttft
+        self.token_delay = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.embedding_dim = embedding_dim
+        self._random = random.Random(seed)
+        self._replies = FakeBackend(token_delay=0, first_token_delay=0)
+        self.stats = {"requests": 0, "generations": 0, "embeddings": 0, "errors": 0, "tokens": 0,
+                      "active": 0, "peak_active": 0}
+
+    # --- HTTP plumbing ---
+    async def handle(self, reader, writer):
+        """Serve requests on one connection (keep-alive) until the client closes it."""
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                await self.route(method, path.split("?")[0], body, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # The client gave up mid-stream (e.g. a cancelled inline suggestion)
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body, writer):
+        self.stats["requests"] += 1
+        if method == "GET":
+            if path == "/fake/stats":
+                return await respond(writer, 200, json.dumps(self.stats).encode())
+            if path == "/api/tags":
+                return await respond(writer, 200, b'{"models": [{"name": "codellama:latest"}]}')
+            if path == "/api/version":
+                return await respond(writer, 200, b'{"version": "0.0.0-fake"}')
+            return await respond(writer, 404, b'{"error": "not found"}')
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            return await respond(writer, 400, b'{"error": "invalid JSON"}')
+        if path in EMBED_PATHS:
+            return await self.embed(path, request, writer)
+        if path not in OLLAMA_PATHS | OPENAI_PATHS:
+            return await respond(writer, 404, b'{"error": "not found"}')
+
+        self.stats["generations"] += 1
+        if self._random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            body = json.dumps({"error": {"message": "injected failure"}} if path in OPENAI_PATHS
+                              else {"error": "injected failure"}).encode()
+            # Rate limits come with a Retry-After, like OpenAI's
+            retry_after = {"Retry-After": "1"} if self.error_status == 429 else None
+            return await respond(writer, self.error_status, body, retry_after)
+        self.stats["active"] += 1
+        self.stats["peak_active"] = max(self.stats["peak_active"], self.stats["active"])
+        try:
+            if path in OPENAI_PATHS:
+                await self.openai(request, writer)
+            else:
+                await self.ollama(path, request, writer)
+        finally:
+            self.stats["active"] -= 1
+
+    # --- generation ---
+    def reply(self, messages, model, format):
+        """Reply tokens (leading spaces included) for one request."""
+        text = self._replies.reply(messages, model, format)
+        words = text.split(" ")
+        if not format and len(words) < self.reply_tokens:
+            # Plain text: repeat the echo until it is as long as a real answer
+            words = (words * (self.reply_tokens // len(words) + 1))[:self.reply_tokens]
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    async def tokens(self, tokens):
+        await asyncio.sleep(self.ttft)
+        for i, token in enumerate(tokens):
+            if i and self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            self.stats["tokens"] += 1
+            yield token
+
+    async def ollama(self, path, request, writer):
+        start = time.perf_counter()
+        chat = path == "/api/chat"
+        prompt = request.get("messages") if chat else request.get("prompt", "")
+        tokens = self.reply(prompt, request.get("model", ""), request.get("format"))
+        stream = request.get("stream", True)
+        if stream:
+            await start_chunked(writer, 200, "application/x-ndjson")
+        first = None
+        async for token in self.tokens(tokens):
+            first = first or time.perf_counter()
+            if stream:
+                chunk = {"message": {"role": "assistant", "content": token}} if chat else {"response": token}
+                await write_chunk(writer, json.dumps({"model": request.get("model"), **chunk, "done": False})
+                                   .encode() + b"\n")
+        end = time.perf_counter()
+        prompt_chars = len(json.dumps(prompt))
+        final = {"model": request.get("model"), "done": True, "prompt_eval_count": prompt_chars // 4,
+                 "prompt_eval_duration": int(((first or end) - start) * 1e9), "eval_count": len(tokens),
+                 "eval_duration": int((end - (first or end)) * 1e9), "load_duration": 0,
+                 "total_duration": int((end - start) * 1e9)}
+        if not stream:
+            content = "".join(tokens)
+            final.update({"message": {"role": "assistant", "content": content}} if chat else {"response": content})
+            return await respond(writer, 200, json.dumps(final).encode())
+        final.update({"message": {"role": "assistant", "content": ""}} if chat else {"response": ""})
+        await write_chunk(writer, json.dumps(final).encode() + b"\n")
+        await write_chunk(writer, b"")
+
+    async def openai(self, request, writer):
+        schema = (request.get("response_format") or {}).get("json_schema", {}).get("schema")
+        fmt = schema or ("json" if (request.get("response_format") or {}).get("type") == "json_object" else None)
+        model = request.get("model", "")
+        tokens = self.reply(request.get("messages", []), model, fmt)
+        usage = {"prompt_tokens": len(json.dumps(request.get("messages", []))) // 4,
+                 "completion_tokens": len(tokens)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if not request.get("stream"):
+            content = "".join([token async for token in self.tokens(tokens)])
+            body = {"object": "chat.completion", "model": model, "usage": usage,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content}}]}
+            return await respond(writer, 200, json.dumps(body).encode())
+
+        await start_chunked(writer, 200, "text/event-stream")
+
+        async def event(data):
+            await write_chunk(writer, f"data: {json.dumps(data)}\n\n".encode())
+
+        async for token in self.tokens(tokens):
+            await event({"object": "chat.completion.chunk", "model": model,
+                         "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+        await event({"object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (request.get("stream_options") or {}).get("include_usage"):
+            await event({"object": "chat.completion.chunk", "model": model, "choices": [], "usage": usage})
+        await write_chunk(writer, b"data: [DONE]\n\n")
+        await write_chunk(writer, b"")
+
+    # --- embeddings ---
+    def vector(self, text):
+        """Same text, same unit vector; unrelated texts are close to orthogonal."""
+        rng = random.Random(hashlib.sha256(text.encode()).digest())
+        values = [rng.gauss(0.0, 1.0) for _ in range(self.embedding_dim)]
+        norm = sum(x * x for x in values) ** 0.5 or 1.0
+        return [x / norm for x in values]
+
+    async def embed(self, path, request, writer):
+        self.stats["embeddings"] += 1
+        if path == "/api/embeddings":
+            # Legacy endpoint: one prompt, one "embedding"
+            body = {"embedding": self.vector(request.get("prompt", ""))}
+        else:
+            inputs = request.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            body = {"model": request.get("model"), "embeddings": [self.vector(text) for text in inputs]}
+        await respond(writer, 200, json.dumps(body).encode())
+
+
+async def serve(host, port, **kwargs):
+    server_state = FakeLLMServer(**kwargs)
+    server = await asyncio.start_server(server_state.handle, host, port)
+    port = server.sockets[0].getsockname()[1]
+    # The first line is parsed by benchmarks/bench_load.py (--port 0 picks a free port)
+    print(f"Fake LLM server on http://{host}:{port}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500, help="0 = any free port")
+    parser.add_argument("--ttft", type=float, default=0.2, help="Seconds until the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="After the first token; 0 = no delay")
+    parser.add_argument("--reply-tokens", type=int, default=64, help="Length of plain-text replies")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of generation requests that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of the injected failures")
+    parser.add_argument("--embedding-dim", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for which requests fail")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, ttft=args.ttft, tokens_per_second=args.tokens_per_second,
+                      reply_tokens=args.reply_tokens, error_rate=args.error_rate, error_status=args.error_status,
+                      embedding_dim=args.embedding_dim, seed=args.seed))
+
+
+if __name__ == "__main__":
+    main()
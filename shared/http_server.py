@@ -0,0 +1,52 @@
+"""Minimal asyncio HTTP/1.1 plumbing for the small servers in ``shared/``.
+
+``shared/ollama_scheduler.py`` and ``shared/fake_llm_server.py`` speak just
+enough HTTP for the Ollama and OpenAI clients: keep-alive connections, bodies
+with a ``Content-Length``, JSON answers and chunked streams. Serve a
+connection with ``asyncio.start_server`` and loop over ``read_request``.
+"""
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error",
+           502: "Bad Gateway", 503: "Service Unavailable"}
+
+
+async def read_request(reader):
+    """``(method, path, headers, body)`` of the next request, or None once the client closes the connection."""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    method, path, _ = line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", "0"))
+    body = await reader.readexactly(length) if length else b""
+    return method, path, headers, body
+
+
+async def start_chunked(writer, status, content_type):
+    """Send the head of a streamed answer; follow with ``write_chunk`` calls and ``write_chunk(writer, b"")``."""
+    writer.write(f"HTTP/1.1 {status} {reason(status)}\r\nContent-Type: {content_type}\r\n"
+                 f"Transfer-Encoding: chunked\r\n\r\n".encode())
+    await writer.drain()
+
+
+async def write_chunk(writer, data):
+    writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+    await writer.drain()
+
+
+async def respond(writer, status, body, extra_headers=None):
+    """Send a complete (JSON by default) answer."""
+    headers = {"Content-Type": "application/json", "Content-Length": str(len(body)), **(extra_headers or {})}
+    head = "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    writer.write(f"HTTP/1.1 {status} {reason(status)}\r\n{head}\r\n".encode() + body)
+    await writer.drain()
+
+
+def reason(status):
+    return REASONS.get(status, "Status")
@@ -0,0 +1,550 @@
+"""One async interface for every LLM backend the apps use.
+
+``OpenAIBackend``, ``OllamaBackend`` and ``FakeBackend`` all stream chat
+replies with the same signature. A plain string instead of a message list
+is a raw prompt, sent without a chat template (Ollama's ``/api/generate``
+with ``raw``), e.g. for fill-in-the-middle code completion; backends without
+raw completion send it as a single user message. Each backend owns:
+
+- a pooled ``httpx.AsyncClient`` (keep-alive connections, per-chunk read timeout);
+- a concurrency limit shared by every caller in the process; callers beyond
+  the limit wait in line (``shared/scheduler.py``: interactive before batch
+  work, round-robin across users), and when the line is too long or the wait
+  too long the request fails fast with an ``overloaded`` error instead of
+  timing out somewhere downstream;
+- exponential-backoff retries (with jitter, honouring ``Retry-After``) on
+  429, 5xx and connection errors, as long as no token has been streamed yet.
+
+Failures are raised as ``LLMError`` with a ``kind`` (``rate_limited``,
+``unavailable``, ``timeout``, ``overloaded``, ``auth``, ``bad_request``,
+``error``) instead of being folded into the answer text.
+
+Streamlit scripts and worker threads are synchronous, so the backends run on
+one background event loop; ``stream()`` / ``complete()`` are the blocking
+entry points, go through the shared response cache, and closing a
+``stream()`` iterator early cancels the request.
+
+Every request is recorded in ``shared/metrics.py``: queue wait, time to
+first token, tokens/sec, prompt/completion tokens and, for Ollama, model
+load / prefill / generation time.
+
+Who is asking and how urgent it is (``set_client``) is sent along to
+Ollama as ``X-LLM-User`` / ``X-LLM-Priority`` headers, which the shared
+scheduler in front of a common Ollama host (``shared/ollama_scheduler.py``)
+uses for fair queuing across apps.
+
+Set ``LLM_BACKEND=fake`` to route every call to the fake backend (no network,
+deterministic answers) for tests and demos.
+"""
+import asyncio
+import contextvars
+import getpass
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+
+from shared.llm_cache import cached_stream
+from shared.metrics import get_metrics
+from shared.ollama_client import KEEP_ALIVE, OLLAMA_HOST, READ_TIMEOUT, STAT_FIELDS, get_client
+from shared.scheduler import FairScheduler, SchedulerOverloaded
+
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+BACKOFF_SECONDS = float(os.getenv("LLM_BACKOFF_SECONDS", "1.0"))
+MAX_BACKOFF_SECONDS = 30.0
+# Longest wait for a free slot, and how many callers may wait per backend
+QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "120"))
+MAX_QUEUED = int(os.getenv("LLM_MAX_QUEUED", "64"))
+MAX_QUEUED_PER_USER = int(os.getenv("LLM_MAX_QUEUED_PER_USER", "16"))
+BACKEND_OVERRIDE = os.getenv("LLM_BACKEND", "")
+# "interactive" or "batch"; see shared/scheduler.py
+DEFAULT_PRIORITY = os.getenv("LLM_PRIORITY", "interactive")
+
+# Max in-flight requests per backend for the whole process
+LIMITS = {
+    "openai": int(os.getenv("OPENAI_MAX_CONCURRENCY", "5")),
+    # Ollama only runs requests in parallel up to its OLLAMA_NUM_PARALLEL setting
+    "ollama": int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2")),
+    "fake": int(os.getenv("FAKE_MAX_CONCURRENCY", "8")),
+}
+
+RETRY_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+_client = contextvars.ContextVar("llm_client", default=None)
+
+
+def _default_user():
+    try:
+        return os.getenv("LLM_USER") or getpass.getuser()
+    except Exception:
+        return "anonymous"
+
+
+DEFAULT_USER = _default_user()
+
+
+_default_client = {"user": DEFAULT_USER, "priority": DEFAULT_PRIORITY}
+
+
+def set_client(user=None, priority=None, process_wide=False):
+    """Who the following requests of this thread are for, and how urgent: "interactive" or "batch".
+
+    ``process_wide`` sets the default for every thread instead, e.g. for a batch job's worker pool.
+    """
+    client = {"user": user or _default_client["user"], "priority": priority or _default_client["priority"]}
+    if process_wide:
+        _default_client.update(client)
+    else:
+        _client.set(client)
+
+
+def current_client():
+    return _client.get() or dict(_default_client)
+
+
+class LLMError(Exception):
+    """A backend call failed; ``kind`` says how, ``retryable`` whether trying again may help."""
+
+    def __init__(self, message, backend=None, kind="error", status=None, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.backend = backend
+        self.kind = kind
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+    def __str__(self):
+        where = f"{self.backend} " if self.backend else ""
+        status = f" (HTTP {self.status})" if self.status else ""
+        return f"{where}{self.kind}{status}: {self.args[0]}"
+
+
+def as_messages(prompt, system=None):
+    """Chat messages for a single prompt."""
+    messages = [{"role": "system", "content": system}] if system else []
+    return messages + [{"role": "user", "content": prompt}]
+
+
+def _prompt_chars(messages):
+    return len(messages) if isinstance(messages, str) else sum(len(m["content"]) for m in messages)
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("retry-after", ""))
+    except ValueError:
+        return None
+
+
+def _status_kind(status):
+    return {429: "rate_limited", 401: "auth", 403: "auth", 400: "bad_request", 404: "bad_request"}.get(
+        status, "unavailable" if status >= 500 else "error")
+
+
+def _http_error(backend, response):
+    status = response.status_code
+    try:
+        detail = response.json()
+        detail = detail.get("error", detail)
+        detail = detail.get("message", detail) if isinstance(detail, dict) else detail
+    except ValueError:
+        detail = response.text
+    return LLMError(str(detail).strip()[:500], backend, _status_kind(status), status,
+                    retryable=status in RETRY_STATUSES, retry_after=_retry_after(response))
+
+
+class Backend:
+    """Concurrency limit, queueing and retries around one backend's ``_stream_once``."""
+
+    name = "base"
+
+    def __init__(self, max_concurrency=None, max_queued=MAX_QUEUED, queue_timeout=QUEUE_TIMEOUT,
+                 max_retries=MAX_RETRIES):
+        self.max_concurrency = max_concurrency or LIMITS.get(self.name, 4)
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        # Only used from the background event loop
+        self.scheduler = FairScheduler(self.max_concurrency, max_queued, MAX_QUEUED_PER_USER)
+
+    def set_max_concurrency(self, limit):
+        """Change the in-flight limit, e.g. batch_analyze's ``--llm-concurrency``."""
+        self.max_concurrency = limit
+        # The scheduler belongs to the event loop thread
+        _get_loop().call_soon_threadsafe(self.scheduler.resize, limit)
+
+    def _stream_once(self, messages, model, temperature, options, format, stats):
+        """One attempt: an async iterator of reply tokens."""
+        raise NotImplementedError
+
+    @asynccontextmanager
+    async def _slot(self):
+        client = current_client()
+        try:
+            await asyncio.wait_for(self.scheduler.acquire(client["user"], client["priority"]), self.queue_timeout)
+        except SchedulerOverloaded as e:
+            raise LLMError(str(e), self.name, "overloaded")
+        except asyncio.TimeoutError:
+            raise LLMError(f"no free slot within {self.queue_timeout:.0f}s", self.name, "overloaded")
+        try:
+            yield
+        finally:
+            self.scheduler.release()
+
+    async def stream(self, messages, model, temperature=0.0, options=None, format=None, stats=None):
+        """Yield reply tokens; waits for a slot, retries transient failures before the first token."""
+        metrics = get_metrics()
+        stats = {} if stats is None else stats
+        start = time.perf_counter()
+        ttft, chunks = None, 0
+        try:
+            async with self._slot():
+                metrics.observe_stage(f"{self.name}.queue_wait", time.perf_counter() - start)
+                async for token in self._stream_with_retries(messages, model, temperature, options, format, stats):
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    chunks += 1
+                    yield token
+        except LLMError as e:
+            metrics.record_error(self.name, model, e.kind)
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            metrics.record_error(self.name, model, "cancelled")
+            raise
+
+        metrics.record_llm(
+            self.name, model,
+            prompt_tokens=stats.get("prompt_eval_count") or _prompt_chars(messages) // 4,
+            completion_tokens=stats.get("eval_count") or chunks,
+            ttft=ttft, duration=time.perf_counter() - start,
+        )
+        # Ollama's own breakdown of where the time went, in nanoseconds
+        for field, stage_name in (("load_duration", "load"), ("prompt_eval_duration", "prefill"),
+                                  ("eval_duration", "generate")):
+            if stats.get(field):
+                metrics.observe_stage(f"{self.name}.{stage_name}", stats[field] / 1e9)
+
+    async def _stream_with_retries(self, messages, model, temperature, options, format, stats):
+        attempt = 0
+        while True:
+            streamed = False
+            try:
+                async for token in self._stream_once(messages, model, temperature, options, format, stats):
+                    streamed = True
+                    yield token
+                return
+            except httpx.TimeoutException as e:
+                error = LLMError(f"no response within the timeout ({e.__class__.__name__})", self.name,
+                                 "timeout", retryable=True)
+            except httpx.TransportError as e:
+                error = LLMError(f"connection failed: {e}", self.name, "unavailable", retryable=True)
+            except LLMError as e:
+                error = e
+            # A partly streamed answer cannot be resumed; neither can a request that will fail again
+            if streamed or not error.retryable or attempt >= self.max_retries:
+                raise error
+            delay = error.retry_after or min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** attempt)
+            await asyncio.sleep(delay * random.uniform(0.75, 1.25))
+            attempt += 1
+
+    async def complete(self, messages, model, temperature=0.0, options=None, format=None, stats=None):
+        tokens = [t async for t in self.stream(messages, model, temperature, options, format, stats)]
+        return "".join(tokens).strip()
+
+    def status(self):
+        status = self.scheduler.status()
+        return {"backend": self.name, "active": status["active"], "waiting": status["waiting"],
+                "limit": self.max_concurrency, "by_priority": status["by_priority"]}
+
+    async def aclose(self):
+        pass
+
+
+class _HTTPBackend(Backend):
+    base_url = ""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._client = None
+
+    def headers(self):
+        return {}
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers(),
+                timeout=httpx.Timeout(connect=5.0, read=READ_TIMEOUT, write=30.0, pool=QUEUE_TIMEOUT),
+                limits=httpx.Limits(max_connections=max(16, self.max_concurrency * 2),
+                                    max_keepalive_connections=max(8, self.max_concurrency)),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class OllamaBackend(_HTTPBackend):
+    name = "ollama"
+    base_url = OLLAMA_HOST
+
+    async def _stream_once(self, messages, model, temperature, options, format, stats):
+        payload = {"model": model, "stream": True, "keep_alive": KEEP_ALIVE,
+                   "options": {"temperature": temperature, **(options or {})}}
+        if isinstance(messages, str):
+            # Raw prompt: the caller already applied the model's (e.g. fill-in-the-middle) template
+            path = "/api/generate"
+            payload.update(prompt=messages, raw=True)
+        else:
+            path = "/api/chat"
+            payload["messages"] = messages
+        if format:
+            payload["format"] = format
+        client = current_client()
+        headers = {"X-LLM-User": client["user"], "X-LLM-Priority": client["priority"]}
+        async with self.client.stream("POST", path, json=payload, headers=headers) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise _http_error(self.name, response)
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise LLMError(chunk["error"], self.name)
+                # /api/generate streams "response", /api/chat "message"
+                token = chunk.get("response") or (chunk.get("message") or {}).get("content")
+                if token:
+                    yield token
+                if chunk.get("done"):
+                    if stats is not None:
+                        stats.update({k: chunk[k] for k in STAT_FIELDS if k in chunk})
+                    return
+
+
+class OpenAIBackend(_HTTPBackend):
+    """Chat Completions over server-sent events; the API key is read once, not set per call."""
+
+    name = "openai"
+    base_url = OPENAI_BASE_URL
+
+    def __init__(self, api_key=None, **kwargs):
+        super().__init__(**kwargs)
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY", "")
+
+    def headers(self):
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    async def _stream_once(self, messages, model, temperature, options, format, stats):
+        if not self.api_key:
+            raise LLMError("OPENAI_API_KEY is not set", self.name, "auth")
+        if isinstance(messages, str):
+            messages = as_messages(messages)
+        payload = {"model": model, "messages": messages, "temperature": temperature, "stream": True,
+                   "stream_options": {"include_usage": True}, **(options or {})}
+        if isinstance(format, dict):
+            payload["response_format"] = {"type": "json_schema",
+                                          "json_schema": {"name": "response", "schema": format}}
+        elif format == "json":
+            payload["response_format"] = {"type": "json_object"}
+        async with self.client.stream("POST", "/chat/completions", json=payload) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise _http_error(self.name, response)
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                chunk = json.loads(data)
+                if chunk.get("usage") and stats is not None:
+                    # Same names as Ollama's counters
+                    stats.update(prompt_eval_count=chunk["usage"].get("prompt_tokens"),
+                                 eval_count=chunk["usage"].get("completion_tokens"))
+                for choice in chunk.get("choices", []):
+                    token = (choice.get("delta") or {}).get("content")
+                    if token:
+                        yield token
+
+
+def _fake_value(schema):
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: _fake_value(sub) for name, sub in schema.get("properties", {}).items()}
+    if kind == "integer":
+        return schema.get("minimum", 0) + (schema.get("maximum", 10) - schema.get("minimum", 0)) // 2
+    if kind == "number":
+        return 0.5
+    if kind == "boolean":
+        return True
+    if kind == "array":
+        return []
+    return "fake answer"
+
+
+class FakeBackend(Backend):
+    """Deterministic local backend: no network, configurable latency and failures.
+
+    Replies echo the last user message (or fill a JSON schema), one word per
+    token. The first ``failures`` calls fail with HTTP ``failure_status``, so
+    retries and error handling can be exercised.
+    """
+
+    name = "fake"
+
+    def __init__(self, token_delay=None, first_token_delay=None, failures=0, failure_status=503, **kwargs):
+        super().__init__(**kwargs)
+        self.token_delay = float(os.getenv("LLM_FAKE_TOKEN_DELAY", "0.01")) if token_delay is None else token_delay
+        self.first_token_delay = (float(os.getenv("LLM_FAKE_FIRST_TOKEN_DELAY", "0.05"))
+                                  if first_token_delay is None else first_token_delay)
+        self.failures = failures
+        self.failure_status = failure_status
+        self.calls = 0
+
+    def reply(self, messages, model, format):
+        if isinstance(format, dict):
+            return json.dumps(_fake_value(format))
+        if format == "json":
+            return "{}"
+        if isinstance(messages, str):
+            messages = as_messages(messages)
+        question = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        words = question.split()
+        return f"[{model}] " + " ".join(words[:40])
+
+    async def _stream_once(self, messages, model, temperature, options, format, stats):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise LLMError("injected failure", self.name, _status_kind(self.failure_status), self.failure_status,
+                           retryable=self.failure_status in RETRY_STATUSES)
+        await asyncio.sleep(self.first_token_delay)
+        words = self.reply(messages, model, format).split(" ")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            yield word if i == 0 else " " + word
+        if stats is not None:
+            stats.update(prompt_eval_count=_prompt_chars(messages) // 4, eval_count=len(words))
+
+
+BACKENDS = {"openai": OpenAIBackend, "ollama": OllamaBackend, "fake": FakeBackend}
+
+_backends = {}
+_backends_lock = threading.Lock()
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_backend(name):
+    """Process-wide backend instance for ``name`` (``LLM_BACKEND=fake`` overrides every name)."""
+    name = BACKEND_OVERRIDE or name
+    if name not in BACKENDS:
+        raise ValueError(f"unknown LLM backend {name!r} (expected one of {', '.join(BACKENDS)})")
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
+
+
+# === SYNC BRIDGE ===
+def _get_loop():
+    """Background event loop shared by every sync caller in the process."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-backends", daemon=True).start()
+        return _loop
+
+
+def _iterate(make_stream):
+    """Run the async iterator from ``make_stream()`` on the background loop and yield its items."""
+    items = queue.Queue()
+    # The loop thread has its own context; carry over who the request is for
+    client = current_client()
+
+    async def pump():
+        _client.set(client)
+        try:
+            async for item in make_stream():
+                items.put(("item", item))
+            items.put(("done", None))
+        except asyncio.CancelledError:
+            items.put(("done", None))
+            raise
+        except Exception as e:
+            items.put(("error", e))
+
+    future = asyncio.run_coroutine_threadsafe(pump(), _get_loop())
+    try:
+        while True:
+            kind, value = items.get()
+            if kind == "item":
+                yield value
+            elif kind == "error":
+                raise value
+            else:
+                return
+    finally:
+        # The consumer stopped early (closed iterator, Streamlit rerun): stop the request too
+        future.cancel()
+
+
+def stream(backend, messages, model, temperature=0.0, options=None, format=None, stats=None, cache=True):
+    """Blocking token iterator for one chat request (or raw prompt string), served from the response cache when possible.
+
+    Raises ``LLMError`` on failure. ``stats`` is filled with the server's
+    token counters when the answer is generated (not on cache hits).
+    """
+    instance = get_backend(backend)
+
+    def generate():
+        return _iterate(lambda: instance.stream(messages, model, temperature, options, format, stats))
+
+    if not cache:
+        return generate()
+    # The JSON schema / options change the answer, so they are part of the cache key
+    return cached_stream(instance.name, model, messages, temperature, generate, format=format, options=options)
+
+
+def complete(backend, messages, model, temperature=0.0, options=None, format=None, stats=None, cache=True):
+    """Blocking whole-answer version of ``stream``."""
+    return "".join(stream(backend, messages, model, temperature, options, format, stats, cache)).strip()
+
+
+def backend_status():
+    """Active / waiting / limit for every backend used so far, e.g. for a sidebar."""
+    with _backends_lock:
+        return [backend.status() for backend in _backends.values()]
+
+
+_remote_status = {"checked": 0.0, "value": None, "supported": True}
+
+
+def scheduler_status(max_age=2.0):
+    """Queue of the shared scheduler at ``OLLAMA_HOST``, or None when Ollama is reached directly."""
+    now = time.monotonic()
+    # A plain Ollama answers 404, and a host that is down would cost every rerun the
+    # timeout; ask again only once a minute in those cases
+    if now - _remote_status["checked"] < (max_age if _remote_status["supported"] else 60.0):
+        return _remote_status["value"]
+    _remote_status["checked"] = now
+    try:
+        response = get_client().get("/scheduler/status", timeout=0.5)
+        _remote_status["supported"] = response.status_code == 200
+        _remote_status["value"] = response.json() if response.status_code == 200 else None
+    except (httpx.HTTPError, ValueError):
+        _remote_status["supported"] = False
+        _remote_status["value"] = None
+    return _remote_status["value"]
@@ -0,0 +1,197 @@
+"""Response cache for LLM calls, shared by every app.
+
+Entries are keyed by backend, model, normalized prompt, temperature and any
+extra request options. Lookups go through a small in-memory LRU first, then
+an on-disk SQLite file that all apps (and processes) share. Entries expire
+after a TTL and the disk tier is trimmed to a size budget, least recently
+used first.
+
+Only requests at temperature 0 are cached by default; other temperatures are
+meant to vary between runs. Set ``LLM_CACHE_ALL_TEMPERATURES=1`` to cache
+them too, or ``LLM_CACHE_DISABLED=1`` to turn the cache off.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", Path(__file__).resolve().parents[1] / ".llm_cache" / "llm_cache.sqlite"))
+MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "256"))
+MAX_DISK_BYTES = int(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024
+TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_HOURS", "168")) * 3600
+CACHE_ALL_TEMPERATURES = os.getenv("LLM_CACHE_ALL_TEMPERATURES", "") == "1"
+DISABLED = os.getenv("LLM_CACHE_DISABLED", "") == "1"
+
+
+def normalize_prompt(prompt):
+    """Ignore differences that do not change the request: line endings and trailing spaces."""
+    if not isinstance(prompt, str):
+        # Chat message lists and similar structures
+        prompt = json.dumps(prompt, sort_keys=True, ensure_ascii=False)
+    lines = prompt.replace("\r\n", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def cache_key(backend, model, prompt, temperature, **extra):
+    payload = json.dumps({
+        "backend": backend,
+        "model": model,
+        "prompt": normalize_prompt(prompt),
+        "temperature": round(float(temperature or 0), 3),
+        "extra": extra,
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LLMCache:
+    """In-memory LRU in front of a SQLite table, with TTL and size-based eviction."""
+
+    def __init__(self, path=CACHE_PATH, memory_items=MEMORY_ITEMS, max_disk_bytes=MAX_DISK_BYTES, ttl=TTL_SECONDS):
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False, timeout=10)
+        # WAL lets the apps' processes read while another one writes
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL,"
+            " accessed REAL NOT NULL, size INTEGER NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._db.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] <= self.ttl:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry[0]
+            self._memory.pop(key, None)
+
+            row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+                self.stats["misses"] += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self._remember(key, row[0], row[1])
+            self.stats["disk_hits"] += 1
+            return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        size = len(value.encode())
+        with self._lock:
+            self._remember(key, value, now)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                (key, value, now, now, size),
+            )
+            self._trim_disk()
+            self._db.commit()
+            self.stats["stores"] += 1
+
+    def _remember(self, key, value, created):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _trim_disk(self):
+        self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if total <= self.max_disk_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._memory.pop(key, None)
+            total -= size
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def summary(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        lookups = hits + self.stats["misses"]
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {**self.stats, "hits": hits, "hit_rate": hits / lookups if lookups else 0.0,
+                "entries": entries, "disk_bytes": size}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process-wide cache (one SQLite connection shared by all sessions)."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache()
+    return _cache
+
+
+def is_cacheable(temperature):
+    return not DISABLED and (CACHE_ALL_TEMPERATURES or not temperature)
+
+
+def cached_call(backend, model, prompt, temperature, compute, **extra):
+    """Return the cached answer or ``compute()``'s, storing it on success.
+
+    Exceptions from ``compute`` propagate and nothing is stored, so errors
+    are never served from the cache.
+    """
+    if not is_cacheable(temperature):
+        return compute()
+    cache = get_cache()
+    key = cache_key(backend, model, prompt, temperature, **extra)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value)
+    return value
+
+
+def cached_stream(backend, model, prompt, temperature, stream, **extra):
+    """Streaming version of ``cached_call``: ``stream()`` returns a token iterator.
+
+    A hit yields the stored answer as one token; a miss streams through and
+    stores the answer once the stream completes without raising.
+    """
+    if not is_cacheable(temperature):
+        yield from stream()
+        return
+    cache = get_cache()
+    key = cache_key(backend, model, prompt, temperature, **extra)
+    value = cache.get(key)
+    if value is not None:
+        yield value
+        return
+    tokens = []
+    for token in stream():
+        tokens.append(token)
+        yield token
+    cache.set(key, "".join(tokens))
@@ -0,0 +1,223 @@
+"""Latency and token-usage instrumentation shared by every app.
+
+Two kinds of measurements, kept per process:
+
+- pipeline stages (``with stage("rag.retrieve"): ...``): PDF parsing,
+  splitting, embedding, vector search, static analysis, queue waits, model
+  load, prefill ... each one a latency summary (count, mean, p50, p95, max);
+- LLM requests, per backend and model: prompt and completion tokens,
+  time to first token, tokens/sec and errors by kind. ``shared/llm_backends.py``
+  records these for every request it sends.
+
+The numbers are shown by ``render_metrics`` (``shared/streamlit_helpers.py``)
+and can be exported for dashboards:
+
+- ``METRICS_JSONL=path`` appends one JSON line per measurement;
+- ``METRICS_PORT=9101`` serves the Prometheus text format at ``/metrics``.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+JSONL_PATH = os.getenv("METRICS_JSONL", "")
+PORT = int(os.getenv("METRICS_PORT", "0"))
+# Name of this process in exported metrics (several apps may write the same file)
+APP = os.getenv("METRICS_APP") or Path(sys.argv[0]).stem or "python"
+# Recent samples kept per series for the percentiles
+SAMPLES = 512
+
+_lock = threading.Lock()
+_metrics = None
+
+
+class Summary:
+    """Count and total of every observation, percentiles over the most recent ones."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.recent = deque(maxlen=SAMPLES)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.last = value
+        self.recent.append(value)
+
+    def quantile(self, q):
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self):
+        return {"count": self.count, "mean": self.total / self.count if self.count else 0.0,
+                "p50": self.quantile(0.5), "p95": self.quantile(0.95), "max": self.max, "last": self.last}
+
+
+class Metrics:
+    def __init__(self, jsonl_path=JSONL_PATH):
+        self.jsonl_path = jsonl_path
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.llm = {}
+        self.errors = {}
+
+    # --- recording ---
+    def observe_stage(self, name, seconds, **fields):
+        with self._lock:
+            self.stages.setdefault(name, Summary()).observe(seconds)
+        self._write({"type": "stage", "stage": name, "seconds": round(seconds, 6), **fields})
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """Time the ``with`` block as stage ``name``; the yielded dict adds fields to the JSON line."""
+        extra = dict(fields)
+        start = time.perf_counter()
+        try:
+            yield extra
+        finally:
+            self.observe_stage(name, time.perf_counter() - start, **extra)
+
+    def record_llm(self, backend, model, prompt_tokens=0, completion_tokens=0, ttft=None, duration=0.0):
+        with self._lock:
+            series = self.llm.setdefault((backend, model), {
+                "requests": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "ttft": Summary(), "duration": Summary(), "tokens_per_second": Summary(),
+            })
+            series["requests"] += 1
+            series["prompt_tokens"] += prompt_tokens or 0
+            series["completion_tokens"] += completion_tokens or 0
+            if ttft is not None:
+                series["ttft"].observe(ttft)
+            series["duration"].observe(duration)
+            # Generation speed after the first token, the number users feel while reading
+            generating = duration - (ttft or 0.0)
+            if completion_tokens and generating > 0:
+                series["tokens_per_second"].observe(completion_tokens / generating)
+        self._write({"type": "llm", "backend": backend, "model": model, "prompt_tokens": prompt_tokens,
+                     "completion_tokens": completion_tokens, "ttft": None if ttft is None else round(ttft, 6),
+                     "seconds": round(duration, 6)})
+
+    def record_error(self, backend, model, kind):
+        with self._lock:
+            self.errors[(backend, model, kind)] = self.errors.get((backend, model, kind), 0) + 1
+        self._write({"type": "llm_error", "backend": backend, "model": model, "kind": kind})
+
+    def _write(self, event):
+        if not self.jsonl_path:
+            return
+        line = json.dumps({"ts": round(time.time(), 3), "app": APP, **event}, default=str)
+        with self._lock:
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    # --- reading ---
+    def snapshot(self):
+        with self._lock:
+            return {
+                "stages": {name: summary.snapshot() for name, summary in sorted(self.stages.items())},
+                "llm": [{"backend": backend, "model": model, "requests": s["requests"],
+                         "prompt_tokens": s["prompt_tokens"], "completion_tokens": s["completion_tokens"],
+                         "ttft": s["ttft"].snapshot(), "duration": s["duration"].snapshot(),
+                         "tokens_per_second": s["tokens_per_second"].snapshot()}
+                        for (backend, model), s in sorted(self.llm.items())],
+                "errors": [{"backend": b, "model": m, "kind": k, "count": n}
+                           for (b, m, k), n in sorted(self.errors.items())],
+            }
+
+    def prometheus_text(self):
+        """All series in the Prometheus text exposition format."""
+        snap = self.snapshot()
+        lines = []
+
+        def summary(name, help_text, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} summary")
+            for labels, values in series:
+                for q in ("p50", "p95"):
+                    quantile = "0.5" if q == "p50" else "0.95"
+                    lines.append(f'{name}{{{labels},quantile="{quantile}"}} {values[q]:.6f}')
+                lines.append(f"{name}_sum{{{labels}}} {values['mean'] * values['count']:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {values['count']}")
+
+        def counter(name, help_text, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{{{labels}}} {value}" for labels, value in series)
+
+        app = f'app="{APP}"'
+        summary("pipeline_stage_seconds", "Duration of a pipeline stage.",
+                [(f'{app},stage="{name}"', values) for name, values in snap["stages"].items()])
+        llm = [(f'{app},backend="{s["backend"]}",model="{s["model"]}"', s) for s in snap["llm"]]
+        counter("llm_requests_total", "LLM requests completed.", [(labels, s["requests"]) for labels, s in llm])
+        counter("llm_prompt_tokens_total", "Prompt tokens sent.", [(labels, s["prompt_tokens"]) for labels, s in llm])
+        counter("llm_completion_tokens_total", "Completion tokens received.",
+                [(labels, s["completion_tokens"]) for labels, s in llm])
+        summary("llm_time_to_first_token_seconds", "Time from request to first token.",
+                [(labels, s["ttft"]) for labels, s in llm])
+        summary("llm_tokens_per_second", "Generation speed after the first token.",
+                [(labels, s["tokens_per_second"]) for labels, s in llm])
+        counter("llm_errors_total", "Failed LLM requests by kind.",
+                [(f'{app},backend="{e["backend"]}",model="{e["model"]}",kind="{e["kind"]}"', e["count"])
+                 for e in snap["errors"]])
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+            self.llm.clear()
+            self.errors.clear()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = get_metrics().prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server(port):
+    """Serve ``/metrics`` on ``port`` from a daemon thread; False if the port is taken."""
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", port), _Handler)
+    except OSError:
+        # Another app already exports on this port
+        return False
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return True
+
+
+def get_metrics():
+    """Process-wide registry; starts the ``/metrics`` endpoint on first use when ``METRICS_PORT`` is set."""
+    global _metrics
+    if _metrics is None:
+        with _lock:
+            if _metrics is None:
+                _metrics = Metrics()
+                if PORT:
+                    start_http_server(PORT)
+    return _metrics
+
+
+def stage(name, **fields):
+    """Shortcut for ``get_metrics().stage(name)``."""
+    return get_metrics().stage(name, **fields)
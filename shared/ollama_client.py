@@ -0,0 +1,154 @@
+"""Streaming client for the Ollama HTTP API.
+
+Replaces ``subprocess.run(["ollama", "run", model])``: one pooled keep-alive
+connection per process instead of a CLI fork per call, and tokens are yielded
+as soon as the server produces them. The read timeout applies between chunks,
+not to the whole generation, so a slow model that keeps producing tokens is
+never cut off.
+
+Every request asks Ollama to keep the model resident (``keep_alive``), and
+the server reuses its KV cache for the longest prefix a new prompt shares
+with the previous one on that model. Keeping prompts append-only - a stable
+system prompt and history, new text at the end - therefore means only the
+new suffix is prefilled. ``ChatSession`` does that for multi-turn chat.
+"""
+import json
+import os
+import threading
+
+import httpx
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434").rstrip("/")
+if not OLLAMA_HOST.startswith("http"):
+    OLLAMA_HOST = f"http://{OLLAMA_HOST}"
+
+# Max seconds without a new chunk; the first one also waits for the model to load.
+READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "300"))
+# How long the model (and its KV cache) stays loaded after a request; "-1" = forever
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class OllamaError(Exception):
+    """The Ollama server could not be reached or returned an error."""
+
+
+def get_client():
+    """Process-wide ``httpx.Client``; its pool keeps connections to Ollama alive."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    base_url=OLLAMA_HOST,
+                    timeout=httpx.Timeout(connect=5.0, read=READ_TIMEOUT, write=30.0, pool=30.0),
+                    limits=httpx.Limits(max_connections=16, max_keepalive_connections=8),
+                )
+    return _client
+
+
+# Counters Ollama sends with the final chunk of a generation
+STAT_FIELDS = ("prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration",
+               "load_duration", "total_duration")
+
+
+def _stream(path, payload, extract, model, stats):
+    """POST ``payload`` to ``path`` and yield ``extract(chunk)`` for every NDJSON chunk."""
+    try:
+        with get_client().stream("POST", path, json=payload) as response:
+            if response.status_code != 200:
+                response.read()
+                raise OllamaError(f"HTTP {response.status_code}: {response.text.strip()}")
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise OllamaError(chunk["error"])
+                token = extract(chunk)
+                if token:
+                    yield token
+                if chunk.get("done"):
+                    if stats is not None:
+                        stats.update({k: chunk[k] for k in STAT_FIELDS if k in chunk})
+                    return
+    except httpx.ReadTimeout:
+        raise OllamaError(f"no output from {model} for {READ_TIMEOUT:.0f}s")
+    except httpx.HTTPError as e:
+        raise OllamaError(f"cannot reach Ollama at {OLLAMA_HOST}: {e}")
+
+
+def _payload(model, options, format, keep_alive, **fields):
+    payload = {"model": model, "stream": True, "keep_alive": keep_alive, **fields}
+    if options:
+        payload["options"] = options
+    if format:
+        payload["format"] = format
+    return payload
+
+
+def stream_generate(prompt, model, system=None, options=None, format=None, stats=None, keep_alive=KEEP_ALIVE):
+    """Yield response tokens from ``/api/generate`` as they arrive.
+
+    ``format`` is passed through to Ollama: ``"json"`` or a JSON schema dict
+    constrains the output to valid JSON. If ``stats`` is a dict it is filled
+    with the server's counters (``prompt_eval_count`` = prompt tokens
+    actually evaluated, ``prompt_eval_duration`` = prefill time, ...) once the
+    generation is done.
+    """
+    payload = _payload(model, options, format, keep_alive, prompt=prompt)
+    if system:
+        payload["system"] = system
+    yield from _stream("/api/generate", payload, lambda chunk: chunk.get("response"), model, stats)
+
+
+def stream_chat(messages, model, options=None, format=None, stats=None, keep_alive=KEEP_ALIVE):
+    """Yield reply tokens from ``/api/chat`` for ``[{"role": ..., "content": ...}]`` messages.
+
+    Unlike a flattened transcript, the model's own chat template is applied,
+    and an unchanged message history is an unchanged prompt prefix.
+    """
+    payload = _payload(model, options, format, keep_alive, messages=messages)
+    yield from _stream("/api/chat", payload, lambda chunk: (chunk.get("message") or {}).get("content"), model, stats)
+
+
+class ChatSession:
+    """Append-only multi-turn chat: each turn only adds to the end of the prompt.
+
+    The system prompt and earlier turns are re-sent byte for byte, so Ollama
+    finds them in its KV cache and prefills just the new user message.
+    ``stats`` keeps the server counters of every turn.
+    """
+
+    def __init__(self, model, system=None, options=None, keep_alive=KEEP_ALIVE):
+        self.model = model
+        self.options = options
+        self.keep_alive = keep_alive
+        self.messages = [{"role": "system", "content": system}] if system else []
+        self.stats = []
+
+    def send(self, content):
+        """Stream the reply to ``content``; the exchange is recorded once the reply is complete."""
+        messages = self.messages + [{"role": "user", "content": content}]
+        stats, tokens = {}, []
+        for token in stream_chat(messages, self.model, options=self.options, stats=stats, keep_alive=self.keep_alive):
+            tokens.append(token)
+            yield token
+        self.messages = messages + [{"role": "assistant", "content": "".join(tokens)}]
+        self.stats.append(stats)
+
+
+def preload(model, keep_alive=KEEP_ALIVE):
+    """Load ``model`` into memory ahead of the first request (an empty generate does only that)."""
+    try:
+        get_client().post("/api/generate", json={"model": model, "keep_alive": keep_alive}).raise_for_status()
+    except httpx.HTTPError as e:
+        raise OllamaError(f"cannot load {model}: {e}")
+
+
+def generate(prompt, model, system=None, options=None, format=None, stats=None):
+    """Blocking convenience wrapper: the whole response as one string."""
+    return "".join(stream_generate(prompt, model, system=system, options=options, format=format,
+                                   stats=stats)).strip()
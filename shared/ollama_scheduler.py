@@ -0,0 +1,210 @@
+"""Central request scheduler in front of one Ollama host shared by several apps and users.
+
+Run it next to Ollama and point every app at it instead of Ollama itself:
+
+    python -m shared.ollama_scheduler --port 11435 --slots 2
+    OLLAMA_HOST=http://inference-box:11435 streamlit run 2.Rag_Ollama/stream_example.py
+
+It speaks the Ollama HTTP API (requests are passed through unchanged and
+answers streamed back), and adds:
+
+- fair queuing (``shared/scheduler.py``): ``--slots`` generation requests run
+  at once (match Ollama's ``OLLAMA_NUM_PARALLEL``; Ollama batches those
+  sequences on its side), interactive requests go before batch work, and
+  users take turns. User and priority come from the ``X-LLM-User`` /
+  ``X-LLM-Priority`` headers that ``shared/llm_backends.py`` sends, else
+  the client address and "interactive";
+- admission control: when the queue is full the request is refused at once
+  with HTTP 429, the queue depth and a ``Retry-After`` estimate;
+- micro-batching of ``/api/embed``: concurrent embedding requests for the
+  same model are sent to Ollama as one request with all inputs, and the
+  vectors are split back per caller;
+- ``GET /scheduler/status``: queue depth per priority and user, shown in the
+  apps' sidebars.
+
+A client that disconnects (e.g. a cancelled inline suggestion) closes the
+upstream request as well, so Ollama stops generating for it.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from shared.http_server import read_request, respond, start_chunked, write_chunk
+from shared.ollama_client import OLLAMA_HOST, READ_TIMEOUT
+from shared.scheduler import PRIORITIES, FairScheduler, SchedulerOverloaded
+
+SCHEDULED_PATHS = {"/api/generate", "/api/chat", "/api/embed", "/api/embeddings"}
+# Collect concurrent embedding requests for this long before sending them as one
+EMBED_BATCH_WINDOW = 0.01
+EMBED_BATCH_MAX_INPUTS = 256
+# Request headers not passed on to Ollama
+HOP_HEADERS = {"host", "content-length", "connection", "transfer-encoding", "keep-alive"}
+
+
+class _EmbedBatch:
+    def __init__(self):
+        self.requests = []
+        self.inputs = 0
+        self.flushing = None
+
+
+class OllamaScheduler:
+    def __init__(self, upstream=OLLAMA_HOST, slots=2, max_queued=64, max_queued_per_user=16):
+        self.upstream = upstream.rstrip("/")
+        self.scheduler = FairScheduler(slots, max_queued, max_queued_per_user)
+        self.client = httpx.AsyncClient(base_url=self.upstream, timeout=httpx.Timeout(connect=5.0, read=READ_TIMEOUT,
+                                                                                      write=30.0, pool=None))
+        self._batches = {}
+        # Smoothed duration of a scheduled request, for the Retry-After estimate
+        self.service_seconds = 5.0
+        self.served = 0
+        self.refused = 0
+
+    # --- HTTP plumbing ---
+    async def handle(self, reader, writer):
+        """Serve requests on one connection (keep-alive) until the client closes it."""
+        peer = writer.get_extra_info("peername")
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                await self.route(method, path, headers, body, writer, peer[0] if peer else "unknown")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, headers, body, writer, peer):
+        if path == "/scheduler/status":
+            status = {**self.scheduler.status(), "served": self.served, "refused": self.refused,
+                      "service_seconds": round(self.service_seconds, 2)}
+            return await respond(writer, 200, json.dumps(status).encode())
+        if method != "POST" or path.split("?")[0] not in SCHEDULED_PATHS:
+            return await self.forward(method, path, headers, body, writer)
+
+        user = headers.get("x-llm-user") or peer
+        priority = headers.get("x-llm-priority", "interactive")
+        if priority not in PRIORITIES:
+            priority = "interactive"
+        if path == "/api/embed":
+            return await self.embed(user, priority, headers, body, writer)
+        try:
+            await self.scheduler.acquire(user, priority)
+        except SchedulerOverloaded as e:
+            return await self.refuse(e, writer)
+        start = time.monotonic()
+        try:
+            await self.forward(method, path, headers, body, writer)
+        finally:
+            self.scheduler.release()
+            self._served(time.monotonic() - start)
+
+    async def forward(self, method, path, headers, body, writer):
+        """Pass the request to Ollama and stream the answer back chunk by chunk."""
+        upstream_headers = {k: v for k, v in headers.items() if k not in HOP_HEADERS and not k.startswith("x-llm-")}
+        try:
+            async with self.client.stream(method, path, content=body, headers=upstream_headers) as response:
+                await start_chunked(writer, response.status_code, response.headers.get("content-type", "application/json"))
+                async for chunk in response.aiter_raw():
+                    await write_chunk(writer, chunk)
+                await write_chunk(writer, b"")
+        except httpx.HTTPError as e:
+            await respond(writer, 502, json.dumps({"error": f"Ollama unreachable: {e}"}).encode())
+
+    async def refuse(self, error, writer):
+        self.refused += 1
+        # Rough wait until a slot frees up for a request at the back of the queue
+        retry_after = max(1, round(error.waiting * self.service_seconds / max(1, self.scheduler.slots)))
+        body = json.dumps({"error": f"scheduler queue full: {error}", "waiting": error.waiting}).encode()
+        await respond(writer, 429, body, {"Retry-After": str(retry_after)})
+
+    def _served(self, seconds):
+        self.served += 1
+        self.service_seconds = 0.9 * self.service_seconds + 0.1 * seconds
+
+    # --- embedding micro-batches ---
+    async def embed(self, user, priority, headers, body, writer):
+        try:
+            request = json.loads(body)
+            inputs = request.get("input", [])
+        except ValueError:
+            return await respond(writer, 400, b'{"error": "invalid JSON"}')
+        single = isinstance(inputs, str)
+        inputs = [inputs] if single else list(inputs)
+        # Only requests that differ in nothing but their inputs can share a call
+        key = json.dumps({k: v for k, v in request.items() if k != "input"}, sort_keys=True)
+        batch = self._batches.get(key)
+        if batch is None or batch.inputs + len(inputs) > EMBED_BATCH_MAX_INPUTS:
+            batch = self._batches[key] = _EmbedBatch()
+            batch.flushing = asyncio.get_running_loop().create_task(self._flush(key, batch, request, user, priority))
+        future = asyncio.get_running_loop().create_future()
+        batch.requests.append((inputs, future))
+        batch.inputs += len(inputs)
+        try:
+            status, result = await future
+        except SchedulerOverloaded as e:
+            return await self.refuse(e, writer)
+        await respond(writer, status, json.dumps(result).encode())
+
+    async def _flush(self, key, batch, request, user, priority):
+        await asyncio.sleep(EMBED_BATCH_WINDOW)
+        if self._batches.get(key) is batch:
+            del self._batches[key]
+        try:
+            await self.scheduler.acquire(user, priority)
+        except SchedulerOverloaded as e:
+            for _, future in batch.requests:
+                future.set_exception(e)
+            return
+        start = time.monotonic()
+        try:
+            payload = {**request, "input": [text for inputs, _ in batch.requests for text in inputs]}
+            response = await self.client.post("/api/embed", json=payload)
+            result = response.json()
+            if response.status_code != 200:
+                for _, future in batch.requests:
+                    future.set_result((response.status_code, result))
+                return
+            vectors = result.get("embeddings", [])
+            offset = 0
+            for inputs, future in batch.requests:
+                own = vectors[offset:offset + len(inputs)]
+                offset += len(inputs)
+                future.set_result((200, {**result, "embeddings": own}))
+        except (httpx.HTTPError, ValueError) as e:
+            for _, future in batch.requests:
+                if not future.done():
+                    future.set_result((502, {"error": f"Ollama unreachable: {e}"}))
+        finally:
+            self.scheduler.release()
+            self._served(time.monotonic() - start)
+
+
+async def serve(host, port, **kwargs):
+    scheduler = OllamaScheduler(**kwargs)
+    server = await asyncio.start_server(scheduler.handle, host, port)
+    print(f"Scheduling requests for {scheduler.upstream} on http://{host}:{port} ({scheduler.scheduler.slots} slots)")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--upstream", default=OLLAMA_HOST, help="Ollama server to forward to")
+    parser.add_argument("--slots", type=int, default=2, help="Requests running at once (Ollama's OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--max-queued", type=int, default=64, help="Waiting requests before new ones are refused")
+    parser.add_argument("--max-queued-per-user", type=int, default=16)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, upstream=args.upstream, slots=args.slots, max_queued=args.max_queued,
+                      max_queued_per_user=args.max_queued_per_user))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""Local symbol and embedding index of a git working tree, for repository-aware prompts.
+
+The copilot only sees the snippet in its editor; this index lets it add the
+most relevant definitions from the rest of the repository to a prompt.
+
+- Python files are parsed with ``ast`` into symbols: top-level functions,
+  classes, methods (``Class.method``) and one ``imports`` block per file.
+- Each symbol's source is embedded with the shared embedder and stored, with
+  the file's mtime and size, in a SQLite file outside the working tree (so
+  auto-commits never pick it up).
+- ``update()`` only re-parses files whose mtime or size changed, plus the
+  files a ``git diff`` between the last indexed and the current ``HEAD``
+  touched (checkouts and pulls), and drops deleted files.
+- ``search()`` ranks symbols by embedding similarity plus identifier overlap
+  with the query and packs the best ones into a token budget.
+
+``get_repo_index()`` returns a process-wide index that a daemon thread keeps
+up to date every ``REPO_INDEX_INTERVAL`` seconds, off the UI thread. Without
+sentence-transformers the index still works, ranked by identifiers only.
+"""
+import ast
+import hashlib
+import os
+import re
+import sqlite3
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+from shared.metrics import stage
+
+INDEX_DIR = Path(os.getenv("REPO_INDEX_DIR", Path(__file__).resolve().parents[1] / ".copilot_index"))
+INTERVAL = float(os.getenv("REPO_INDEX_INTERVAL", "30"))
+CONTEXT_TOKENS = int(os.getenv("REPO_CONTEXT_TOKENS", "800"))
+MAX_FILE_BYTES = 512 * 1024
+MAX_SYMBOL_CHARS = 2000
+# Identifier overlap counts as much as this much cosine similarity per shared word
+NAME_WEIGHT = 0.15
+# With embeddings, weaker matches than this are left out of the prompt
+MIN_SCORE = 0.3
+MAX_RESULTS = 20
+SKIP_DIRS = {".git", ".venv", "venv", "node_modules", "__pycache__", "build", "dist", ".tox", ".mypy_cache"}
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4) if text else 0
+
+
+def words(text):
+    """Lower-case identifier parts: ``parseHTTPResponse_v2`` -> parse, http, response, v2."""
+    parts = re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+", text)
+    return {part.lower() for part in parts if len(part) > 1}
+
+
+def _git(root, *args):
+    try:
+        result = subprocess.run(["git", *args], cwd=root, capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def list_files(root):
+    """Python files of the working tree: tracked and untracked-but-not-ignored, else a directory walk."""
+    listed = _git(root, "ls-files", "--cached", "--others", "--exclude-standard", "-z")
+    if listed is not None:
+        return sorted({path for path in listed.split("\0") if path.endswith(".py")})
+    found = []
+    for folder, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith(".")]
+        found += [os.path.relpath(os.path.join(folder, f), root).replace(os.sep, "/") for f in files if f.endswith(".py")]
+    return sorted(found)
+
+
+def parse_symbols(source):
+    """``[{"kind", "name", "line", "text"}]`` for the functions, classes, methods and imports of a file."""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+    lines = source.splitlines()
+
+    def segment(node):
+        start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+        return "\n".join(lines[start - 1:node.end_lineno])[:MAX_SYMBOL_CHARS]
+
+    symbols, imports = [], []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports.append(segment(node))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            symbols.append({"kind": "function", "name": node.name, "line": node.lineno, "text": segment(node)})
+        elif isinstance(node, ast.ClassDef):
+            symbols.append({"kind": "class", "name": node.name, "line": node.lineno, "text": segment(node)})
+            for child in node.body:
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    symbols.append({"kind": "method", "name": f"{node.name}.{child.name}", "line": child.lineno,
+                                    "text": segment(child)})
+    if imports:
+        symbols.insert(0, {"kind": "imports", "name": "imports", "line": 1, "text": "\n".join(imports)[:MAX_SYMBOL_CHARS]})
+    return symbols
+
+
+class RepoIndex:
+    """Symbols of the working tree at ``root``; ``embedder`` (optional) has ``embed_documents`` / ``embed_query``."""
+
+    def __init__(self, root, embedder=None, path=None):
+        self.root = Path(root).resolve()
+        self.embedder = embedder
+        if path is None:
+            INDEX_DIR.mkdir(parents=True, exist_ok=True)
+            path = INDEX_DIR / f"{hashlib.sha256(str(self.root).encode()).hexdigest()[:16]}.sqlite"
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS symbols (id INTEGER PRIMARY KEY, path TEXT NOT NULL, kind TEXT NOT NULL,"
+            " name TEXT NOT NULL, line INTEGER NOT NULL, text TEXT NOT NULL, vector BLOB)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS symbols_path ON symbols (path)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.commit()
+        # Symbols (and their vectors as a matrix) kept in memory for search; rebuilt after an update
+        self._rows = None
+        self._matrix = None
+        self.last_update = None
+
+    def _meta(self, key, value=None):
+        if value is None:
+            row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # --- indexing ---
+    def update(self):
+        """Re-index changed files and drop deleted ones; returns ``{"changed", "removed", "files"}``."""
+        with stage("repo_index.update") as fields:
+            paths = list_files(self.root)
+            with self._lock:
+                known = {path: (mtime, size) for path, mtime, size in self._db.execute("SELECT * FROM files")}
+                last_head = self._meta("head")
+            head = (_git(self.root, "rev-parse", "HEAD") or "").strip()
+            # Files a checkout / pull rewrote, even if size and mtime happen to match
+            moved = set()
+            if last_head and head and head != last_head:
+                moved = set((_git(self.root, "diff", "--name-only", last_head, head) or "").split())
+
+            changed = {}
+            for path in paths:
+                try:
+                    info = (self.root / path).stat()
+                except OSError:
+                    continue
+                if info.st_size > MAX_FILE_BYTES:
+                    continue
+                if known.get(path) != (info.st_mtime_ns, info.st_size) or path in moved:
+                    changed[path] = (info.st_mtime_ns, info.st_size)
+            removed = set(known) - set(paths)
+            if self.embedder is not None:
+                # Files indexed before the embedder was available
+                with self._lock:
+                    rows = self._db.execute("SELECT DISTINCT path FROM symbols WHERE vector IS NULL").fetchall()
+                unembedded = {row[0] for row in rows}
+                for path in unembedded - set(changed) - removed:
+                    changed[path] = known[path]
+
+            parsed = []
+            for path in changed:
+                try:
+                    source = (self.root / path).read_text(encoding="utf-8", errors="replace")
+                except OSError:
+                    continue
+                parsed += [(path, symbol) for symbol in parse_symbols(source)]
+            vectors = [None] * len(parsed)
+            if parsed and self.embedder is not None:
+                # One batched call for every changed symbol
+                texts = [f"{path} {symbol['name']}\n{symbol['text']}" for path, symbol in parsed]
+                vectors = [_pack(v) for v in self.embedder.embed_documents(texts)]
+
+            with self._lock:
+                for path in set(changed) | removed:
+                    self._db.execute("DELETE FROM symbols WHERE path = ?", (path,))
+                    self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+                self._db.executemany(
+                    "INSERT INTO symbols (path, kind, name, line, text, vector) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(path, s["kind"], s["name"], s["line"], s["text"], vector)
+                     for (path, s), vector in zip(parsed, vectors)],
+                )
+                self._db.executemany("INSERT INTO files (path, mtime_ns, size) VALUES (?, ?, ?)",
+                                     [(path, mtime, size) for path, (mtime, size) in changed.items()])
+                if head:
+                    self._meta("head", head)
+                self._db.commit()
+                if changed or removed:
+                    self._rows = self._matrix = None
+            self.last_update = time.time()
+            fields.update(changed=len(changed), removed=len(removed), files=len(paths))
+            return {"changed": len(changed), "removed": len(removed), "files": len(paths)}
+
+    # --- search ---
+    def _load(self):
+        with self._lock:
+            if self._rows is None:
+                self._rows = self._db.execute("SELECT path, kind, name, line, text, vector FROM symbols").fetchall()
+                self._matrix = None
+                if self.embedder is not None and self._rows and all(row[5] for row in self._rows):
+                    import numpy as np
+
+                    matrix = np.stack([np.frombuffer(row[5], dtype=np.float32) for row in self._rows])
+                    self._matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-9)
+            return self._rows, self._matrix
+
+    def search(self, query, budget_tokens=CONTEXT_TOKENS, exclude=""):
+        """Best matching symbols for ``query`` that fit in ``budget_tokens``.
+
+        Definitions already present in ``exclude`` (e.g. the code being edited)
+        are skipped.
+        """
+        rows, matrix = self._load()
+        if not rows or not query.strip():
+            return []
+        with stage("repo_index.search", symbols=len(rows)):
+            query_words = words(query)
+            scores = [NAME_WEIGHT * len(query_words & words(row[2])) for row in rows]
+            if matrix is not None:
+                import numpy as np
+
+                vector = np.asarray(self.embedder.embed_query(query[-4000:]), dtype=np.float32)
+                similarities = matrix @ (vector / max(float(np.linalg.norm(vector)), 1e-9))
+                scores = [score + float(sim) for score, sim in zip(scores, similarities)]
+
+            min_score = MIN_SCORE if matrix is not None else 0.0
+            results, used = [], 0
+            for i in sorted(range(len(rows)), key=lambda i: -scores[i]):
+                path, kind, name, line, text, _ = rows[i]
+                if scores[i] <= min_score or len(results) >= MAX_RESULTS:
+                    break
+                short = re.escape(name.split(".")[-1])
+                if text in exclude or (kind != "imports" and re.search(rf"\b(def|class)\s+{short}\b", exclude)):
+                    continue
+                tokens = estimate_tokens(text)
+                if used + tokens > budget_tokens:
+                    continue
+                used += tokens
+                results.append({"path": path, "kind": kind, "name": name, "line": line, "text": text,
+                                "score": round(scores[i], 3)})
+            return results
+
+    def context(self, query, budget_tokens=CONTEXT_TOKENS, exclude=""):
+        """``search`` results as a prompt block, or "" when nothing relevant was found."""
+        results = self.search(query, budget_tokens, exclude)
+        return "\n\n".join(f"# {r['path']}:{r['line']} ({r['kind']} {r['name']})\n{r['text']}" for r in results)
+
+    def status(self):
+        with self._lock:
+            files = self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            symbols = self._db.execute("SELECT COUNT(*) FROM symbols").fetchone()[0]
+        return {"root": str(self.root), "files": files, "symbols": symbols, "last_update": self.last_update,
+                "embedded": self.embedder is not None}
+
+
+def _pack(vector):
+    import numpy as np
+
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+class RepoIndexer:
+    """Keeps a ``RepoIndex`` current from a daemon thread: every ``interval`` seconds or on ``refresh()``."""
+
+    def __init__(self, index, interval=INTERVAL, load_embedder=None):
+        self.index = index
+        self.interval = interval
+        self.load_embedder = load_embedder
+        self.error = None
+        self.running = False
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="repo-indexer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        embedder_error = None
+        if self.load_embedder is not None:
+            # Loading the model takes seconds; do it here, not in the first UI request
+            try:
+                self.index.embedder = self.load_embedder()
+            except Exception as e:
+                # e.g. the model download failed: index anyway and match by name only
+                embedder_error = f"embedding model unavailable: {e}"
+                self.error = embedder_error
+        while True:
+            self.running = True
+            try:
+                self.index.update()
+                self.error = embedder_error
+            except Exception as e:
+                # Keep serving the last good index; the next round tries again
+                self.error = str(e)
+            self.running = False
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def refresh(self):
+        """Re-scan now instead of at the next interval (e.g. after a commit)."""
+        self._wake.set()
+
+    def status(self):
+        return {**self.index.status(), "indexing": self.running, "error": self.error}
+
+
+def _default_embedder():
+    try:
+        from shared.embeddings import get_embedder
+        return get_embedder()
+    except ImportError:
+        return None
+
+
+def get_repo_index(root="."):
+    """Process-wide ``RepoIndexer`` for the repository at ``root``, started on first use.
+
+    The embedding model loads in the indexer thread, so the first call
+    returns immediately; ``.index.search()`` sees symbols once the first pass is done.
+    """
+    key = str(Path(root).resolve())
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = RepoIndexer(RepoIndex(root), load_embedder=_default_embedder)
+        return _indexes[key]
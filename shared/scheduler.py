@@ -0,0 +1,187 @@
+"""Fair scheduling and micro-batching for requests that share one inference host.
+
+``FairScheduler`` hands out a fixed number of slots (requests running at
+the same time) to waiting requests:
+
+- by priority first: ``interactive`` (completions, chat, RAG answers) before
+  ``batch`` (code quality analysis, CI runs); after ``STARVATION_LIMIT``
+  interactive grants in a row, one waiting batch request goes next so batch
+  work still progresses under constant interactive load;
+- then round-robin across users within a priority, so one user's burst of
+  requests does not delay everyone else by more than one request each;
+- with admission control: past ``max_queued`` waiting requests in total, or
+  ``max_queued_per_user`` for one user, new requests are refused right away
+  with ``SchedulerOverloaded`` (which says how deep the queue is) instead of
+  waiting into a timeout.
+
+``shared/llm_backends.py`` schedules every backend's requests with it in
+process, and ``shared/ollama_scheduler.py`` runs it as a central front door
+for an Ollama host that several apps and users share.
+
+``MicroBatcher`` groups calls that arrive while the previous batch is being
+processed into one call, e.g. concurrent embedding queries from several
+Streamlit sessions into one forward pass.
+"""
+import asyncio
+import queue
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+STARVATION_LIMIT = 8
+
+
+class SchedulerOverloaded(Exception):
+    """The queue is full; ``waiting`` requests were already queued."""
+
+    def __init__(self, message, waiting):
+        super().__init__(message)
+        self.waiting = waiting
+
+
+class FairScheduler:
+    """Slots granted by priority, then round-robin across users (asyncio; one event loop)."""
+
+    def __init__(self, slots, max_queued=64, max_queued_per_user=None):
+        self.slots = slots
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user or max_queued
+        self.active = 0
+        # priority level -> user -> waiting futures; user order is the round-robin order
+        self._queues = {level: OrderedDict() for level in sorted(set(PRIORITIES.values()))}
+        self._passed_over = 0
+
+    @property
+    def waiting(self):
+        return sum(len(q) for users in self._queues.values() for q in users.values())
+
+    def waiting_for(self, user):
+        return sum(len(users.get(user, ())) for users in self._queues.values())
+
+    async def acquire(self, user, priority="interactive"):
+        """Wait for a slot; ``release()`` it when done. Raises ``SchedulerOverloaded``."""
+        level = PRIORITIES.get(priority, 0)
+        waiting = self.waiting
+        if self.active < self.slots and not waiting:
+            self.active += 1
+            return
+        if waiting >= self.max_queued:
+            raise SchedulerOverloaded(f"{waiting} requests already waiting", waiting)
+        if self.waiting_for(user) >= self.max_queued_per_user:
+            raise SchedulerOverloaded(f"{self.waiting_for(user)} of your requests already waiting", waiting)
+        future = asyncio.get_running_loop().create_future()
+        self._queues[level].setdefault(user, deque()).append(future)
+        try:
+            await future
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # Granted just before the caller gave up: hand the slot on
+                self.release()
+            else:
+                self._forget(level, user, future)
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._grant()
+
+    def resize(self, slots):
+        """Change the number of slots; waiting requests get any new ones at once."""
+        self.slots = slots
+        self._grant()
+
+    def _grant(self):
+        while self.active < self.slots:
+            future = self._next()
+            if future is None:
+                return
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+
+    def _forget(self, level, user, future):
+        users = self._queues[level]
+        if future in users.get(user, ()):
+            users[user].remove(future)
+            if not users[user]:
+                del users[user]
+
+    def _next(self):
+        levels = [level for level, users in self._queues.items() if users]
+        if not levels:
+            return None
+        level = levels[0]
+        if len(levels) > 1:
+            self._passed_over += 1
+            if self._passed_over > STARVATION_LIMIT:
+                level, self._passed_over = levels[1], 0
+        else:
+            self._passed_over = 0
+        users = self._queues[level]
+        user, waiting = next(iter(users.items()))
+        future = waiting.popleft()
+        # This user goes to the back of the line for their next request
+        del users[user]
+        if waiting:
+            users[user] = waiting
+        return future
+
+    def status(self):
+        names = {level: name for name, level in PRIORITIES.items()}
+        by_user = {}
+        for users in self._queues.values():
+            for user, waiting in users.items():
+                by_user[user] = by_user.get(user, 0) + len(waiting)
+        return {
+            "active": self.active, "slots": self.slots, "waiting": self.waiting,
+            "by_priority": {names[level]: sum(len(q) for q in users.values()) for level, users in self._queues.items()},
+            "by_user": by_user,
+        }
+
+
+class MicroBatcher:
+    """Runs ``process(items) -> results`` on a worker thread, batching items submitted meanwhile.
+
+    A lone caller is processed immediately; callers arriving while a batch
+    runs are processed together in the next one (at most ``max_items``).
+    """
+
+    def __init__(self, process, max_items=64, name="micro-batcher"):
+        self.process = process
+        self.max_items = max_items
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, item):
+        """Process ``item`` (blocking) and return its result."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        future = Future()
+        self._queue.put((item, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_items:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                results = self.process([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,154 @@
+"""Saved sessions of the apps, in one indexed SQLite file per session folder.
+
+The apps used to write one pretty-printed JSON file per "Save session" click
+and list the folder on every Streamlit rerun. The store keeps:
+
+- a ``sessions`` table with the small fields needed to list them (name,
+  creation time, a one-line preview) and the full session as a JSON payload
+  that is only read when a session is opened;
+- a full-text index (SQLite FTS5) over the text fields (code, completions,
+  feedback ...), searched with prefix matching: ``calc tax`` finds
+  ``calculate_tax``. Without FTS5 the search falls back to ``LIKE``.
+
+Listing is paginated and ordered newest first. The JSON files already in the
+folder are imported once when the store is opened; they are left in place.
+"""
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+DB_NAME = "sessions.sqlite"
+PAGE_SIZE = 20
+PREVIEW_CHARS = 60
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def _preview(text):
+    """First non-empty line of ``text``, shortened."""
+    line = next((line.strip() for line in (text or "").splitlines() if line.strip()), "")
+    return line if len(line) <= PREVIEW_CHARS else line[:PREVIEW_CHARS - 1] + "…"
+
+
+def _match_query(query):
+    """User input as an FTS5 query: every word must match, as a prefix; quotes keep it syntax-safe."""
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in query.split())
+
+
+class SessionStore:
+    """Sessions of one app; ``text_fields`` are indexed for search, the first one gives the preview."""
+
+    def __init__(self, directory, text_fields):
+        self.directory = Path(directory)
+        self.text_fields = tuple(text_fields)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.directory / DB_NAME), check_same_thread=False, timeout=10)
+        # WAL lets several app processes read while another one saves
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, created REAL NOT NULL,"
+            " preview TEXT NOT NULL, payload TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_created ON sessions (created)")
+        try:
+            # The default tokenizer splits identifiers at "_": "tax" finds calculate_tax,
+            # and a quoted "calculate_tax" still matches as a phrase
+            self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS session_text USING fts5(body)")
+            self.full_text = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5
+            self.full_text = False
+        self._db.commit()
+        self.import_json()
+
+    # --- writing ---
+    def save(self, data, name=None, created=None):
+        """Store ``data`` (a JSON-serializable dict) and return its name."""
+        created = created or time.time()
+        name = name or f"session_{datetime.fromtimestamp(created).strftime('%Y%m%d_%H%M%S')}"
+        preview = _preview(data.get(self.text_fields[0], "")) if self.text_fields else ""
+        payload = json.dumps(data, ensure_ascii=False)
+        with self._lock:
+            # Two saves within a second would otherwise share a name
+            base, n = name, 1
+            while self._db.execute("SELECT 1 FROM sessions WHERE name = ?", (name,)).fetchone():
+                n += 1
+                name = f"{base}_{n}"
+            cursor = self._db.execute(
+                "INSERT INTO sessions (name, created, preview, payload) VALUES (?, ?, ?, ?)",
+                (name, created, preview, payload),
+            )
+            if self.full_text:
+                body = "\n".join(str(data.get(field) or "") for field in self.text_fields)
+                self._db.execute("INSERT INTO session_text (rowid, body) VALUES (?, ?)", (cursor.lastrowid, body))
+            self._db.commit()
+        return name
+
+    def import_json(self):
+        """Import the ``*.json`` session files of the folder that are not in the store yet."""
+        with self._lock:
+            known = {row[0] for row in self._db.execute("SELECT name FROM sessions")}
+        imported = 0
+        for path in sorted(self.directory.glob("*.json")):
+            if path.stem in known:
+                continue
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            if isinstance(data, dict):
+                self.save(data, name=path.stem, created=path.stat().st_mtime)
+                imported += 1
+        return imported
+
+    def delete(self, session_id):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            if self.full_text:
+                self._db.execute("DELETE FROM session_text WHERE rowid = ?", (session_id,))
+            self._db.commit()
+
+    # --- reading ---
+    def _where(self, query):
+        if not query.strip():
+            return "", ()
+        if self.full_text:
+            return "WHERE id IN (SELECT rowid FROM session_text WHERE session_text MATCH ?)", (_match_query(query),)
+        words = query.split()
+        return "WHERE " + " AND ".join(["payload LIKE ?"] * len(words)), tuple(f"%{word}%" for word in words)
+
+    def count(self, query=""):
+        where, params = self._where(query)
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM sessions {where}", params).fetchone()[0]
+
+    def list(self, query="", limit=PAGE_SIZE, offset=0):
+        """One page of sessions, newest first, without their payload: ``[{"id", "name", "created", "preview"}]``."""
+        where, params = self._where(query)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, name, created, preview FROM sessions {where} ORDER BY created DESC, id DESC LIMIT ? OFFSET ?",
+                params + (limit, offset),
+            ).fetchall()
+        return [{"id": id_, "name": name, "created": created, "preview": preview} for id_, name, created, preview in rows]
+
+    def load(self, session_id):
+        """The full session dict, or None if it was deleted."""
+        with self._lock:
+            row = self._db.execute("SELECT payload FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+def get_session_store(directory, text_fields):
+    """One store (and SQLite connection) per folder, shared by all sessions of the process."""
+    key = str(Path(directory).resolve())
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = SessionStore(directory, text_fields)
+        return _stores[key]
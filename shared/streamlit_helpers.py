@@ -0,0 +1,133 @@
+"""Small Streamlit building blocks shared by the apps."""
+import time
+
+# Redrawing on every token floods the websocket; ~20 redraws/s looks just as live.
+REDRAW_INTERVAL = 0.05
+
+
+def render_stream(tokens, placeholder, language=None):
+    """Show ``tokens`` in ``placeholder`` as they arrive and return the full text.
+
+    With ``language`` the text is shown as a code block, otherwise as markdown.
+    """
+    def draw(text):
+        if language:
+            placeholder.code(text, language=language)
+        else:
+            placeholder.markdown(text)
+
+    text = ""
+    last_draw = 0.0
+    for token in tokens:
+        text += token
+        now = time.monotonic()
+        if now - last_draw >= REDRAW_INTERVAL:
+            draw(text + "▌")
+            last_draw = now
+    draw(text)
+    return text.strip()
+
+
+def render_cache_stats(container):
+    """Hit/miss counters of the shared LLM response cache, e.g. in ``st.sidebar``."""
+    from shared.llm_cache import get_cache
+
+    stats = get_cache().summary()
+    container.markdown("**🗃️ LLM response cache**")
+    container.caption(
+        f"{stats['hits']} hits ({stats['memory_hits']} memory, {stats['disk_hits']} disk) · "
+        f"{stats['misses']} misses · hit rate {stats['hit_rate']:.0%} · "
+        f"{stats['entries']} entries, {stats['disk_bytes'] / 1024:.0f} KB"
+    )
+
+
+def render_queue_status(container):
+    """Requests running and waiting per backend, and at the shared Ollama scheduler when one is used."""
+    from shared.llm_backends import backend_status, scheduler_status
+
+    lines = [f"{b['backend']}: {b['active']}/{b['limit']} running, {b['waiting']} waiting"
+             for b in backend_status() if b["active"] or b["waiting"]]
+    shared = scheduler_status()
+    if shared:
+        lines.append(f"shared Ollama: {shared['active']}/{shared['slots']} running, {shared['waiting']} waiting "
+                     f"({shared['by_priority'].get('interactive', 0)} interactive, "
+                     f"{shared['by_priority'].get('batch', 0)} batch)")
+    if lines:
+        container.markdown("**🚦 LLM queue**")
+        for line in lines:
+            container.caption(line)
+
+
+def use_session_client(priority="interactive"):
+    """Tag this Streamlit session's LLM requests with its user and priority for fair queuing."""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    from shared.llm_backends import DEFAULT_USER, set_client
+
+    ctx = get_script_run_ctx()
+    # Several browser sessions of one app count as separate users
+    set_client(user=f"{DEFAULT_USER}/{ctx.session_id[:8]}" if ctx else DEFAULT_USER, priority=priority)
+
+
+def render_metrics(container):
+    """Per-stage latency and per-model token usage of this process (``shared/metrics.py``)."""
+    from shared.metrics import get_metrics
+
+    snapshot = get_metrics().snapshot()
+    container.markdown("**⏱️ Latency & tokens**")
+    if not snapshot["stages"] and not snapshot["llm"]:
+        container.caption("Nothing measured yet.")
+        return
+    for series in snapshot["llm"]:
+        container.caption(
+            f"{series['backend']} · {series['model']}: {series['requests']} requests, "
+            f"{series['prompt_tokens']} prompt / {series['completion_tokens']} completion tokens, "
+            f"first token p50 {series['ttft']['p50']:.2f}s, {series['tokens_per_second']['p50']:.1f} tok/s"
+        )
+    for error in snapshot["errors"]:
+        container.caption(f"⚠️ {error['backend']} · {error['model']}: {error['count']} × {error['kind']}")
+    if snapshot["stages"]:
+        expander = container.expander("Stage timings")
+        expander.table([
+            {"stage": name, "n": values["count"], "p50 ms": round(values["p50"] * 1000, 1),
+             "p95 ms": round(values["p95"] * 1000, 1), "last ms": round(values["last"] * 1000, 1)}
+            for name, values in snapshot["stages"].items()
+        ])
+
+
+def render_session_picker(container, store, label="📂 Load previous session:", key="session"):
+    """Search box, page selector and session list for a ``SessionStore``; returns the chosen id or None.
+
+    Only the listed page is read from the store, without the sessions' payloads.
+    """
+    from shared.session_store import PAGE_SIZE
+
+    query = container.text_input("🔎 Search sessions:", key=f"{key}_search",
+                                 help="Words in the code or the model's answer, e.g. `calc tax`")
+    total = store.count(query)
+    pages = max(1, -(-total // PAGE_SIZE))
+    page = container.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1) if pages > 1 else 1
+    sessions = {s["id"]: s for s in store.list(query, limit=PAGE_SIZE, offset=(page - 1) * PAGE_SIZE)}
+    choice = container.selectbox(
+        label, [None] + list(sessions), key=f"{key}_choice",
+        format_func=lambda id_: "None" if id_ is None else f"{sessions[id_]['name']} · {sessions[id_]['preview']}",
+    )
+    container.caption(f"{total} matching sessions" if query.strip() else f"{total} saved sessions")
+    return choice
+
+
+def hide_torch_classes():
+    """Keep Streamlit's file watcher from tripping over ``torch.classes`` once torch is loaded.
+
+    The watcher inspects every imported module's ``__path__``; torch's
+    ``torch.classes`` raises on that and an exception is logged on each
+    rerun (the app still works). Same effect as ``STREAMLIT_WATCH_DISABLE=true``
+    for torch only. A no-op until something has imported torch, so torch is
+    never imported just for this.
+    """
+    import sys
+    import types
+
+    # torch may still be importing on the embedder's warm-up thread
+    classes = getattr(sys.modules.get("torch"), "classes", None)
+    if classes is not None:
+        classes.__path__ = types.SimpleNamespace(_path=[])